@@ -0,0 +1,327 @@
+"""Measures the card generation from end to end on a synthetic video.
+
+A test video and its captions are generated locally with ffmpeg, and the
+parsing, the optimization and the media extraction are timed on them. The
+results are written as JSON with the commit they were measured on, and can
+be compared with the results of another commit.
+
+Run from the repository root with `python -m benchmarks.pipeline`, or with
+`invoke benchmark`.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from typing import Dict, List, Optional
+
+from anki.collection import Collection
+
+from ytanki import ffmpeg_runner
+from ytanki.card_generator import CardGenerator
+from ytanki.ffmpeg import Ffmpeg
+from ytanki.media_pool import default_parallelism
+from ytanki.models import (
+    AudioMode,
+    FieldsConfiguration,
+    GenerateVideoTask,
+    SentenceBounds,
+)
+from ytanki.sources import LocalSource
+from ytanki.subtitles_extractor import YouTubeSubtitlesExtractor
+from ytanki.utils import format_timestamp, get_ffmpeg
+
+RESULTS = os.path.join(os.path.dirname(__file__), "results")
+WORDS = "so today we are going to talk about how the brain learns".split()
+# Every caption ends a sentence once in this many cues.
+SENTENCE_LENGTH = 3
+
+
+def make_video(path: str, duration: int, cue_length: int):
+    """A test pattern with a tone that stops for the last fifth of every cue."""
+    period = cue_length / 1000
+    tone = f"0.3*sin(2*PI*220*t)*lt(mod(t,{period}),{period * 0.8})"
+    # Encoders built into every ffmpeg, including the one shipped on Windows.
+    command = [
+        get_ffmpeg(),
+        "-y",
+        "-loglevel",
+        "error",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc2=size=640x360:rate=25:duration={duration}",
+        "-f",
+        "lavfi",
+        "-i",
+        # The quotes keep the commas of the expression out of the filter graph.
+        f"aevalsrc='{tone}':sample_rate=44100:duration={duration}",
+        "-c:v",
+        "mpeg4",
+        "-q:v",
+        "5",
+        "-g",
+        "50",
+        "-c:a",
+        "aac",
+        "-b:a",
+        "96k",
+        path,
+    ]
+    ffmpeg_runner.run(command, [path])
+
+
+def make_captions(path: str, duration: int, cue_length: int):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("WEBVTT\n\n")
+        for i, start in enumerate(range(0, duration * 1000, cue_length)):
+            end = min(start + cue_length, duration * 1000)
+            words = " ".join(WORDS[(i + j) % len(WORDS)] for j in range(7))
+            end_of_sentence = "." if i % SENTENCE_LENGTH == SENTENCE_LENGTH - 1 else ""
+            f.write(
+                f"{format_timestamp(start)} --> {format_timestamp(end)}\n"
+                f"{words} {i}{end_of_sentence}\n\n"
+            )
+
+
+def fixtures(work_dir: str, duration: int, cue_length: int):
+    """The video and the captions, generated once per duration and cue length."""
+    os.makedirs(work_dir, exist_ok=True)
+    name = os.path.join(work_dir, f"synthetic-{duration}s-{cue_length}ms")
+    video_path, captions_path = name + ".mp4", name + ".en.vtt"
+    if not os.path.exists(video_path):
+        print(f"Generating a {duration} second video in {video_path}")
+        make_video(video_path, duration, cue_length)
+    if not os.path.exists(captions_path):
+        make_captions(captions_path, duration, cue_length)
+    return video_path, captions_path
+
+
+def best_time(function, repeat: int) -> float:
+    return min(timeit.repeat(function, repeat=repeat, number=1))
+
+
+def max_rss() -> Optional[int]:
+    """Peak resident memory of this process in bytes, where it is known."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Forked children count the memory of this process until they run
+    # ffmpeg, so their peak is not the one of ffmpeg and is left out.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def environment() -> Dict:
+    def output(command: List[str]) -> Optional[str]:
+        try:
+            return subprocess.run(
+                command, capture_output=True, text=True, check=True
+            ).stdout
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    commit = output(["git", "rev-parse", "--short", "HEAD"])
+    changes = output(["git", "status", "--porcelain", "--untracked-files=no"])
+    ffmpeg_version = output([get_ffmpeg(), "-version"])
+    return {
+        "commit": commit.strip() if commit else None,
+        "dirty": bool(changes),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "ffmpeg": ffmpeg_version.splitlines()[0] if ffmpeg_version else None,
+    }
+
+
+def make_task(args, video_path: str, collection: Collection) -> GenerateVideoTask:
+    return GenerateVideoTask(
+        video_path,
+        "en",
+        False,
+        False,
+        args.dimensions,
+        0,
+        collection,
+        FieldsConfiguration("Basic", "Front", "Back", "Picture"),
+        parallelism=args.parallelism,
+        single_pass_audio=args.single_pass_audio,
+        batch_pictures=args.batch_pictures,
+        refine_boundaries=args.refine_boundaries,
+        audio_mode=AudioMode(args.audio_mode),
+        resumable=False,
+    )
+
+
+def best_time_on_ranges(optimize, captions_path: str, repeat: int) -> float:
+    # The ranges are parsed again for every run, since optimizing mutates them.
+    times = []
+    for _ in range(repeat):
+        subtitles = list(YouTubeSubtitlesExtractor.iter_subtitles(captions_path))
+        start = time.perf_counter()
+        optimize(subtitles)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def measure_parsing(captions_path: str, repeat: int) -> Dict:
+    ranges = YouTubeSubtitlesExtractor.parse_subtitles(captions_path)
+    return {
+        "ranges": len(ranges),
+        "parse_seconds": best_time(
+            lambda: YouTubeSubtitlesExtractor.parse_subtitles(captions_path), repeat
+        ),
+        "optimize_seconds": best_time_on_ranges(
+            YouTubeSubtitlesExtractor.optimize_subtitles, captions_path, repeat
+        ),
+        "sentences_seconds": best_time_on_ranges(
+            lambda subtitles: list(
+                YouTubeSubtitlesExtractor.iter_sentences(subtitles, SentenceBounds())
+            ),
+            captions_path,
+            repeat,
+        ),
+    }
+
+
+def measure_clips(task: GenerateVideoTask, result, sample: int) -> Dict:
+    """Time of the ffmpeg processes of single clips, one after the other."""
+    durations = []
+    for subtitle in list(result.subtitles)[:sample]:
+        job = Ffmpeg(
+            subtitle,
+            result.video_path,
+            result.video_title,
+            result.video_id,
+            task.dimensions,
+        )
+        runs = job.generate_media(task.dimensions)
+        durations.append(sum(run.duration for run in runs))
+        for path in (job.audio_path, job.picture_path):
+            os.remove(path)
+    return {
+        "clip_seconds_median": statistics.median(durations),
+        "clip_seconds_mean": statistics.mean(durations),
+    }
+
+
+def measure_generation(task: GenerateVideoTask, video_path: str) -> Dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = LocalSource(video_path).fetch(task)
+    source_seconds = time.perf_counter() - start
+
+    cards = []
+    start = time.perf_counter()
+    count = CardGenerator(task, result).run(lambda percent: None, cards.extend)
+    extraction_seconds = time.perf_counter() - start
+    _, peak_python = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    for card in cards:
+        for path in (card.audio_path, card.picture_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+    return {
+        "source_seconds": source_seconds,
+        "extraction_seconds": extraction_seconds,
+        "cards": count,
+        "cards_per_second": count / extraction_seconds,
+        "peak_python_bytes": peak_python,
+    }
+
+
+def compare(report: Dict, previous: Dict):
+    print(f"Compared with {previous['environment']['commit']}:")
+    if previous["parameters"] != report["parameters"]:
+        print("  (measured with other parameters)")
+    for name, value in report["results"].items():
+        before = previous["results"].get(name)
+        if isinstance(value, (int, float)) and before:
+            print(f"  {name}: {before:.6g} -> {value:.6g} ({value / before:.2f}x)")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.pipeline")
+    parser.add_argument("--duration", type=int, default=300, help="seconds of video")
+    parser.add_argument(
+        "--cue-length", type=int, default=2000, help="milliseconds per caption"
+    )
+    parser.add_argument("-j", "--parallelism", type=int, default=default_parallelism())
+    parser.add_argument("--dimensions", default="240x160")
+    parser.add_argument(
+        "--audio-mode",
+        choices=[mode.value for mode in AudioMode],
+        default=AudioMode.MP3.value,
+    )
+    parser.add_argument("--single-pass-audio", action="store_true")
+    parser.add_argument("--batch-pictures", action="store_true")
+    parser.add_argument("--refine-boundaries", action="store_true")
+    parser.add_argument("--sample", type=int, default=10, help="clips timed one by one")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--work-dir",
+        default=os.path.join(tempfile.gettempdir(), "yt-to-anki-benchmark"),
+        help="where the synthetic videos are kept between runs",
+    )
+    parser.add_argument("-o", "--output", help=f"result file, in {RESULTS} by default")
+    parser.add_argument("--compare", help="result file of an earlier run")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    video_path, captions_path = fixtures(args.work_dir, args.duration, args.cue_length)
+
+    collection_dir = tempfile.mkdtemp(prefix="yt-to-anki_")
+    collection = Collection(os.path.join(collection_dir, "collection.anki2"))
+    try:
+        task = make_task(args, video_path, collection)
+        results = measure_parsing(captions_path, args.repeat)
+        results.update(
+            measure_clips(task, LocalSource(video_path).fetch(task), args.sample)
+        )
+        results.update(measure_generation(task, video_path))
+    finally:
+        collection.close()
+
+    results["peak_rss_bytes"] = max_rss()
+    env = environment()
+    report = {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": env,
+        "parameters": {
+            name: value
+            for name, value in vars(args).items()
+            if name not in ("work_dir", "output", "compare")
+        },
+        "results": results,
+    }
+
+    output = args.output or os.path.join(
+        RESULTS, f"{env['commit'] or 'unknown'}{'-dirty' if env['dirty'] else ''}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    for name, value in results.items():
+        print(
+            f"{name}: {value:.6g}" if isinstance(value, float) else f"{name}: {value}"
+        )
+    print(f"Results written to {output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Compares the memory used by the subtitles of a long video when they are
+kept as SubtitleRange objects, with datetimes as before, and in a
+SubtitleStore.
+
+Run from the repository root with `python -m benchmarks.subtitle_memory`.
+"""
+import datetime
+import gc
+import tracemalloc
+
+from ytanki.models import SubtitleRange
+from ytanki.subtitle_store import SubtitleStore
+
+# About 10 hours of automatic captions.
+RANGES = 20_000
+WORDS = "so today we are going to talk about how the".split()
+
+
+def texts():
+    for i in range(RANGES):
+        words = " ".join(WORDS[(i + j) % len(WORDS)] for j in range(6))
+        yield f"{words} {i}"
+
+
+def datetime_ranges():
+    origin = datetime.datetime(1900, 1, 1)
+    return [
+        SubtitleRange(
+            text,
+            origin + datetime.timedelta(milliseconds=i * 2010),
+            origin + datetime.timedelta(milliseconds=i * 2010 + 2000),
+        )
+        for i, text in enumerate(texts())
+    ]
+
+
+def millisecond_ranges():
+    return [
+        SubtitleRange(text, i * 2010, i * 2010 + 2000) for i, text in enumerate(texts())
+    ]
+
+
+def store():
+    return SubtitleStore.from_ranges(
+        SubtitleRange(text, i * 2010, i * 2010 + 2000) for i, text in enumerate(texts())
+    )
+
+
+def measure(build) -> int:
+    gc.collect()
+    tracemalloc.start()
+    subtitles = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del subtitles
+    return size
+
+
+def main():
+    print(f"{RANGES} subtitle ranges")
+    for name, build in (
+        ("list of SubtitleRange (datetime)", datetime_ranges),
+        ("list of SubtitleRange (ms)", millisecond_ranges),
+        ("SubtitleStore", store),
+    ):
+        size = measure(build)
+        print(f"{name:34} {size / 1024 ** 2:6.2f} MiB  {size / RANGES:5.0f} B/range")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Times the parsing of subtitle timestamps against the strptime based one.
+
+Run from the repository root with `python -m benchmarks.timestamps`.
+"""
+import glob
+import os
+import timeit
+from datetime import datetime, timedelta
+from typing import List
+
+from ytanki.subtitles_extractor import YouTubeSubtitlesExtractor
+from ytanki.utils import get_timestamp
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "..", "tests", "subtitle_extractor")
+
+
+def fixture_files() -> List[str]:
+    return sorted(glob.glob(os.path.join(FIXTURES, "**", "*.vtt"), recursive=True))
+
+
+def fixture_timestamps() -> List[str]:
+    timestamps = []
+    for path in fixture_files():
+        with open(path, encoding="utf-8-sig") as f:
+            for line in f:
+                timing = YouTubeSubtitlesExtractor.TIMING_EXPRESSION.match(line)
+                if timing is not None:
+                    timestamps.extend(timing.groups())
+    # The previous parser got the hours from webvtt, strptime requires them.
+    return [time if time.count(":") == 2 else "00:" + time for time in timestamps]
+
+
+def strptime_timestamp(time: str) -> datetime:
+    return datetime.strptime(time, "%H:%M:%S.%f")
+
+
+def measure(function, timestamps: List[str], repeat: int = 5, number: int = 200):
+    best = min(
+        timeit.repeat(
+            lambda: [function(time) for time in timestamps],
+            repeat=repeat,
+            number=number,
+        )
+    )
+    return best / number / len(timestamps)
+
+
+def main():
+    timestamps = fixture_timestamps()
+    assert [get_timestamp(time) for time in timestamps] == [
+        (strptime_timestamp(time) - datetime(1900, 1, 1)) // timedelta(milliseconds=1)
+        for time in timestamps
+    ]
+
+    before = measure(strptime_timestamp, timestamps)
+    after = measure(get_timestamp, timestamps)
+    print(f"{len(timestamps)} timestamps from {len(fixture_files())} fixtures")
+    print(f"strptime:      {before * 1e6:.2f} µs per timestamp")
+    print(f"get_timestamp: {after * 1e6:.2f} µs per timestamp")
+    print(f"speedup:       {before / after:.1f}x")
+
+    parse = min(
+        timeit.repeat(
+            lambda: [
+                YouTubeSubtitlesExtractor.parse_subtitles(path)
+                for path in fixture_files()
+            ],
+            repeat=5,
+            number=50,
+        )
+    )
+    print(f"parsing the fixtures: {parse / 50 * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -36,10 +36,19 @@ def test(context):
     )
 
 
+@task
+def benchmark(context, duration=300, compare=""):
+    """Times the card generation on a synthetic video, see benchmarks/pipeline.py."""
+    options = f"--duration {duration}"
+    if compare:
+        options += f" --compare {compare}"
+    run_invoke_cmd(context, f"poetry run python -m benchmarks.pipeline {options}")
+
+
 @task
 def format_black(context):
     command = """
-        poetry run black *.py ytanki/ tests/ --color 2>&1
+        poetry run black *.py ytanki/ tests/ benchmarks/ --color 2>&1
     """
     result = run_invoke_cmd(context, command)
 
@@ -0,0 +1,43 @@
+from typing import Any, Dict
+from unittest.mock import MagicMock
+
+import pytest
+
+from ytanki.models import FieldsConfiguration, GenerateVideoTask
+
+
+@pytest.fixture
+def make_task(tmp_path):
+    """Makes tasks that keep their files under `tmp_path`.
+
+    Keyword arguments override the fields of the task.
+    """
+
+    def make(
+        url="https://www.youtube.com/watch?v=H14bBuluwB8",
+        audio_field="Back",
+        picture_field=None,
+        **overrides,
+    ) -> GenerateVideoTask:
+        collection = MagicMock()
+        collection.media.dir.return_value = str(tmp_path)
+        options: Dict[str, Any] = dict(
+            youtube_video_url=url,
+            language="en",
+            fallback=False,
+            optimize_by_punctuation=False,
+            dimensions="240x160",
+            limit=0,
+            collection=collection,
+            fields=FieldsConfiguration("Basic", "Front", audio_field, picture_field),
+            parallelism=1,
+            video_path=str(tmp_path / "vid"),
+            subtitle_path=str(tmp_path / "subs"),
+            cache_path=str(tmp_path / "cache"),
+            manifest_path=str(tmp_path / "manifests"),
+            checkpoint_path=str(tmp_path / "checkpoints"),
+        )
+        options.update(overrides)
+        return GenerateVideoTask(**options)
+
+    return make
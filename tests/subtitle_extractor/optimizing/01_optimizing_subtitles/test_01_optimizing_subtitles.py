@@ -1,20 +1,21 @@
 import os
-from datetime import datetime
-from typing import List
+from datetime import datetime, timedelta
 
-from ytanki.subtitles_extractor import SubtitleRange, YouTubeSubtitlesExtractor
+from ytanki.subtitle_store import SubtitleStore
+from ytanki.subtitles_extractor import YouTubeSubtitlesExtractor
 
 path_to_this_test_folder = os.path.abspath(os.path.dirname(__file__))
 path_to_the_subtitles_file = os.path.join(path_to_this_test_folder, "subtitles.en.vtt")
 
 
 def time_from(string):
-    return datetime.strptime(string, "%H:%M:%S.%f")
+    time = datetime.strptime(string, "%H:%M:%S.%f")
+    return (time - datetime(1900, 1, 1)) // timedelta(milliseconds=1)
 
 
 def test_01_parsing_subtitles():
     # https://www.youtube.com/watch?v=GfF2e0vyGM4
-    subtitles: List[SubtitleRange] = YouTubeSubtitlesExtractor.parse_subtitles(
+    subtitles: SubtitleStore = YouTubeSubtitlesExtractor.parse_subtitles(
         path_to_the_subtitles_file
     )
     assert subtitles[0].text == "What if doing well in school and in life"
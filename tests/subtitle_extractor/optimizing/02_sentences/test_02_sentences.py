@@ -0,0 +1,70 @@
+import os
+
+from ytanki.models import SentenceBounds, SubtitleRange
+from ytanki.subtitles_extractor import YouTubeSubtitlesExtractor
+
+path_to_the_subtitles_file = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "01_optimizing_subtitles",
+    "subtitles.en.vtt",
+)
+
+
+def ranges(*cues):
+    return [
+        SubtitleRange(text, i * 1000, (i + 1) * 1000) for i, text in enumerate(cues)
+    ]
+
+
+def test_02_sentences_do_not_mutate_the_input():
+    subtitles = YouTubeSubtitlesExtractor.parse_subtitles(path_to_the_subtitles_file)
+    texts = [subtitle.text for subtitle in subtitles]
+
+    sentences = list(
+        YouTubeSubtitlesExtractor.iter_sentences(subtitles, SentenceBounds())
+    )
+
+    assert [subtitle.text for subtitle in subtitles] == texts
+    assert sentences[0].text == (
+        "What if doing well in school and in life depends on much more "
+        "than your ability to learn quickly and easily?"
+    )
+    assert all(len(sentence.text) <= 160 for sentence in sentences)
+
+
+def test_02_ranges_without_punctuation_are_bounded():
+    bounds = SentenceBounds(max_duration=3000)
+    sentences = YouTubeSubtitlesExtractor.iter_sentences(
+        ranges(*[f"word {i}" for i in range(7)]), bounds
+    )
+
+    assert [(s.time_start, s.time_end) for s in sentences] == [
+        (0, 3000),
+        (3000, 6000),
+        (6000, 7000),
+    ]
+
+
+def test_02_sentence_ends_of_other_scripts():
+    bounds = SentenceBounds(min_duration=0, min_characters=0)
+    sentences = YouTubeSubtitlesExtractor.iter_sentences(
+        ranges("こんにちは", "元気ですか？", "Wow!", "«Oui.»", "क्या हाल है।"),
+        bounds,
+    )
+
+    assert [s.text for s in sentences] == [
+        "こんにちは元気ですか？",
+        "Wow!",
+        "«Oui.»",
+        "क्या हाल है।",
+    ]
+
+
+def test_02_short_sentences_are_merged():
+    bounds = SentenceBounds(min_duration=1500, min_characters=0)
+    sentences = YouTubeSubtitlesExtractor.iter_sentences(
+        ranges("Yes.", "No.", "Maybe."), bounds
+    )
+
+    assert [s.text for s in sentences] == ["Yes. No.", "Maybe."]
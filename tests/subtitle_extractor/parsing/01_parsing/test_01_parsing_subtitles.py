@@ -1,7 +1,7 @@
 import os
-from typing import List
 
-from ytanki.subtitles_extractor import SubtitleRange, YouTubeSubtitlesExtractor
+from ytanki.subtitle_store import SubtitleStore
+from ytanki.subtitles_extractor import YouTubeSubtitlesExtractor
 
 path_to_this_test_folder = os.path.abspath(os.path.dirname(__file__))
 path_to_the_subtitles_file = os.path.join(path_to_this_test_folder, "subtitles.en.vtt")
@@ -9,7 +9,7 @@ path_to_the_subtitles_file = os.path.join(path_to_this_test_folder, "subtitles.e
 
 def test_01_parsing_subtitles():
     # https://www.youtube.com/watch?v=GfF2e0vyGM4
-    subtitles: List[SubtitleRange] = YouTubeSubtitlesExtractor.parse_subtitles(
+    subtitles: SubtitleStore = YouTubeSubtitlesExtractor.parse_subtitles(
         path_to_the_subtitles_file
     )
     assert subtitles[0].text == "What if doing well in school and in life"
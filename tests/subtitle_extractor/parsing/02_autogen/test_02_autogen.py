@@ -1,14 +1,14 @@
 import os
-from typing import List
 
-from ytanki.subtitles_extractor import SubtitleRange, YouTubeSubtitlesExtractor
+from ytanki.subtitle_store import SubtitleStore
+from ytanki.subtitles_extractor import YouTubeSubtitlesExtractor
 
 path_to_this_test_folder = os.path.abspath(os.path.dirname(__file__))
 path_to_the_subtitles_file = os.path.join(path_to_this_test_folder, "subtitles.en.vtt")
 
 
 def test_02_autogen_removes_structure():
-    subtitles: List[SubtitleRange] = YouTubeSubtitlesExtractor.parse_subtitles(
+    subtitles: SubtitleStore = YouTubeSubtitlesExtractor.parse_subtitles(
         path_to_the_subtitles_file
     )
     assert "<c>" not in subtitles[0].text
@@ -16,8 +16,36 @@ def test_02_autogen_removes_structure():
 
 
 def test_02_avoid_duplicates():
-    subtitles: List[SubtitleRange] = YouTubeSubtitlesExtractor.parse_subtitles(
+    subtitles: SubtitleStore = YouTubeSubtitlesExtractor.parse_subtitles(
         path_to_the_subtitles_file
     )
     texts = [sub.text for sub in subtitles]
     assert len(set(texts)) == len(texts)
+
+
+def test_02_rolling_cues_give_one_range_per_line():
+    subtitles: SubtitleStore = YouTubeSubtitlesExtractor.parse_subtitles(
+        path_to_the_subtitles_file, automatic=True
+    )
+    assert [(sub.text, sub.time_start, sub.time_end) for sub in subtitles] == [
+        ("hallo ich bin david gründer der lingus", 0, 2869),
+        ("organic und erfinder der bilingue", 2879, 5390),
+    ]
+
+
+def test_02_repeated_phrases_are_kept():
+    cues = [
+        (0, 1000, [" ", "no"]),
+        (1000, 1010, ["no", " "]),
+        (1010, 2000, ["no", "no"]),
+        (2000, 2010, ["no", " "]),
+        (5000, 6000, ["yes"]),
+        (9000, 9500, ["no"]),
+    ]
+    subtitles = YouTubeSubtitlesExtractor.iter_automatic_captions(cues)
+    assert [(sub.text, sub.time_start) for sub in subtitles] == [
+        ("no", 0),
+        ("no", 1010),
+        ("yes", 5000),
+        ("no", 9000),
+    ]
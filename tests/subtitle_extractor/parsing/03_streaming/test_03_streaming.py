@@ -0,0 +1,49 @@
+import os
+from datetime import datetime, timedelta
+
+from ytanki.subtitles_extractor import YouTubeSubtitlesExtractor
+from ytanki.utils import with_limit
+
+path_to_this_test_folder = os.path.abspath(os.path.dirname(__file__))
+path_to_the_subtitles_file = os.path.join(path_to_this_test_folder, "subtitles.en.vtt")
+
+
+def time_from(string):
+    time = datetime.strptime(string, "%H:%M:%S.%f")
+    return (time - datetime(1900, 1, 1)) // timedelta(milliseconds=1)
+
+
+def test_03_parsing_cues():
+    subtitles = list(
+        YouTubeSubtitlesExtractor.iter_subtitles(path_to_the_subtitles_file)
+    )
+
+    assert [sub.text for sub in subtitles] == [
+        "Good morning.",
+        "How are",
+        "you?",
+        "Fine.",
+    ]
+    assert subtitles[0].time_start == time_from("00:00:01.000")
+    assert subtitles[1].time_end == time_from("00:00:05.000")
+
+
+def test_03_duplicates_are_only_looked_for_in_recent_ranges(monkeypatch):
+    monkeypatch.setattr(YouTubeSubtitlesExtractor, "duplicate_window", 2)
+
+    subtitles = list(
+        YouTubeSubtitlesExtractor.iter_subtitles(path_to_the_subtitles_file)
+    )
+
+    assert subtitles[-1].text == "Good morning."
+    assert subtitles[-1].time_start == time_from("01:00:00.000")
+
+
+def test_03_ranges_are_produced_lazily():
+    subtitles = YouTubeSubtitlesExtractor.iter_subtitles(path_to_the_subtitles_file)
+    optimized = YouTubeSubtitlesExtractor.iter_optimized_subtitles(subtitles)
+
+    first, second = with_limit(optimized, 2)
+    assert first.text == "Good morning."
+    assert second.text == "How are you?"
+    assert next(subtitles).text == "Fine."
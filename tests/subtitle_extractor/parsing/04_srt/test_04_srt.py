@@ -0,0 +1,25 @@
+import os
+from datetime import datetime, timedelta
+
+from ytanki.subtitles_extractor import YouTubeSubtitlesExtractor
+
+path_to_this_test_folder = os.path.abspath(os.path.dirname(__file__))
+path_to_the_subtitles_file = os.path.join(path_to_this_test_folder, "subtitles.en.srt")
+
+
+def time_from(string):
+    time = datetime.strptime(string, "%H:%M:%S.%f")
+    return (time - datetime(1900, 1, 1)) // timedelta(milliseconds=1)
+
+
+def test_04_parsing_subrip():
+    subtitles = YouTubeSubtitlesExtractor.parse_subtitles(path_to_the_subtitles_file)
+
+    assert [sub.text for sub in subtitles] == [
+        "Good morning.",
+        "How are you?",
+        "Fine.",
+    ]
+    assert subtitles[0].time_start == time_from("00:00:01.000")
+    assert subtitles[1].time_end == time_from("00:00:04.000")
+    assert subtitles[2].time_end == time_from("01:00:01.250")
@@ -0,0 +1,247 @@
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+from anki.collection import Collection
+
+from ytanki.batch import BatchRunner, JobQueue
+from ytanki.card_generator import CardGenerator
+from ytanki.deck_writer import DeckWriter
+from ytanki.errors import NoSubtitlesException
+from ytanki.models import (
+    AudioMode,
+    FieldsConfiguration,
+    JobStatus,
+    SubtitleRange,
+    YouTubeDownloadResult,
+)
+from ytanki.subtitle_store import SubtitleStore
+
+URLS = [f"https://www.youtube.com/watch?v=video{i}" for i in range(6)]
+
+
+class FakeRunner(BatchRunner):
+    """Runner whose downloads and generation only sleep, counting overlaps."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.counter_lock = threading.Lock()
+        self.running = {"download": 0, "generate": 0}
+        self.peak = {"download": 0, "generate": 0}
+        self.downloaded = 0
+
+    def track(self, stage, delta):
+        with self.counter_lock:
+            self.running[stage] += delta
+            self.peak[stage] = max(self.peak[stage], self.running[stage])
+
+    def download(self, task):
+        self.track("download", 1)
+        try:
+            time.sleep(0.02)
+            if task.youtube_video_url.endswith("video3"):
+                raise NoSubtitlesException
+            with self.counter_lock:
+                self.downloaded += 1
+            return YouTubeDownloadResult(
+                "title", SubtitleStore(), "", "", task.youtube_video_url[-6:]
+            )
+        finally:
+            self.track("download", -1)
+
+    def generate(self, task, result):
+        self.track("generate", 1)
+        try:
+            time.sleep(0.05)
+            self.on_cards(task, result, None, [])
+            return 0
+        finally:
+            self.track("generate", -1)
+
+
+def test_interrupted_jobs_are_resumed(tmp_path, make_task):
+    queue = JobQueue(str(tmp_path / "batch.json"))
+    queue.add(URLS[:3], lambda url: make_task(url))
+    queue.update(queue.jobs[0], JobStatus.DONE)
+    queue.update(queue.jobs[1], JobStatus.GENERATING)
+    queue.update(queue.jobs[2], JobStatus.FAILED, "no subtitles")
+
+    reloaded = JobQueue(str(tmp_path / "batch.json"))
+    assert [job.status for job in reloaded.jobs] == [
+        JobStatus.DONE,
+        JobStatus.PENDING,
+        JobStatus.FAILED,
+    ]
+    assert reloaded.jobs[2].error == "no subtitles"
+    assert [job.url for job in reloaded.pending()] == [URLS[1]]
+
+    # Done videos are not queued again, failed ones are.
+    jobs = reloaded.add(URLS[:4], lambda url: make_task(url))
+    assert [job.url for job in jobs] == URLS[1:4]
+
+
+def test_jobs_keep_the_settings_they_were_queued_with(tmp_path, make_task):
+    queue = JobQueue(str(tmp_path / "batch.json"))
+
+    def german_task(url):
+        task = make_task(url)
+        task.language = "de"
+        task.audio_mode = AudioMode.COPY
+        return task
+
+    queue.add(URLS[:1], german_task)
+    queue.update(queue.jobs[0], JobStatus.DONE)
+    # The same video in another language is another job.
+    jobs = queue.add(URLS[:1], lambda url: make_task(url))
+    assert len(jobs) == 1 and jobs[0] is not queue.jobs[0]
+
+    reloaded = JobQueue(str(tmp_path / "batch.json"))
+    collection = MagicMock(spec=Collection)
+    runner = BatchRunner(reloaded, collection, lambda *args: None)
+    task = runner.job_task(reloaded.jobs[0])
+    assert task.youtube_video_url == URLS[0]
+    assert task.collection is collection
+    assert task.language == "de"
+    assert task.audio_mode == AudioMode.COPY
+    assert task.fields == FieldsConfiguration("Basic", "Front", "Back", None)
+    assert runner.job_task(reloaded.jobs[1]).language == "en"
+
+
+def test_runner_bounds_downloads_and_encoding(tmp_path, make_task):
+    queue = JobQueue(str(tmp_path / "batch.json"))
+    jobs = queue.add(URLS, lambda url: make_task(url))
+    cards = []
+    runner = FakeRunner(
+        queue,
+        MagicMock(spec=Collection),
+        lambda task, result, manifest, ranges: cards.append(result.video_id),
+        download_workers=2,
+        encode_workers=1,
+    )
+    updates = []
+    runner.run(jobs, updates.append)
+
+    assert runner.peak["download"] <= 2
+    assert runner.peak["generate"] == 1
+    assert sorted(cards) == sorted(url[-6:] for url in URLS if url != URLS[3])
+    failed = [job for job in queue.jobs if job.status == JobStatus.FAILED]
+    assert [job.url for job in failed] == [URLS[3]]
+    assert failed[0].error == NoSubtitlesException.__doc__
+    assert JobQueue(str(tmp_path / "batch.json")).pending() == []
+    assert len(updates) == 3 * 5 + 2
+
+
+def test_videos_are_downloaded_to_their_own_directories(tmp_path, make_task):
+    queue = JobQueue(str(tmp_path / "batch.json"))
+    jobs = queue.add(URLS[:1], lambda url: make_task(url))
+    runner = BatchRunner(queue, MagicMock(spec=Collection), lambda *args: None)
+    task = runner.job_task(jobs[0])
+    assert task.video_path == str(tmp_path / "vid" / "video0")
+    assert task.subtitle_path == str(tmp_path / "subs" / "video0")
+
+
+def test_stopped_batch_leaves_the_remaining_jobs_pending(tmp_path, make_task):
+    queue = JobQueue(str(tmp_path / "batch.json"))
+    jobs = queue.add(URLS, lambda url: make_task(url))
+    runner = FakeRunner(
+        queue,
+        MagicMock(spec=Collection),
+        lambda *args: runner.stop(),
+    )
+    runner.run(jobs)
+
+    assert runner.downloaded < len(URLS)
+    assert queue.pending()
+    assert all(job.status != JobStatus.GENERATING for job in queue.jobs)
+
+
+def test_resumed_video_does_not_add_its_notes_again(tmp_path, make_task):
+    collection = Collection(str(tmp_path / "collection.anki2"))
+    try:
+        task = make_task(URLS[0])
+        task.collection = collection
+        task.fields = FieldsConfiguration("Basic", "Front", None, None)
+        task.manifest_path = str(tmp_path / "manifests")
+        subtitles = SubtitleStore.from_ranges(
+            SubtitleRange(f"line {i}", i * 1000, i * 1000 + 500) for i in range(5)
+        )
+        result = YouTubeDownloadResult("Grit - en", subtitles, "", "", "video0")
+
+        def add_cards(task, result, manifest, ranges):
+            DeckWriter(collection, result.video_title, task.fields, manifest).add_cards(
+                ranges
+            )
+            runner.stop()
+
+        runner = BatchRunner(
+            JobQueue(str(tmp_path / "batch.json")), collection, add_cards
+        )
+        with patch.object(CardGenerator, "cards_per_batch", 2):
+            runner.generate(task, result)
+        assert collection.note_count() == 2
+
+        runner = BatchRunner(
+            JobQueue(str(tmp_path / "batch.json")), collection, add_cards
+        )
+        runner.generate(task, result)
+        assert sorted(
+            collection.get_note(note_id)["Front"]
+            for note_id in collection.find_notes("")
+        ) == [f"line {i}" for i in range(5)]
+    finally:
+        collection.close()
+
+
+def test_stop_cancels_running_downloads(tmp_path, make_task):
+    queue = JobQueue(str(tmp_path / "batch.json"))
+    jobs = queue.add(URLS[:1], lambda url: make_task(url))
+    runner = BatchRunner(queue, MagicMock(spec=Collection), lambda *args: None)
+
+    def download_video_files(task, on_progress, progress):
+        while True:
+            progress.hook({"status": "downloading", "downloaded_bytes": 1})
+            time.sleep(0.01)
+
+    def on_job(job):
+        if job.status == JobStatus.DOWNLOADING:
+            threading.Timer(0.05, runner.stop).start()
+
+    with patch("ytanki.batch.YouTubeClient.download_video_files", download_video_files):
+        runner.run(jobs, on_job)
+
+    assert jobs[0].status == JobStatus.PENDING
+
+
+def test_deleted_notes_are_generated_again(tmp_path, make_task):
+    collection = Collection(str(tmp_path / "collection.anki2"))
+    try:
+
+        def make_job_task(url):
+            task = make_task(url)
+            task.collection = collection
+            task.fields = FieldsConfiguration("Basic", "Front", None, None)
+            task.manifest_path = str(tmp_path / "manifests")
+            return task
+
+        queue = JobQueue(str(tmp_path / "batch.json"))
+        jobs = queue.add(URLS[:1], make_job_task)
+        task = make_job_task(URLS[0])
+        subtitles = SubtitleStore.from_ranges(
+            SubtitleRange(f"line {i}", i * 1000, i * 1000 + 500) for i in range(3)
+        )
+        result = YouTubeDownloadResult("Grit - en", subtitles, "", "", "video0")
+
+        def add_cards(task, result, manifest, ranges):
+            DeckWriter(collection, result.video_title, task.fields, manifest).add_cards(
+                ranges
+            )
+
+        runner = BatchRunner(queue, collection, add_cards)
+        runner.generate(task, result)
+        collection.remove_notes(collection.find_notes(""))
+
+        runner.forget_deleted_notes(jobs)
+        runner.generate(task, result)
+        assert collection.note_count() == 3
+    finally:
+        collection.close()
@@ -0,0 +1,55 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from ytanki.card_generator import CardGenerator
+from ytanki.errors import FfmpegException
+from ytanki.ffmpeg import Ffmpeg
+from ytanki.models import AudioMode, SubtitleRange, YouTubeDownloadResult
+from ytanki.subtitle_store import SubtitleStore
+
+
+def test_cards_sharing_media_that_failed_are_dropped(tmp_path, make_task):
+    task = make_task()
+    # The same line twice has the same audio clip, extracted once.
+    subtitles = SubtitleStore.from_ranges(
+        [
+            SubtitleRange("Hello", 1000, 2000),
+            SubtitleRange("Hello again", 1000, 2000),
+            SubtitleRange("World", 3000, 4000),
+        ]
+    )
+    result = YouTubeDownloadResult("Grit - en", subtitles, "video.mp4", "", "id")
+
+    def generate_media(job, dimensions, audio=True, picture=True):
+        if job.subtitle.text == "Hello":
+            raise FfmpegException("ffmpeg exited with code 1")
+        if audio:
+            open(job.audio_path, "wb").close()
+        job.fill_sub_media()
+
+    cards = []
+    with patch.object(Ffmpeg, "generate_media", generate_media):
+        count = CardGenerator(task, result).run(lambda percent: None, cards.extend)
+
+    assert count == 1
+    assert [card.text for card in cards] == ["World"]
+    os.remove(cards[0].audio_path)
+
+
+def test_demuxed_audio_is_removed_when_generation_fails(tmp_path, make_task):
+    task = make_task(audio_mode=AudioMode.DEMUXED)
+    subtitles = SubtitleStore.from_ranges([SubtitleRange("Hello", 1000, 2000)])
+    result = YouTubeDownloadResult("Grit - en", subtitles, "video.mp4", "", "id")
+    audio_source = tmp_path / "audio.mka"
+    audio_source.write_bytes(b"audio")
+
+    generator = CardGenerator(task, result)
+    with patch.object(
+        generator, "prepare_audio", return_value=(None, str(audio_source))
+    ), patch.object(generator, "generate_cards", side_effect=RuntimeError):
+        with pytest.raises(RuntimeError):
+            generator.run(lambda percent: None, lambda cards: None)
+
+    assert not audio_source.exists()
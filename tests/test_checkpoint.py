@@ -0,0 +1,98 @@
+import os
+
+from anki.collection import Collection
+from anki.decks import DeckId
+
+from ytanki.card_generator import CardGenerator
+from ytanki.checkpoint import GenerationCheckpoint
+from ytanki.models import SubtitleRange, YouTubeDownloadResult
+from ytanki.subtitle_store import SubtitleStore
+
+
+def make_result(tmp_path):
+    video_path = tmp_path / "video.mp4"
+    video_path.write_bytes(b"video")
+    subtitles = SubtitleStore.from_ranges(
+        SubtitleRange(f"line {i}", i * 1000, i * 1000 + 500) for i in range(5)
+    )
+    return YouTubeDownloadResult(
+        "Grit - en", subtitles, str(video_path), "", "H14bBuluwB8"
+    )
+
+
+def test_download_result_is_restored(tmp_path, make_task):
+    # Without media fields, no ffmpeg process is started.
+    task = make_task(audio_field=None)
+    result = make_result(tmp_path)
+    GenerationCheckpoint.for_task(task, "H14bBuluwB8").save_result(result)
+
+    restored = GenerationCheckpoint.for_task(task, "H14bBuluwB8").load_result()
+    assert restored.video_title == "Grit - en"
+    assert restored.video_path == result.video_path
+    assert [(s.text, s.time_start, s.time_end) for s in restored.subtitles] == [
+        (s.text, s.time_start, s.time_end) for s in result.subtitles
+    ]
+
+    # A checkpoint of other options, or of a video that is gone, is not used.
+    other = make_task(audio_field=None, dimensions="480x320")
+    assert GenerationCheckpoint.for_task(other, "H14bBuluwB8").load_result() is None
+    (tmp_path / "video.mp4").unlink()
+    assert GenerationCheckpoint.for_task(task, "H14bBuluwB8").load_result() is None
+
+
+def test_resumed_run_skips_the_completed_cards(tmp_path, make_task):
+    task = make_task(audio_field=None)
+    result = make_result(tmp_path)
+    checkpoint = GenerationCheckpoint.for_task(task, "H14bBuluwB8")
+    checkpoint.save_result(result)
+    checkpoint.complete([result.subtitles[0], result.subtitles[2]], [1001, 1003])
+
+    checkpoint = GenerationCheckpoint.for_task(task, "H14bBuluwB8")
+    result = checkpoint.load_result()
+    assert result is not None
+    cards = []
+    generator = CardGenerator(task, result, checkpoint=checkpoint)
+    assert generator.run(lambda percent: None, cards.extend) == 3
+    assert [card.text for card in cards] == ["line 1", "line 3", "line 4"]
+
+    checkpoint.complete(cards, [1002, 1004, 1005])
+    assert sorted(checkpoint.completed) == list(range(5))
+    checkpoint.remove()
+    assert GenerationCheckpoint.for_task(task, "H14bBuluwB8").result is None
+
+
+def test_removed_checkpoint_is_not_saved_again(tmp_path, make_task):
+    task = make_task(audio_field=None)
+    result = make_result(tmp_path)
+    checkpoint = GenerationCheckpoint.for_task(task, "H14bBuluwB8")
+    checkpoint.complete(list(result.subtitles), [1001, 1002, 1003, 1004, 1005])
+    checkpoint.remove()
+
+    # The download of a pipelined run completes after the cards.
+    checkpoint.save_result(result)
+    assert not os.path.exists(checkpoint.path)
+
+
+def test_deleted_notes_are_generated_again(tmp_path, make_task):
+    collection = Collection(str(tmp_path / "collection.anki2"))
+    try:
+        task = make_task(audio_field=None)
+        result = make_result(tmp_path)
+        notetype = collection.models.by_name("Basic")
+        assert notetype is not None
+        notes = []
+        for subtitle in list(result.subtitles)[:2]:
+            note = collection.new_note(notetype)
+            note["Front"] = subtitle.text
+            collection.add_note(note, DeckId(1))
+            notes.append(note)
+        checkpoint = GenerationCheckpoint.for_task(task, "H14bBuluwB8")
+        checkpoint.save_result(result)
+        checkpoint.complete(list(result.subtitles)[:2], [note.id for note in notes])
+
+        collection.remove_notes([notes[0].id])
+        checkpoint = GenerationCheckpoint.for_task(task, "H14bBuluwB8")
+        checkpoint.forget_deleted_notes(collection)
+        assert checkpoint.completed == {1: notes[1].id}
+    finally:
+        collection.close()
@@ -0,0 +1,135 @@
+import zipfile
+from unittest.mock import MagicMock, patch
+
+import pytest
+from anki.collection import Collection
+from yt_dlp.utils import DownloadError
+
+from ytanki import cli
+from ytanki.client_youtube import YouTubeClient
+from ytanki.ffmpeg import Ffmpeg
+from ytanki.models import (
+    FieldsConfiguration,
+    MediaInfo,
+    SubtitleRange,
+    YouTubeDownloadResult,
+)
+from ytanki.subtitle_store import SubtitleStore
+
+LINK = "https://www.youtube.com/watch?v=H14bBuluwB8"
+
+
+def download_video_files(task, on_progress, on_subtitles_ready=None):
+    subtitles = SubtitleStore.from_ranges(
+        SubtitleRange(f"line {i}", i * 1000, i * 1000 + 500) for i in range(3)
+    )
+    return YouTubeDownloadResult("Grit - en", subtitles, "", "", "H14bBuluwB8")
+
+
+def run_cli(*args):
+    with patch.object(
+        YouTubeClient, "download_video_files", side_effect=download_video_files
+    ):
+        # Without media fields, no ffmpeg process is started.
+        return cli.main([LINK, "--audio-field", "none", *args])
+
+
+def test_package_is_exported(tmp_path):
+    assert run_cli("-o", str(tmp_path), "--name", "grit") == 0
+
+    with zipfile.ZipFile(tmp_path / "grit.apkg") as package:
+        assert "collection.anki2" in package.namelist()
+
+
+def test_csv_has_an_import_header_and_a_row_per_card(tmp_path):
+    assert run_cli("-o", str(tmp_path), "--format", "csv") == 0
+
+    lines = (tmp_path / "yt-to-anki.csv").read_text(encoding="utf-8").splitlines()
+    assert lines[:5] == [
+        "#separator:Comma",
+        "#html:true",
+        "#notetype:Basic",
+        "#deck column:1",
+        "#columns:Deck,Front",
+    ]
+    assert lines[5:] == ["Grit - en,line 0", "Grit - en,line 1", "Grit - en,line 2"]
+    assert (tmp_path / "yt-to-anki.media").is_dir()
+
+
+def test_fields_must_exist_and_differ(tmp_path, capsys):
+    with pytest.raises(SystemExit):
+        run_cli("-o", str(tmp_path), "--text-field", "Back", "--picture-field", "Back")
+    assert "all fields must be different" in capsys.readouterr().err
+
+    with pytest.raises(SystemExit):
+        run_cli("-o", str(tmp_path), "--text-field", "Text")
+    assert "Basic has no field Text" in capsys.readouterr().err
+
+
+def test_local_video_is_not_downloaded(tmp_path):
+    video_path = tmp_path / "lesson.mp4"
+    video_path.write_bytes(b"video")
+    (tmp_path / "lesson.srt").write_text(
+        "1\n00:00:01,000 --> 00:00:02,000\nHello.\n", encoding="utf-8"
+    )
+    info = MediaInfo(duration=60000, audio_codec="aac", has_video=True)
+
+    with patch.object(Ffmpeg, "probe", return_value=info), patch.object(
+        YouTubeClient, "download_video_files"
+    ) as download_video_files:
+        status = cli.main(
+            [
+                "--video",
+                str(video_path),
+                "--audio-field",
+                "none",
+                "--format",
+                "csv",
+                "-o",
+                str(tmp_path),
+            ]
+        )
+
+    assert status == 0
+    download_video_files.assert_not_called()
+    lines = (tmp_path / "yt-to-anki.csv").read_text(encoding="utf-8").splitlines()
+    assert lines[5:] == ["lesson - en,Hello."]
+
+
+def test_failed_videos_do_not_stop_the_others(tmp_path, capsys):
+    removed = "https://www.youtube.com/watch?v=removed0000"
+
+    def download(task, on_progress, on_subtitles_ready=None):
+        if task.youtube_video_url == removed:
+            raise DownloadError("ERROR: Video unavailable")
+        return download_video_files(task, on_progress)
+
+    with patch.object(YouTubeClient, "download_video_files", side_effect=download):
+        status = cli.main([removed, LINK, "--audio-field", "none", "-o", str(tmp_path)])
+
+    assert status == 1
+    assert "Video unavailable" in capsys.readouterr().err
+    assert (tmp_path / "yt-to-anki.apkg").exists()
+
+
+def test_errors_without_a_message_are_named(tmp_path, capsys):
+    with patch.object(YouTubeClient, "download_video_files", side_effect=OSError):
+        status = cli.main([LINK, "--audio-field", "none", "-o", str(tmp_path)])
+
+    assert status == 1
+    assert f"{LINK}: OSError" in capsys.readouterr().err
+
+
+def test_downloads_are_only_cached_when_asked(tmp_path):
+    parser = cli.build_parser()
+    collection = MagicMock(spec=Collection)
+    fields = FieldsConfiguration("Basic", "Front", None, None)
+    args = parser.parse_args([LINK])
+    task = cli.make_task(args, LINK, collection, fields, str(tmp_path))
+    assert task.cache_size == 0
+    assert task.cache_path.startswith(str(tmp_path))
+
+    args = parser.parse_args([LINK, "--cache-dir", str(tmp_path / "cache")])
+    task = cli.make_task(args, LINK, collection, fields, str(tmp_path))
+    assert task.cache_size > 0
+    assert task.cache_path == str(tmp_path / "cache")
@@ -0,0 +1,273 @@
+import os
+import time
+from unittest.mock import patch
+
+import pytest
+import yt_dlp
+from yt_dlp.utils import DownloadCancelled
+
+from ytanki import client_youtube
+from ytanki.client_youtube import DownloadProgress, YouTubeClient
+from ytanki.errors import NoSubtitlesException
+from ytanki.models import FormatPolicy
+
+
+def video_format(format_id, ext, acodec, vcodec, width=None, height=None):
+    return {
+        "format_id": format_id,
+        "ext": ext,
+        "acodec": acodec,
+        "vcodec": vcodec,
+        "width": width,
+        "height": height,
+        "url": f"https://example.com/{format_id}",
+        "protocol": "https",
+    }
+
+
+# Sorted from worst to best, the way yt-dlp's extractors return them.
+FORMATS = [
+    video_format("140", "m4a", "mp4a", "none"),
+    video_format("251", "webm", "opus", "none"),
+    video_format("160", "mp4", "none", "avc1", 256, 144),
+    video_format("133", "mp4", "none", "avc1", 426, 240),
+    video_format("18", "mp4", "mp4a", "avc1", 640, 360),
+    video_format("134", "mp4", "none", "avc1", 640, 360),
+    video_format("22", "mp4", "mp4a", "avc1", 1280, 720),
+    video_format("136", "mp4", "none", "avc1", 1280, 720),
+    video_format("137", "mp4", "none", "avc1", 1920, 1080),
+]
+
+
+def selected_formats(format_spec):
+    ydl = yt_dlp.YoutubeDL({"quiet": True})
+    selector = ydl.build_format_selector(format_spec)
+    ctx = {"formats": FORMATS, "has_merged_format": True, "incomplete_formats": False}
+    return [f["format_id"] for f in selector(ctx)]
+
+
+def test_audio_only_download_without_picture_field(make_task):
+    format_spec = YouTubeClient.get_video_format(make_task())
+    assert selected_formats(format_spec) == ["251"]
+
+
+def test_smallest_video_covering_the_picture_dimensions(make_task):
+    format_spec = YouTubeClient.get_video_format(
+        make_task(picture_field="Picture", dimensions="240x160")
+    )
+    assert selected_formats(format_spec) == ["133+251"]
+
+    format_spec = YouTubeClient.get_video_format(
+        make_task(picture_field="Picture", dimensions="1000x600")
+    )
+    assert selected_formats(format_spec) == ["136+251"]
+
+
+def test_formats_with_audio_are_not_merged_with_more_audio(make_task):
+    format_spec = YouTubeClient.get_video_format(
+        make_task(picture_field="Picture", dimensions="600x300")
+    )
+    assert selected_formats(format_spec) == ["134+251"]
+
+
+def test_video_only_download_without_audio_field(make_task):
+    format_spec = YouTubeClient.get_video_format(
+        make_task(audio_field=None, picture_field="Picture")
+    )
+    assert selected_formats(format_spec) == ["133"]
+
+
+def test_best_video_when_no_format_is_large_enough(make_task):
+    format_spec = YouTubeClient.get_video_format(
+        make_task(picture_field="Picture", dimensions="4000x3000")
+    )
+    assert selected_formats(format_spec) == ["137+251"]
+
+
+def test_best_policy_ignores_the_picture_dimensions(make_task):
+    task = make_task(picture_field="Picture", format_policy=FormatPolicy.BEST)
+    format_spec = YouTubeClient.get_video_format(task)
+    assert selected_formats(format_spec) == ["137+251"]
+
+
+VIDEO_INFO = {
+    "id": "GfF2e0vyGM4",
+    "title": "Grit",
+    "extractor": "youtube",
+    "extractor_key": "Youtube",
+    "webpage_url": "https://www.youtube.com/watch?v=GfF2e0vyGM4",
+    "formats": [video_format("18", "mp4", "mp4a", "avc1", 640, 360)],
+    "subtitles": {},
+    "automatic_captions": {
+        "en": [
+            {
+                "ext": "vtt",
+                "name": "English",
+                "data": "WEBVTT\n\n00:00:00.000 --> 00:00:01.000\nhello\n",
+            }
+        ]
+    },
+}
+
+
+def test_video_information_is_fetched_once():
+    client_youtube._video_info_cache.clear()
+    link = "https://www.youtube.com/watch?v=GfF2e0vyGM4"
+    with patch.object(client_youtube.youtube_dl, "YoutubeDL") as youtube_dl:
+        youtube_dl.return_value.extract_info.return_value = VIDEO_INFO
+        assert YouTubeClient.get_subtitle_langs(link, fallback=True) == {
+            "English": "en"
+        }
+        assert YouTubeClient.get_subtitle_langs(link, fallback=False) == {}
+        assert YouTubeClient.get_video_info(link + "&t=42s")["title"] == "Grit"
+
+    assert youtube_dl.return_value.extract_info.call_count == 1
+
+
+def test_video_information_cache_is_bounded():
+    client_youtube._video_info_cache.clear()
+    links = [f"https://www.youtube.com/watch?v=video{i}" for i in range(20)]
+    with patch.object(client_youtube.youtube_dl, "YoutubeDL") as youtube_dl:
+        youtube_dl.return_value.extract_info.return_value = VIDEO_INFO
+        for link in links:
+            YouTubeClient.get_video_info(link)
+
+    assert list(client_youtube._video_info_cache) == [
+        f"video{i}" for i in range(20 - client_youtube.VIDEO_INFO_CACHE_SIZE, 20)
+    ]
+    assert not client_youtube._video_info_fetch_locks
+
+
+def test_subtitles_are_downloaded_from_the_video_information(tmp_path, make_task):
+    task = make_task(
+        fallback=True,
+        subtitle_path=str(tmp_path / "subs"),
+        cache_size=0,
+    )
+    with patch.object(YouTubeClient, "get_video_info", return_value=VIDEO_INFO):
+        path, automatic = YouTubeClient._download_subtitles(
+            task, on_progress=lambda _: None
+        )
+
+    assert os.path.basename(path) == "Grit-GfF2e0vyGM4.en.vtt"
+    assert automatic
+
+
+def test_progress_of_concurrent_downloads_is_combined():
+    reported = []
+    progress = DownloadProgress(reported.append)
+
+    progress.hook(
+        {
+            "status": "downloading",
+            "filename": "video.mp4",
+            "downloaded_bytes": 100,
+            "total_bytes": 1000,
+        }
+    )
+    progress.hook(
+        {"status": "finished", "filename": "subtitles.vtt", "total_bytes": 1000}
+    )
+
+    assert [d["_percent_str"] for d in reported] == ["10.0%", "55.0%"]
+
+
+def test_cancelled_downloads_are_aborted_on_next_progress():
+    progress = DownloadProgress(None)
+    progress.cancel()
+
+    with pytest.raises(DownloadCancelled):
+        progress.hook({"status": "downloading", "filename": "video.mp4"})
+
+
+def test_missing_subtitles_abort_the_video_download(make_task):
+    video_download_errors = []
+
+    def download_subtitles(video_task, on_progress, cache):
+        time.sleep(0.05)
+        raise NoSubtitlesException
+
+    def download_video(video_task, on_progress, cache, watermark):
+        try:
+            for downloaded in range(1000):
+                on_progress(
+                    {
+                        "status": "downloading",
+                        "filename": "video.mp4",
+                        "downloaded_bytes": downloaded,
+                        "total_bytes": 1000,
+                    }
+                )
+                time.sleep(0.01)
+        except DownloadCancelled as e:
+            video_download_errors.append(e)
+            raise
+
+    with patch.object(
+        YouTubeClient, "_download_subtitles", side_effect=download_subtitles
+    ), patch.object(YouTubeClient, "_download_video", side_effect=download_video):
+        with pytest.raises(NoSubtitlesException):
+            YouTubeClient.download_video_files(make_task(cache_size=0), None)
+
+    assert len(video_download_errors) == 1
+
+
+def test_pipelined_download_uses_a_single_file_format(make_task):
+    format_spec = YouTubeClient.get_video_format(
+        make_task(picture_field="Picture", pipelined=True)
+    )
+    assert selected_formats(format_spec) == ["18"]
+
+
+def test_playlists_and_channels_are_expanded_once():
+    playlists = {
+        "https://www.youtube.com/playlist?list=PL1": [
+            "https://www.youtube.com/watch?v=aaaaaaaaaaa",
+            "https://www.youtube.com/watch?v=bbbbbbbbbbb",
+        ],
+        "https://www.youtube.com/@channel": [
+            "https://www.youtube.com/watch?v=bbbbbbbbbbb",
+            "https://www.youtube.com/watch?v=ccccccccccc",
+        ],
+    }
+    text = (
+        "https://www.youtube.com/playlist?list=PL1,\n"
+        "https://youtu.be/aaaaaaaaaaa https://www.youtube.com/@channel"
+    )
+    links = YouTubeClient.split_links(text)
+    assert all(
+        YouTubeClient.is_valid_link(link) or YouTubeClient.is_collection_link(link)
+        for link in links
+    )
+
+    with patch.object(
+        YouTubeClient, "get_playlist_videos", side_effect=playlists.get
+    ) as get_playlist_videos:
+        videos = YouTubeClient.expand_links(links)
+    assert get_playlist_videos.call_count == 2
+    assert [YouTubeClient.get_video_id(video) for video in videos] == [
+        "aaaaaaaaaaa",
+        "bbbbbbbbbbb",
+        "ccccccccccc",
+    ]
+
+
+def test_channel_tabs_are_listed_flat():
+    channel = {
+        "_type": "playlist",
+        "entries": [
+            {"_type": "url", "ie_key": "YoutubeTab", "url": "https://tab/videos"},
+            {"_type": "url", "ie_key": "Youtube", "id": "aaaaaaaaaaa"},
+        ],
+    }
+    tab = {"entries": [{"_type": "url", "ie_key": "Youtube", "id": "bbbbbbbbbbb"}]}
+    with patch.object(client_youtube.youtube_dl, "YoutubeDL") as youtube_dl:
+        youtube_dl.return_value.extract_info.side_effect = [channel, tab]
+        videos = YouTubeClient.get_playlist_videos("https://www.youtube.com/@channel")
+
+    options = youtube_dl.call_args[0][0]
+    assert options["extract_flat"] == "in_playlist"
+    assert videos == [
+        "https://www.youtube.com/watch?v=bbbbbbbbbbb",
+        "https://www.youtube.com/watch?v=aaaaaaaaaaa",
+    ]
@@ -0,0 +1,89 @@
+import os
+
+from anki.collection import Collection
+
+from ytanki.deck_writer import DeckWriter
+from ytanki.manifest import GenerationManifest
+from ytanki.models import FieldsConfiguration, GenerateVideoTask, SubtitleRange
+
+
+def make_subtitle(tmp_path, i):
+    audio_path = tmp_path / f"clip_{i}.mp3"
+    audio_path.write_bytes(b"audio %d" % i)
+    subtitle = SubtitleRange(f"line {i}", i * 1000, (i + 1) * 1000)
+    subtitle.add_paths_to_picture_and_audio("", str(audio_path))
+    return subtitle
+
+
+def test_batches_are_added_under_one_undo_entry(tmp_path):
+    collection = Collection(str(tmp_path / "collection.anki2"))
+    try:
+        fields = FieldsConfiguration("Basic", "Front", "Back", None)
+        writer = DeckWriter(collection, "Grit - en", fields)
+
+        writer.add_cards([make_subtitle(tmp_path, i) for i in range(3)])
+        notes = writer.add_cards([make_subtitle(tmp_path, i) for i in range(3, 5)])
+
+        deck_id = collection.decks.id_for_name("Grit - en")
+        assert len(collection.find_notes(f"did:{deck_id}")) == 5
+        assert notes[0]["Front"] == "line 3"
+        assert notes[0]["Back"] == "[sound:clip_3.mp3]"
+        assert collection.media.have("clip_4.mp3")
+        assert collection.undo_status().undo == DeckWriter.undo_name
+
+        collection.undo()
+        assert collection.find_notes(f"did:{deck_id}") == []
+    finally:
+        collection.close()
+
+
+def test_media_already_in_the_collection_is_reused(tmp_path):
+    collection = Collection(str(tmp_path / "collection.anki2"))
+    try:
+        fields = FieldsConfiguration("Basic", "Front", "Back", None)
+        writer = DeckWriter(collection, "Grit - en", fields)
+
+        first = writer.add_cards([make_subtitle(tmp_path, 1)])
+        again = writer.add_cards([make_subtitle(tmp_path, 1)])
+
+        assert first[0]["Back"] == again[0]["Back"] == "[sound:clip_1.mp3]"
+        assert os.listdir(collection.media.dir()) == ["clip_1.mp3"]
+    finally:
+        collection.close()
+
+
+def test_manifest_updates_existing_notes_in_place(tmp_path):
+    collection = Collection(str(tmp_path / "collection.anki2"))
+    try:
+        fields = FieldsConfiguration("Basic", "Front", "Back", None)
+        task = GenerateVideoTask(
+            youtube_video_url="https://www.youtube.com/watch?v=H14bBuluwB8",
+            language="en",
+            fallback=False,
+            optimize_by_punctuation=False,
+            dimensions="240x160",
+            limit=0,
+            collection=collection,
+            fields=fields,
+            manifest_path=str(tmp_path / "manifests"),
+        )
+        manifest = GenerationManifest.for_task(task, "H14bBuluwB8")
+        writer = DeckWriter(collection, "Grit - en", fields, manifest)
+        first = writer.add_cards([make_subtitle(tmp_path, i) for i in range(2)])
+
+        changed = make_subtitle(tmp_path, 0)
+        changed.text = "line 0, corrected"
+        writer = DeckWriter(collection, "Grit - en", fields, manifest)
+        second = writer.add_cards([changed])
+
+        assert second[0].id == first[0].id
+        assert collection.get_note(first[0].id)["Front"] == "line 0, corrected"
+        assert collection.note_count() == 2
+
+        # Notes deleted from the collection are generated again.
+        collection.remove_notes([first[0].id])
+        third = writer.add_cards([changed])
+        assert third[0].id != first[0].id
+        assert manifest.note_id(changed) == third[0].id
+    finally:
+        collection.close()
@@ -0,0 +1,74 @@
+import os
+
+from ytanki.download_cache import DownloadCache
+
+
+def write_file(folder, name, size):
+    path = os.path.join(folder, name)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    return path
+
+
+def test_put_moves_the_file_into_the_cache(tmp_path):
+    cache = DownloadCache(str(tmp_path / "cache"), max_size=1000)
+    key = DownloadCache.key("GfF2e0vyGM4", "video", "best")
+    downloaded = write_file(tmp_path, "video.mp4", 10)
+
+    entry = cache.put(key, downloaded, {"title": "Grit"})
+
+    assert not os.path.exists(downloaded)
+    assert cache.get(key) == entry
+    assert entry.metadata == {"title": "Grit"}
+    assert cache.get(DownloadCache.key("GfF2e0vyGM4", "video", "worst")) is None
+
+
+def test_corrupted_entries_are_dropped(tmp_path):
+    cache = DownloadCache(str(tmp_path / "cache"), max_size=1000)
+    key = DownloadCache.key("GfF2e0vyGM4", "video", "best")
+    entry = cache.put(key, write_file(tmp_path, "video.mp4", 10), {})
+
+    with open(entry.path, "r+b") as f:
+        f.write(b"y")
+    # Filesystems with a coarse clock may keep the same modification time.
+    mtime_ns = os.stat(entry.path).st_mtime_ns + 1_000_000_000
+    os.utime(entry.path, ns=(mtime_ns, mtime_ns))
+
+    assert cache.get(key) is None
+    assert not os.path.exists(entry.path)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = DownloadCache(str(tmp_path / "cache"), max_size=25)
+    keys = [DownloadCache.key(video_id, "video") for video_id in "abc"]
+
+    cache.put(keys[0], write_file(tmp_path, "a.mp4", 10), {})
+    cache.put(keys[1], write_file(tmp_path, "b.mp4", 10), {})
+    assert cache.get(keys[0]) is not None
+    cache.put(keys[2], write_file(tmp_path, "c.mp4", 10), {})
+
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[2]) is not None
+
+
+def test_pinned_entries_are_not_evicted(tmp_path):
+    cache = DownloadCache(str(tmp_path / "cache"), max_size=15)
+    first = DownloadCache.key("GfF2e0vyGM4", "video", "best")
+    second = DownloadCache.key("H14bBuluwB8", "video", "best")
+    cache.pin(first)
+    cache.put(first, write_file(tmp_path, "first.mp4", 10), {})
+
+    cache.put(second, write_file(tmp_path, "second.mp4", 10), {})
+
+    assert cache.get(first) is not None
+    cache.unpin(first)
+    cache.put(second, write_file(tmp_path, "second.mp4", 10), {})
+    assert cache.get(first) is None
+
+
+def test_threads_share_the_instance_of_a_directory(tmp_path):
+    cache = DownloadCache.shared(str(tmp_path / "cache"), max_size=1000)
+
+    assert DownloadCache.shared(str(tmp_path / "cache" / "."), 1000) is cache
+    assert DownloadCache.shared(str(tmp_path / "other"), 1000) is not cache
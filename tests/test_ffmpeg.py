@@ -0,0 +1,160 @@
+from datetime import datetime, timedelta
+
+from ytanki.ffmpeg import Ffmpeg, FfmpegBatch
+from ytanki.models import SubtitleRange
+
+
+def time_from(string):
+    time = datetime.strptime(string, "%H:%M:%S.%f")
+    return (time - datetime(1900, 1, 1)) // timedelta(milliseconds=1)
+
+
+def make_jobs(*ranges):
+    return [
+        Ffmpeg(
+            SubtitleRange(f"line {i}", time_from(start), time_from(end)),
+            "video.mp4",
+            "title",
+        )
+        for i, (start, end) in enumerate(ranges)
+    ]
+
+
+def test_single_pass_audio_command_seeks_relative_to_chunk_start():
+    jobs = make_jobs(
+        ("00:01:05.500", "00:01:07.000"),
+        ("00:01:00.250", "00:01:02.750"),
+    )
+    command = FfmpegBatch(jobs).audio_command(FfmpegBatch(jobs).jobs)
+
+    assert command[command.index("-i") - 1] == "60.250"
+    assert command.count("-i") == 1
+    outputs = [i for i, arg in enumerate(command) if arg.endswith(".mp3")]
+    assert [command[i - 3] for i in outputs] == ["0.000", "5.250"]
+    assert [command[i - 1] for i in outputs] == ["2.500", "1.500"]
+
+
+def test_single_pass_audio_is_split_in_chunks():
+    batch = FfmpegBatch(
+        make_jobs(*[(f"00:00:0{i}.000", f"00:00:0{i}.500") for i in range(5)])
+    )
+    batch.max_outputs = 2
+
+    assert [len(chunk) for chunk in batch.chunks()] == [2, 2, 1]
+
+
+def test_batch_pictures_select_one_frame_per_timestamp():
+    batch = FfmpegBatch(
+        make_jobs(
+            ("00:00:10.000", "00:00:11.000"),
+            ("00:00:12.500", "00:00:13.000"),
+        )
+    )
+    command = batch.picture_command(batch.jobs, "240x160", "%05d.jpeg")
+
+    assert command.count("-i") == 1
+    assert command[-1] == "%05d.jpeg"
+    video_filter = command[command.index("-vf") + 1]
+    assert video_filter == (
+        "select='isnan(prev_selected_t)+gte(t,2.500)*lt(prev_selected_t,2.500)',"
+        "showinfo,scale=240x160"
+    )
+
+
+def test_media_paths_depend_on_the_source_range_and_settings():
+    subtitle = SubtitleRange(
+        "line", time_from("00:00:01.000"), time_from("00:00:02.000")
+    )
+    job = Ffmpeg(subtitle, "video.mp4", "title", "GfF2e0vyGM4", "240x160")
+    same = Ffmpeg(subtitle, "other.mp4", "other", "GfF2e0vyGM4", "240x160")
+    larger = Ffmpeg(subtitle, "video.mp4", "title", "GfF2e0vyGM4", "480x320")
+    longer = Ffmpeg(
+        SubtitleRange("line", time_from("00:00:01.000"), time_from("00:00:03.000")),
+        "video.mp4",
+        "title",
+        "GfF2e0vyGM4",
+        "240x160",
+    )
+
+    assert (job.audio_path, job.picture_path) == (same.audio_path, same.picture_path)
+    assert job.audio_path == larger.audio_path
+    assert job.picture_path != larger.picture_path
+    assert job.audio_path != longer.audio_path
+    assert job.picture_path == longer.picture_path
+
+    copied = Ffmpeg(subtitle, "video.mp4", "title", "GfF2e0vyGM4", "240x160", "mp3")
+    assert copied.audio_path.endswith(".mp3")
+    assert copied.audio_path != job.audio_path
+
+
+def test_audio_clips_seek_in_the_input():
+    job = make_jobs(("00:01:05.500", "00:01:07.000"))[0]
+    command = job.audio_command()
+
+    # Seeking before -i is accurate once the audio is decoded.
+    assert command.index("-ss") < command.index("-i")
+    assert command[command.index("-ss") + 1] == "00:01:05.500"
+    assert command[command.index("-t") + 1] == "1.500"
+    assert "copy" not in command
+    assert command[-1].endswith(".mp3")
+
+
+def test_copied_audio_clips_keep_the_source_codec():
+    job = Ffmpeg(
+        SubtitleRange("line", 65_500, 67_000), "video.webm", "title", "id", "", "opus"
+    )
+    command = job.audio_command()
+
+    # Only whole packets can be copied, the clip starts at the packet
+    # containing the subtitle start.
+    assert command.index("-ss") < command.index("-i")
+    assert command[command.index("-c:a") + 1] == "copy"
+    assert command[-1].endswith(".opus")
+    assert job.audio_path != make_jobs(("00:01:05.500", "00:01:07.000"))[0].audio_path
+
+
+def test_demuxed_audio_is_used_as_the_source():
+    jobs = make_jobs(("00:00:01.000", "00:00:02.000"), ("00:00:03.000", "00:00:04.000"))
+    for job in jobs:
+        job.audio_source = "audio.mka"
+
+    assert jobs[0].audio_command()[jobs[0].audio_command().index("-i") + 1] == (
+        "audio.mka"
+    )
+    command = FfmpegBatch(jobs).audio_command(jobs)
+    assert command[command.index("-i") + 1] == "audio.mka"
+
+
+def test_audio_codec_is_parsed_from_the_input_description():
+    output = (
+        "Input #0, mov,mp4,m4a,3gp,3g2,mj2, from 'video.mp4':\n"
+        "  Stream #0:0[0x1](und): Video: h264 (High) (avc1 / 0x31637661)\n"
+        "  Stream #0:1[0x2](und): Audio: aac (LC) (mp4a / 0x6134706D), 44100 Hz\n"
+    )
+    assert Ffmpeg.parse_audio_codec(output) == "aac"
+    assert Ffmpeg.parse_audio_codec("  Stream #0:0: Video: vp9") is None
+
+
+def test_paths_are_passed_as_single_arguments():
+    job = Ffmpeg(
+        SubtitleRange("line", 1000, 2000), 'My "best" video.mp4', "title", "id"
+    )
+    command = job.picture_command("240x160")
+
+    assert command[command.index("-i") + 1] == 'My "best" video.mp4'
+    assert command[command.index("-s") + 1] == "240x160"
+    assert command[-1] == job.picture_path
+
+
+def test_media_info_is_parsed_from_the_input_description():
+    output = """
+Input #0, mov,mp4,m4a,3gp,3g2,mj2, from 'song.m4a':
+  Duration: 00:03:25.12, start: 0.000000, bitrate: 130 kb/s
+  Stream #0:0[0x1](und): Audio: aac (LC) (mp4a / 0x6134706D), 44100 Hz, stereo
+  Stream #0:1[0x0]: Video: mjpeg (Baseline), yuvj420p, 600x600 (attached pic)
+"""
+    info = Ffmpeg.parse_media_info(output)
+
+    assert info.duration == 205120
+    assert info.audio_codec == "aac"
+    assert not info.has_video
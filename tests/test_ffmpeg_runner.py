@@ -0,0 +1,54 @@
+import sys
+import time
+
+import pytest
+
+from ytanki import ffmpeg_runner
+from ytanki.errors import FfmpegException
+
+
+def python(code):
+    # Stands in for ffmpeg, the runner does not depend on the program.
+    return [sys.executable, "-c", code]
+
+
+def test_successful_runs_are_timed_without_keeping_the_output():
+    result = ffmpeg_runner.run(python("import sys; sys.stderr.write('frame=1')"))
+
+    assert result.returncode == 0
+    assert result.duration > 0
+    assert result.stderr == ""
+
+    result = ffmpeg_runner.run(
+        python("import sys; sys.stderr.write('frame=1')"), keep_stderr=True
+    )
+    assert result.stderr == "frame=1"
+
+
+def test_failures_report_the_exit_code_and_error_output():
+    with pytest.raises(FfmpegException, match="code 3: Invalid data found"):
+        ffmpeg_runner.run(
+            python("import sys; sys.stderr.write('Invalid data found'); sys.exit(3)")
+        )
+
+    result = ffmpeg_runner.run(python("import sys; sys.exit(1)"), check=False)
+    assert result.returncode == 1
+
+
+def test_missing_outputs_are_failures(tmp_path):
+    output = tmp_path / "clip.mp3"
+
+    with pytest.raises(FfmpegException, match="did not produce"):
+        ffmpeg_runner.run(python("pass"), [str(output)])
+
+    ffmpeg_runner.run(python(f"open({str(output)!r}, 'w').close()"), [str(output)])
+
+
+def test_stopped_runs_kill_the_process():
+    start = time.perf_counter()
+    with pytest.raises(InterruptedError):
+        ffmpeg_runner.run(
+            python("import time; time.sleep(30)"),
+            should_stop=lambda: time.perf_counter() - start > 0.2,
+        )
+    assert time.perf_counter() - start < 5
@@ -0,0 +1,84 @@
+from anki.collection import Collection
+
+from ytanki.card_generator import CardGenerator
+from ytanki.deck_writer import DeckWriter
+from ytanki.manifest import GenerationManifest
+from ytanki.models import SubtitleRange, YouTubeDownloadResult
+from ytanki.subtitle_store import SubtitleStore
+
+
+def make_subtitle(text, start, end):
+    return SubtitleRange(text, start * 1000, end * 1000)
+
+
+def test_recorded_ranges_are_unchanged_after_reload(tmp_path, make_task):
+    task = make_task(audio_field=None, picture_field="Back")
+    manifest = GenerationManifest.for_task(task, "H14bBuluwB8")
+    manifest.record(make_subtitle("Hello", 1, 2), 1001)
+    manifest.save()
+
+    reloaded = GenerationManifest.for_task(task, "H14bBuluwB8")
+    assert reloaded.is_unchanged(make_subtitle("Hello", 1, 2))
+    assert reloaded.note_id(make_subtitle("Hello", 1, 2)) == 1001
+    assert not reloaded.is_unchanged(make_subtitle("Hello there", 1, 3))
+    assert reloaded.note_id(make_subtitle("Hello there", 1, 3)) == 1001
+    assert not reloaded.is_unchanged(make_subtitle("World", 3, 4))
+    assert reloaded.note_id(make_subtitle("World", 3, 4)) is None
+
+
+def test_options_that_change_the_notes_are_part_of_the_manifest(tmp_path, make_task):
+    manifest = GenerationManifest.for_task(
+        make_task(audio_field=None, picture_field="Back"), "H14bBuluwB8"
+    )
+    manifest.record(make_subtitle("Hello", 1, 2), 1001)
+    manifest.save()
+
+    other_language = GenerationManifest.for_task(
+        make_task(audio_field=None, picture_field="Back", language="de"), "H14bBuluwB8"
+    )
+    assert other_language.note_id(make_subtitle("Hello", 1, 2)) is None
+
+    other_task = make_task(audio_field=None, picture_field="Back")
+    other_task.dimensions = "480x320"
+    resized = GenerationManifest.for_task(other_task, "H14bBuluwB8")
+    assert not resized.is_unchanged(make_subtitle("Hello", 1, 2))
+
+    merged_task = make_task(audio_field=None, picture_field="Back")
+    merged_task.optimize_by_punctuation = True
+    merged = GenerationManifest.for_task(merged_task, "H14bBuluwB8")
+    assert merged.note_id(make_subtitle("Hello", 1, 2)) is None
+
+
+def test_undone_notes_are_generated_again(tmp_path, make_task):
+    collection = Collection(str(tmp_path / "collection.anki2"))
+    try:
+        task = make_task(audio_field=None)
+        task.collection = collection
+        result = YouTubeDownloadResult(
+            "Grit - en",
+            SubtitleStore.from_ranges(
+                make_subtitle(f"line {i}", i, i + 1) for i in range(3)
+            ),
+            "",
+            "",
+            "H14bBuluwB8",
+        )
+
+        def generate():
+            manifest = GenerationManifest.for_task(task, "H14bBuluwB8")
+            manifest.forget_deleted_notes(collection)
+            writer = DeckWriter(collection, "Grit - en", task.fields, manifest)
+            generator = CardGenerator(task, result, manifest=manifest)
+            return generator.run(lambda percent: None, writer.add_cards)
+
+        assert generate() == 3
+        assert generate() == 0
+        assert collection.note_count() == 3
+
+        # The whole generation is undone at once, the manifest still has it.
+        collection.undo()
+        assert collection.note_count() == 0
+        assert generate() == 3
+        assert collection.note_count() == 3
+    finally:
+        collection.close()
@@ -0,0 +1,64 @@
+import threading
+import time
+
+from ytanki.media_pool import MediaExtractionPool
+
+
+def test_results_are_delivered_in_input_order():
+    def extract(item):
+        # Later items finish first.
+        time.sleep((10 - item) * 0.005)
+
+    pool = MediaExtractionPool(parallelism=4)
+    results = list(pool.run(range(10), extract))
+
+    assert [item for item, _ in results] == list(range(10))
+    assert all(error is None for _, error in results)
+
+
+def test_runs_items_concurrently():
+    lock = threading.Lock()
+    running = 0
+    max_running = 0
+
+    def extract(_):
+        nonlocal running, max_running
+        with lock:
+            running += 1
+            max_running = max(max_running, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+
+    pool = MediaExtractionPool(parallelism=3)
+    list(pool.run(range(12), extract))
+
+    assert max_running == 3
+
+
+def test_errors_are_reported_per_item():
+    def extract(item):
+        if item == 2:
+            raise RuntimeError("ffmpeg failed")
+
+    pool = MediaExtractionPool(parallelism=2)
+    results = dict(pool.run(range(4), extract))
+
+    assert isinstance(results[2], RuntimeError)
+    assert results[0] is None and results[3] is None
+
+
+def test_stops_submitting_once_stopped():
+    extracted = []
+    stop = False
+
+    def extract(item):
+        extracted.append(item)
+
+    pool = MediaExtractionPool(parallelism=1)
+    for item, _ in pool.run(range(100), extract, should_stop=lambda: stop):
+        if item == 5:
+            stop = True
+
+    # Only the bounded window ahead of the stopping point was started.
+    assert len(extracted) <= 5 + 1 + pool.max_in_flight
@@ -0,0 +1,54 @@
+import threading
+
+import pytest
+
+from ytanki.pipeline import DownloadWatermark
+
+
+def progress(downloaded_bytes, total_bytes=1000):
+    return {
+        "status": "downloading",
+        "filename": "video.mp4",
+        "downloaded_bytes": downloaded_bytes,
+        "total_bytes": total_bytes,
+    }
+
+
+def test_covered_duration_follows_the_downloaded_bytes():
+    watermark = DownloadWatermark(duration=100, margin=10)
+    watermark.update(progress(500))
+
+    assert watermark.wait_until_covered(40) == "video.mp4"
+    assert watermark.wait_until_covered(41, should_stop=lambda: True) is None
+
+
+def test_waiting_clips_are_released_by_the_download():
+    watermark = DownloadWatermark(duration=100, margin=10)
+    paths = []
+    waiting = threading.Thread(
+        target=lambda: paths.append(watermark.wait_until_covered(80))
+    )
+    waiting.start()
+
+    watermark.update(progress(500))
+    waiting.join(timeout=0.1)
+    assert waiting.is_alive()
+
+    watermark.update(progress(950))
+    waiting.join(timeout=1)
+    assert paths == ["video.mp4"]
+
+
+def test_finished_download_covers_everything():
+    watermark = DownloadWatermark(duration=None)
+    watermark.finish("cache/video.mp4")
+
+    assert watermark.wait_until_finished() == "cache/video.mp4"
+
+
+def test_download_errors_are_raised_to_waiting_clips():
+    watermark = DownloadWatermark(duration=100)
+    watermark.fail(RuntimeError("HTTP Error 403"))
+
+    with pytest.raises(RuntimeError):
+        watermark.wait_until_covered(1)
@@ -0,0 +1,33 @@
+from array import array
+
+from ytanki.silence import SilenceDetector
+
+
+def make_detector(pattern):
+    """One 10 ms frame per character, "#" for speech and "." for silence."""
+    loud = 80 * 8000**2
+    return SilenceDetector(array("d", (loud if c == "#" else 0 for c in pattern)))
+
+
+def test_boundaries_within_speech_are_moved_to_the_silence():
+    detector = make_detector("....######....")
+
+    assert detector.refine(60, 80, search=50) == (40, 100)
+
+
+def test_silent_or_isolated_boundaries_are_kept():
+    detector = make_detector("..##########..")
+
+    assert detector.refine(10, 130, search=50) == (10, 130)
+    assert detector.refine(70, 80, search=30) == (70, 80)
+
+
+def test_energies_are_read_per_frame(tmp_path):
+    pcm_path = tmp_path / "audio.pcm"
+    samples = array("h", [0] * 80 + [100, -100] * 40 + [3] * 10)
+    with open(pcm_path, "wb") as f:
+        samples.tofile(f)
+
+    energies = SilenceDetector.read_energies(str(pcm_path))
+
+    assert list(energies) == [0, 80 * 100**2, 10 * 3**2]
@@ -0,0 +1,56 @@
+from unittest.mock import patch
+
+import pytest
+
+from ytanki.errors import SourceException
+from ytanki.ffmpeg import Ffmpeg
+from ytanki.models import MediaInfo
+from ytanki.sources import LocalSource
+
+SUBTITLES = """WEBVTT
+
+00:01.000 --> 00:02.000
+Good morning.
+
+00:02.000 --> 00:03.000
+How are you?
+
+00:59.000 --> 01:01.000
+Bye.
+"""
+
+
+@pytest.fixture
+def video_path(tmp_path):
+    path = tmp_path / "lesson.mp4"
+    path.write_bytes(b"video")
+    (tmp_path / "lesson.en.vtt").write_text(SUBTITLES, encoding="utf-8")
+    return path
+
+
+def test_local_files_are_probed_once(video_path, make_task):
+    info = MediaInfo(duration=30000, audio_codec="aac", has_video=True)
+    with patch.object(Ffmpeg, "probe", return_value=info) as probe:
+        result = LocalSource(str(video_path)).fetch(make_task(str(video_path)))
+
+    probe.assert_called_once_with(str(video_path))
+    assert result.video_title == "lesson - en"
+    assert result.subtitle_path == str(video_path.with_suffix(".en.vtt"))
+    assert result.audio_codec == "aac"
+    assert result.video_id == LocalSource.get_video_id(str(video_path))
+    # The last subtitle starts after the end of the video.
+    assert [sub.text for sub in result.subtitles] == ["Good morning.", "How are you?"]
+
+
+def test_missing_streams_and_subtitles_are_reported(video_path, tmp_path, make_task):
+    info = MediaInfo(duration=30000, audio_codec="aac", has_video=False)
+    with patch.object(Ffmpeg, "probe", return_value=info):
+        with pytest.raises(SourceException, match="has no video"):
+            LocalSource(str(video_path)).fetch(
+                make_task(str(video_path), picture_field="Picture")
+            )
+
+        other_video = tmp_path / "other.mp4"
+        other_video.write_bytes(b"video")
+        with pytest.raises(SourceException, match="No subtitles found"):
+            LocalSource(str(other_video)).fetch(make_task(str(other_video)))
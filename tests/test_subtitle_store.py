@@ -0,0 +1,43 @@
+import json
+
+from ytanki.models import SubtitleRange
+from ytanki.subtitle_store import SubtitleStore
+from ytanki.utils import with_limit
+
+
+def make_store(count):
+    return SubtitleStore.from_ranges(
+        SubtitleRange(f"line {i}", i * 1000, i * 1000 + 500) for i in range(count)
+    )
+
+
+def test_views_read_and_write_the_rows():
+    store = make_store(3)
+
+    assert len(store) == 3
+    assert [subtitle.text for subtitle in store] == ["line 0", "line 1", "line 2"]
+    assert store[-1].time_start == 2000
+
+    store[1].time_end = 1800
+    store[1].add_paths_to_picture_and_audio("1.jpeg", "1.mp3")
+    assert store.ends[1] == 1800
+    assert store[1].audio_path == "1.mp3"
+    assert store[0].audio_path is None
+
+
+def test_slices_are_stores():
+    store = make_store(5)
+
+    limited = with_limit(store, 2)
+    assert isinstance(limited, SubtitleStore)
+    assert [subtitle.time_start for subtitle in limited] == [0, 1000]
+    assert store[1:][0].text == "line 1"
+
+
+def test_columns_round_trip_through_json():
+    store = make_store(3)
+
+    restored = SubtitleStore.from_dict(json.loads(json.dumps(store.to_dict())))
+    assert list(restored.starts) == [0, 1000, 2000]
+    assert list(restored.ends) == [500, 1500, 2500]
+    assert restored.texts == store.texts
@@ -1,4 +1,5 @@
 from ytanki.client_youtube import YouTubeClient
+from ytanki.utils import format_timestamp, get_timestamp
 
 
 def test_yt_link_matching():
@@ -17,3 +18,24 @@ def test_yt_link_matching():
         "http://www.youtube.com/watch?v=ifaLk5v3W90&t=38s"
     )
     assert YouTubeClient.is_valid_link("https://youtu.be/JIvKgSyvtxI")
+
+
+def test_video_id_from_link():
+    assert YouTubeClient.get_video_id("https://www.youtube.com/") is None
+    assert (
+        YouTubeClient.get_video_id(
+            "https://www.youtube.com/watch?v=glpR1MD1UoM&list=PLZaoyhMXgBzrbeVNhVz9_z8TvqyaOP963&index=1"
+        )
+        == "glpR1MD1UoM"
+    )
+    assert YouTubeClient.get_video_id("https://youtu.be/JIvKgSyvtxI") == "JIvKgSyvtxI"
+
+
+def test_timestamps_are_parsed_to_milliseconds():
+    assert get_timestamp("00:00:00.049") == 49
+    assert get_timestamp("01:02:03.450") == 3_723_450
+    assert get_timestamp("02:03.450") == 123_450
+    assert get_timestamp("01:02:03,450") == 3_723_450
+    assert get_timestamp("26:00:00.000") == 93_600_000
+    assert format_timestamp(3_723_450) == "01:02:03.450"
+    assert format_timestamp(get_timestamp("00:00:09.630")) == "00:00:09.630"
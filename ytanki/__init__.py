@@ -1,7 +1,9 @@
 import sys
 from os.path import dirname, join
 
-if "pytest" not in sys.modules:
+# The add-on is only registered when loaded by Anki, so that the package can
+# also be imported by the tests and the benchmarks.
+if "pytest" not in sys.modules and "aqt" in sys.modules:
     sys.path.append(join(dirname(__file__), "lib"))
 
     from aqt import mw
@@ -0,0 +1,369 @@
+import dataclasses
+import hashlib
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from anki.collection import Collection
+
+from .card_generator import CardGenerator
+from .client_youtube import DownloadProgress, YouTubeClient
+from .manifest import GenerationManifest
+from .models import (
+    AudioMode,
+    BatchJob,
+    FieldsConfiguration,
+    FormatPolicy,
+    GenerateVideoTask,
+    JobStatus,
+    OptimizationStrategy,
+    SentenceBounds,
+    SubtitleRow,
+    YouTubeDownloadResult,
+)
+from .utils import get_addon_directory
+
+QUEUE_PATH = os.path.join(get_addon_directory(), "batch.json")
+
+# Called with the task, the download result and the manifest of a video, and
+# a batch of its generated cards.
+CardsCallback = Callable[
+    [
+        GenerateVideoTask,
+        YouTubeDownloadResult,
+        Optional[GenerationManifest],
+        List[SubtitleRow],
+    ],
+    None,
+]
+
+
+def task_options(task: GenerateVideoTask) -> Dict:
+    """The settings of the task, without its video and collection, as JSON."""
+    options = {}
+    for task_field in dataclasses.fields(task):
+        if task_field.name in ("youtube_video_url", "collection"):
+            continue
+        value = getattr(task, task_field.name)
+        if dataclasses.is_dataclass(value) and not isinstance(value, type):
+            value = dataclasses.asdict(value)
+        elif isinstance(value, Enum):
+            value = value.value
+        options[task_field.name] = value
+    return options
+
+
+def task_from_options(
+    url: str, options: Dict, collection: Collection
+) -> GenerateVideoTask:
+    """The task of the video with the settings returned by task_options."""
+    options = dict(options)
+    options["fields"] = FieldsConfiguration(**options["fields"])
+    options["sentence_bounds"] = SentenceBounds(**options["sentence_bounds"])
+    for name, enum in (
+        ("format_policy", FormatPolicy),
+        ("optimization_strategy", OptimizationStrategy),
+        ("audio_mode", AudioMode),
+    ):
+        options[name] = enum(options[name])
+    return GenerateVideoTask(youtube_video_url=url, collection=collection, **options)
+
+
+class JobQueue:
+    """The videos of the batches, and how far each one got.
+
+    The queue is saved to a JSON file on every change, so that a batch that
+    was interrupted, or Anki that was closed, can resume where it stopped.
+    Jobs that were running are pending again once the queue is loaded. A job
+    is a video with the settings it was queued with: the same video queued
+    with other settings is another job.
+    """
+
+    def __init__(self, path: str = QUEUE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.jobs: List[BatchJob] = []
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.jobs = [
+                    BatchJob(
+                        job["url"],
+                        JobStatus(job["status"]),
+                        job["error"],
+                        job["options"],
+                    )
+                    for job in json.load(f)
+                ]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        for job in self.jobs:
+            if job.status in (JobStatus.DOWNLOADING, JobStatus.GENERATING):
+                job.status = JobStatus.PENDING
+
+    def add(
+        self, urls: Iterable[str], make_task: Callable[[str], GenerateVideoTask]
+    ) -> List[BatchJob]:
+        """Queues the videos, and returns the jobs to run for them.
+
+        Videos already done with the same settings are not queued again,
+        failed ones are.
+        """
+        with self.lock:
+            known = {(job.url, self.options_key(job.options)): job for job in self.jobs}
+            jobs = []
+            for url in urls:
+                options = task_options(make_task(url))
+                key = (url, self.options_key(options))
+                job = known.get(key)
+                if job is None:
+                    job = known[key] = BatchJob(url, options=options)
+                    self.jobs.append(job)
+                elif job.status == JobStatus.FAILED:
+                    job.status = JobStatus.PENDING
+                    job.error = ""
+                # Done jobs, and the ones another batch is running, are left out.
+                if job.status == JobStatus.PENDING and job not in jobs:
+                    jobs.append(job)
+            self.save()
+            return jobs
+
+    @staticmethod
+    def options_key(options: Dict) -> str:
+        return json.dumps(options, sort_keys=True)
+
+    def pending(self) -> List[BatchJob]:
+        """Jobs left by earlier batches, to be resumed."""
+        with self.lock:
+            return [job for job in self.jobs if job.status == JobStatus.PENDING]
+
+    def discard_pending(self):
+        with self.lock:
+            self.jobs = [job for job in self.jobs if job.status != JobStatus.PENDING]
+            self.save()
+
+    def update(self, job: BatchJob, status: JobStatus, error: str = ""):
+        with self.lock:
+            job.status = status
+            job.error = error
+            self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump([dataclasses.asdict(job) for job in self.jobs], f)
+        os.replace(tmp_path, self.path)
+
+
+class BatchRunner:
+    """Generates the cards of jobs of a queue, with the settings of each job.
+
+    Videos are downloaded by `download_workers` threads while the cards of
+    the downloaded ones are generated by `encode_workers` threads, each of
+    them running its own pool of ffmpeg processes. At most one downloaded
+    video waits for every encoding thread, so that the downloads do not
+    fill the disk ahead of the encoding.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        collection: Collection,
+        on_cards: CardsCallback,
+        download_workers: int = 2,
+        encode_workers: int = 1,
+    ):
+        self.queue = queue
+        self.collection = collection
+        self.on_cards = on_cards
+        self.download_workers = max(1, download_workers)
+        self.encode_workers = max(1, encode_workers)
+        self.stop_flag = False
+        self.generators: Set[CardGenerator] = set()
+        self.downloads: Set[DownloadProgress] = set()
+        self.lock = threading.Lock()
+
+    def stop(self):
+        self.stop_flag = True
+        with self.lock:
+            for generator in self.generators:
+                generator.stop()
+            for progress in self.downloads:
+                progress.cancel()
+
+    def forget_deleted_notes(self, jobs: Iterable[BatchJob]):
+        """Forgets the deleted notes in the manifests of the jobs.
+
+        Called before `run`, on the thread the collection belongs to.
+        """
+        for job in jobs:
+            task = task_from_options(job.url, job.options, self.collection)
+            video_id = YouTubeClient.get_video_id(job.url) or ""
+            manifest = GenerationManifest.for_task(task, video_id)
+            count = len(manifest.entries)
+            manifest.forget_deleted_notes(self.collection)
+            if len(manifest.entries) != count:
+                manifest.save()
+
+    def run(
+        self,
+        jobs: Iterable[BatchJob],
+        on_job: Callable[[BatchJob], None] = lambda job: None,
+    ):
+        """Runs the jobs, until they are all done or the batch is stopped.
+
+        `on_job` is called with every job whose status changed.
+        """
+        slots = threading.BoundedSemaphore(self.download_workers + self.encode_workers)
+        encodes = ThreadPoolExecutor(
+            max_workers=self.encode_workers, thread_name_prefix="yt-to-anki-encode"
+        )
+        downloads = ThreadPoolExecutor(
+            max_workers=self.download_workers,
+            thread_name_prefix="yt-to-anki-download",
+        )
+        # The downloads are waited for first, since they queue the encoding.
+        with encodes, downloads:
+            for job in jobs:
+                if not self.acquire(slots):
+                    break
+                downloads.submit(self.download_job, job, encodes, slots, on_job)
+
+    def acquire(self, slots: threading.BoundedSemaphore) -> bool:
+        while not self.stop_flag:
+            if slots.acquire(timeout=0.1):
+                return True
+        return False
+
+    def job_task(self, job: BatchJob) -> GenerateVideoTask:
+        """The task of the job, downloading to directories of its own."""
+        task = task_from_options(job.url, job.options, self.collection)
+        name = (
+            YouTubeClient.get_video_id(job.url)
+            or hashlib.sha1(job.url.encode()).hexdigest()[:16]
+        )
+        return dataclasses.replace(
+            task,
+            video_path=os.path.join(task.video_path, name),
+            subtitle_path=os.path.join(task.subtitle_path, name),
+        )
+
+    def download(self, task: GenerateVideoTask) -> YouTubeDownloadResult:
+        progress = DownloadProgress(None)
+        with self.lock:
+            self.downloads.add(progress)
+        if self.stop_flag:
+            progress.cancel()
+        try:
+            return YouTubeClient.download_video_files(task, None, progress=progress)
+        finally:
+            with self.lock:
+                self.downloads.discard(progress)
+
+    def generate(self, task: GenerateVideoTask, result: YouTubeDownloadResult) -> int:
+        # Always incremental, so that a video stopped midway and resumed
+        # later does not add its first notes a second time.
+        manifest = GenerationManifest.for_task(task, result.video_id)
+        generator = CardGenerator(task, result, manifest=manifest)
+        with self.lock:
+            self.generators.add(generator)
+        if self.stop_flag:
+            generator.stop()
+        try:
+            return generator.run(
+                lambda percent: None,
+                lambda cards: self.on_cards(task, result, manifest, cards),
+            )
+        finally:
+            with self.lock:
+                self.generators.discard(generator)
+
+    def download_job(
+        self,
+        job: BatchJob,
+        encodes: ThreadPoolExecutor,
+        slots: threading.BoundedSemaphore,
+        on_job: Callable[[BatchJob], None],
+    ):
+        task = None
+        try:
+            task = self.job_task(job)
+            # The cached video must outlive the downloads of the next jobs,
+            # until it is encoded.
+            self.pin_video(task)
+            self.set_status(job, JobStatus.DOWNLOADING, on_job)
+            result = self.download(task)
+        except Exception as e:
+            # A download cancelled by stopping is resumed with the batch.
+            if self.stop_flag:
+                self.set_status(job, JobStatus.PENDING, on_job)
+            else:
+                self.fail(job, e, on_job)
+            self.remove_files(task)
+            slots.release()
+            return
+        encodes.submit(self.generate_job, job, task, result, slots, on_job)
+
+    def generate_job(
+        self,
+        job: BatchJob,
+        task: GenerateVideoTask,
+        result: YouTubeDownloadResult,
+        slots: threading.BoundedSemaphore,
+        on_job: Callable[[BatchJob], None],
+    ):
+        try:
+            if self.stop_flag:
+                self.set_status(job, JobStatus.PENDING, on_job)
+                return
+            self.set_status(job, JobStatus.GENERATING, on_job)
+            self.generate(task, result)
+            # A stopped video is resumed with the batch, without the notes
+            # its manifest says were added.
+            status = JobStatus.PENDING if self.stop_flag else JobStatus.DONE
+            self.set_status(job, status, on_job)
+        except Exception as e:
+            self.fail(job, e, on_job)
+        finally:
+            self.remove_files(task)
+            slots.release()
+
+    def set_status(
+        self, job: BatchJob, status: JobStatus, on_job: Callable[[BatchJob], None]
+    ):
+        self.queue.update(job, status)
+        on_job(job)
+
+    def fail(self, job: BatchJob, error: Exception, on_job: Callable[[BatchJob], None]):
+        # Some exceptions, like NoSubtitlesException, only have a docstring.
+        message = str(error) or type(error).__doc__ or type(error).__name__
+        print(f"yt-to-anki: BatchRunner: {job.url} failed: {message}")
+        self.queue.update(job, JobStatus.FAILED, message)
+        on_job(job)
+
+    @staticmethod
+    def pin_video(task: GenerateVideoTask):
+        cache = YouTubeClient.get_cache(task)
+        key = YouTubeClient.get_video_cache_key(task)
+        if cache is not None and key is not None:
+            cache.pin(key)
+
+    @staticmethod
+    def unpin_video(task: GenerateVideoTask):
+        cache = YouTubeClient.get_cache(task)
+        key = YouTubeClient.get_video_cache_key(task)
+        if cache is not None and key is not None:
+            cache.unpin(key)
+
+    @staticmethod
+    def remove_files(task: Optional[GenerateVideoTask]):
+        # Videos kept by the download cache live outside of these directories.
+        if task is not None:
+            BatchRunner.unpin_video(task)
+            shutil.rmtree(task.video_path, ignore_errors=True)
+            shutil.rmtree(task.subtitle_path, ignore_errors=True)
@@ -0,0 +1,326 @@
+import os
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from .checkpoint import GenerationCheckpoint
+from .errors import FfmpegException
+from .ffmpeg import Ffmpeg, FfmpegBatch
+from .manifest import GenerationManifest
+from .media_pool import MediaExtractionPool
+from .models import (
+    AudioMode,
+    GenerateVideoTask,
+    SubtitleRow,
+    YouTubeDownloadResult,
+)
+from .pipeline import DownloadWatermark
+from .silence import SilenceDetector
+from .utils import format_timestamp, get_seconds
+
+
+class CardGenerator:
+    """Extracts the media of the subtitle ranges of a downloaded video.
+
+    This is the part of the card generation that does not depend on Qt or
+    on the Anki main window: the cards are handed to a callback, which adds
+    them to the collection.
+    """
+
+    # Generated cards are handed over in batches.
+    cards_per_batch = 50
+
+    def __init__(
+        self,
+        task: GenerateVideoTask,
+        youtube_download_result: YouTubeDownloadResult,
+        watermark: Optional[DownloadWatermark] = None,
+        manifest: Optional[GenerationManifest] = None,
+        checkpoint: Optional[GenerationCheckpoint] = None,
+    ):
+        self.task: GenerateVideoTask = task
+        self.youtube_download_result: YouTubeDownloadResult = youtube_download_result
+        # Set when the video is still being downloaded.
+        self.watermark = watermark
+        # Set when only new or changed ranges should be generated.
+        self.manifest = manifest
+        # Set when the cards added by an earlier run are skipped.
+        self.checkpoint = checkpoint
+        self.stop_flag = False
+        self.generated_cards_count = 0
+
+    def stop(self):
+        self.stop_flag = True
+
+    def should_stop(self) -> bool:
+        return self.stop_flag
+
+    def generate_in_batch(self, name: str, extract) -> bool:
+        try:
+            extract()
+            return True
+        except InterruptedError:
+            return False
+        except FfmpegException as e:
+            print(
+                f"yt-to-anki: CardGenerator: "
+                f"batch {name} extraction failed, "
+                f"falling back to one ffmpeg call per clip: {e}"
+            )
+            return False
+
+    def generate_media(self, job: Ffmpeg, audio: bool, picture: bool):
+        if self.watermark is None:
+            job.generate_media(self.task.dimensions, audio=audio, picture=picture)
+            return
+
+        # Wait until the downloaded part of the video covers the subtitle.
+        was_finished = self.watermark.finished
+        end = get_seconds(job.subtitle.time_end)
+        job.video_path = self.watermark.wait_until_covered(end, lambda: self.stop_flag)
+        if job.video_path is None:
+            raise InterruptedError("card generation was stopped")
+
+        # Files left by an earlier run must not pass for this run's output.
+        for path, needed in ((job.audio_path, audio), (job.picture_path, picture)):
+            if needed and os.path.exists(path):
+                os.remove(path)
+        try:
+            job.generate_media(self.task.dimensions, audio=audio, picture=picture)
+            return
+        except FfmpegException:
+            if was_finished:
+                raise
+
+        # The estimate of the downloaded duration was off, or the container
+        # cannot be read before it is complete.
+        job.video_path = self.watermark.wait_until_finished(lambda: self.stop_flag)
+        if job.video_path is None:
+            raise InterruptedError("card generation was stopped")
+        job.generate_media(self.task.dimensions, audio=audio, picture=picture)
+
+    def full_video_path(self) -> Optional[str]:
+        """Path of the complete video, once it is downloaded.
+
+        Returns None if the generation is stopped while waiting.
+        """
+        if self.watermark is None:
+            return self.youtube_download_result.video_path
+        return self.watermark.wait_until_finished(lambda: self.stop_flag)
+
+    def refine_boundaries(
+        self, subtitles: Sequence[SubtitleRow]
+    ) -> Sequence[SubtitleRow]:
+        # The whole audio track is analyzed at once.
+        video_path = self.full_video_path()
+        if video_path is None:
+            return subtitles
+
+        try:
+            detector = SilenceDetector.from_video(video_path, self.should_stop)
+        except InterruptedError:
+            return subtitles
+        except FfmpegException as e:
+            print(
+                f"yt-to-anki: CardGenerator: "
+                f"could not analyze the audio, keeping the subtitle timings: {e}"
+            )
+            return subtitles
+        return detector.refine_all(subtitles, self.task.boundary_search)
+
+    def prepare_audio(self) -> Tuple[Optional[str], Optional[str]]:
+        """The audio codec to copy and the audio-only file to cut clips from."""
+        video_path = self.full_video_path()
+        if video_path is None:
+            return None, None
+
+        try:
+            if self.task.audio_mode == AudioMode.COPY:
+                codec = (
+                    self.youtube_download_result.audio_codec
+                    or Ffmpeg.probe_audio_codec(video_path)
+                )
+                if codec in Ffmpeg.AUDIO_EXTENSIONS:
+                    return codec, None
+                print(
+                    f"yt-to-anki: CardGenerator: "
+                    f"{codec} audio cannot be copied, encoding it to MP3"
+                )
+            elif self.task.audio_mode == AudioMode.DEMUXED:
+                return None, Ffmpeg.demux_audio(video_path, self.should_stop)
+        except InterruptedError:
+            return None, None
+        except FfmpegException as e:
+            print(
+                f"yt-to-anki: CardGenerator: "
+                f"could not extract the audio stream, encoding from the video: {e}"
+            )
+        return None, None
+
+    def run(
+        self,
+        on_progress: Callable[[int], None],
+        on_cards: Callable[[List[SubtitleRow]], object],
+    ) -> int:
+        """Generates the cards, and returns how many were generated.
+
+        `on_progress` gets the percentage of ranges processed so far, and
+        `on_cards` the generated ranges, `cards_per_batch` at a time.
+        """
+        store = self.youtube_download_result.subtitles
+        if self.task.limit:
+            store = store[: self.task.limit]
+        subtitles: Sequence[SubtitleRow] = store
+        if self.checkpoint is not None and self.checkpoint.completed:
+            # Checked on the rows of the store, which carry their index.
+            subtitles = [
+                subtitle
+                for subtitle in store
+                if not self.checkpoint.is_completed(subtitle)
+            ]
+        if self.task.refine_boundaries:
+            subtitles = self.refine_boundaries(subtitles)
+        if self.manifest is not None:
+            subtitles = [
+                subtitle
+                for subtitle in subtitles
+                if not self.manifest.is_unchanged(subtitle)
+            ]
+
+        audio_codec = audio_source = None
+        if self.task.fields.audio_field is not None and subtitles:
+            if self.task.audio_mode != AudioMode.MP3:
+                audio_codec, audio_source = self.prepare_audio()
+
+        try:
+            return self.generate_cards(
+                subtitles, audio_codec, audio_source, on_progress, on_cards
+            )
+        finally:
+            if audio_source is not None:
+                os.remove(audio_source)
+
+    def generate_cards(
+        self,
+        subtitles: Sequence[SubtitleRow],
+        audio_codec: Optional[str],
+        audio_source: Optional[str],
+        on_progress: Callable[[int], None],
+        on_cards: Callable[[List[SubtitleRow]], object],
+    ) -> int:
+        """Extracts the media of the ranges left after the filters of run."""
+        jobs = [
+            Ffmpeg(
+                subtitle,
+                self.youtube_download_result.video_path,
+                self.youtube_download_result.video_title,
+                self.youtube_download_result.video_id,
+                self.task.dimensions,
+                audio_codec,
+            )
+            for subtitle in subtitles
+        ]
+        for job in jobs:
+            job.audio_source = audio_source
+
+        # Media that is already in the collection, or produced by an earlier
+        # job of this run, is not extracted again.
+        media_dir = self.task.collection.media.dir()
+        produced = set()
+
+        def needs_media(path: str) -> bool:
+            name = os.path.basename(path)
+            if name in produced or os.path.exists(os.path.join(media_dir, name)):
+                return False
+            produced.add(name)
+            return True
+
+        needs_audio = self.task.fields.audio_field is not None
+        needs_pictures = self.task.fields.picture_field is not None
+        plans = [
+            (
+                job,
+                needs_audio and needs_media(job.audio_path),
+                needs_pictures and needs_media(job.picture_path),
+            )
+            for job in jobs
+        ]
+        audio_jobs = [job for job, audio, _ in plans if audio]
+        picture_jobs = [job for job, _, picture in plans if picture]
+
+        uses_batch = bool(audio_jobs and self.task.single_pass_audio) or bool(
+            picture_jobs and self.task.batch_pictures
+        )
+        if self.watermark is not None and uses_batch:
+            # The batch modes read the whole video at once.
+            video_path = self.watermark.wait_until_finished(lambda: self.stop_flag)
+            for job in jobs:
+                job.video_path = video_path or ""
+            self.watermark = None
+
+        has_audio = bool(
+            audio_jobs
+            and self.task.single_pass_audio
+            and self.generate_in_batch(
+                "audio", lambda: FfmpegBatch(audio_jobs).get_audio(self.should_stop)
+            )
+        )
+        has_pictures = bool(
+            picture_jobs
+            and self.task.batch_pictures
+            and self.generate_in_batch(
+                "picture",
+                lambda: FfmpegBatch(picture_jobs).get_pictures(
+                    self.task.dimensions, self.should_stop
+                ),
+            )
+        )
+
+        pool = MediaExtractionPool(self.task.parallelism)
+        results = pool.run(
+            plans,
+            lambda plan: self.generate_media(
+                plan[0],
+                audio=plan[1] and not has_audio,
+                picture=plan[2] and not has_pictures,
+            ),
+            should_stop=lambda: self.stop_flag,
+        )
+        cards: List[SubtitleRow] = []
+        # Media that the job extracting it failed to produce. The jobs
+        # sharing it come later, since the pool keeps the order of the plans.
+        missing = set()
+        for (job, audio, picture), error in results:
+            if error is not None:
+                for path, extracted in (
+                    (job.audio_path, audio),
+                    (job.picture_path, picture),
+                ):
+                    if extracted and not os.path.exists(path):
+                        missing.add(os.path.basename(path))
+            else:
+                shared = [
+                    path
+                    for path in (job.audio_path, job.picture_path)
+                    if os.path.basename(path) in missing
+                ]
+                if shared:
+                    error = FfmpegException(f"ffmpeg did not produce {shared[0]}")
+            if error is not None:
+                print(
+                    f"yt-to-anki: CardGenerator: "
+                    f"no card for the subtitle at "
+                    f"{format_timestamp(job.subtitle.time_start)}: {error}"
+                )
+                continue
+
+            self.generated_cards_count += 1
+            percent = int((self.generated_cards_count / len(subtitles)) * 100)
+            on_progress(percent)
+
+            cards.append(job.subtitle)
+            if len(cards) == self.cards_per_batch:
+                on_cards(cards)
+                cards = []
+
+        if cards:
+            on_cards(cards)
+        return self.generated_cards_count
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Iterable, Optional
+
+from anki.collection import Collection
+
+from .manifest import existing_note_ids
+from .models import GenerateVideoTask, YouTubeDownloadResult
+from .subtitle_store import SubtitleStore, SubtitleView
+
+
+class GenerationCheckpoint:
+    """Progress of a card generation, kept on disk until it is complete.
+
+    The checkpoint holds the download result with the parsed subtitles, and
+    the notes added for the subtitles, by subtitle index. A run that was
+    stopped, or interrupted by Anki closing, resumes without downloading the
+    video again and only generates the remaining cards. There is one
+    checkpoint per video and per set of options that change the cards.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # The download and the generation save from different threads.
+        self.lock = threading.Lock()
+        self.result: Optional[dict] = None
+        # Note IDs by subtitle index.
+        self.completed: Dict[int, int] = {}
+        # Set once the generation is complete, after which nothing is saved.
+        self.removed = False
+        try:
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+            self.result = state["result"]
+            self.completed = {
+                int(index): note_id for index, note_id in state["completed"].items()
+            }
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    @staticmethod
+    def for_task(task: GenerateVideoTask, video_id: str) -> "GenerationCheckpoint":
+        fields = task.fields
+        key = "\0".join(
+            str(part)
+            for part in (
+                video_id,
+                task.language,
+                task.fallback,
+                task.optimize_by_punctuation,
+                task.optimization_strategy.value,
+                task.sentence_bounds,
+                fields.note_type,
+                fields.text_field,
+                fields.audio_field,
+                fields.picture_field,
+                task.dimensions,
+                task.refine_boundaries,
+                task.boundary_search,
+            )
+        )
+        digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+        return GenerationCheckpoint(
+            os.path.join(task.checkpoint_path, f"{video_id}-{digest}.json")
+        )
+
+    def load_result(self) -> Optional[YouTubeDownloadResult]:
+        """The saved download result, if its video is still on disk."""
+        if self.result is None or not os.path.exists(self.result["video_path"]):
+            return None
+        return YouTubeDownloadResult(
+            self.result["video_title"],
+            SubtitleStore.from_dict(self.result["subtitles"]),
+            self.result["video_path"],
+            self.result["subtitle_path"],
+            self.result["video_id"],
+        )
+
+    def save_result(self, result: YouTubeDownloadResult):
+        self.result = {
+            "video_title": result.video_title,
+            "subtitles": result.subtitles.to_dict(),
+            "video_path": result.video_path,
+            "subtitle_path": result.subtitle_path,
+            "video_id": result.video_id,
+        }
+        self.save()
+
+    def is_completed(self, subtitle: SubtitleView) -> bool:
+        return subtitle.index in self.completed
+
+    def complete(self, subtitles: Iterable[SubtitleView], note_ids: Iterable[int]):
+        """Records the notes added for the subtitles."""
+        with self.lock:
+            self.completed.update(
+                (subtitle.index, note_id)
+                for subtitle, note_id in zip(subtitles, note_ids)
+            )
+        self.save()
+
+    def forget_deleted_notes(self, collection: Collection):
+        """Forgets the notes deleted or undone since, to generate them again."""
+        with self.lock:
+            existing = existing_note_ids(collection, self.completed.values())
+            self.completed = {
+                index: note_id
+                for index, note_id in self.completed.items()
+                if note_id in existing
+            }
+
+    def save(self):
+        with self.lock:
+            # A download finishing after the cards would bring it back.
+            if self.removed:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                state = {"result": self.result, "completed": self.completed}
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+
+    def remove(self):
+        with self.lock:
+            self.removed = True
+            if os.path.exists(self.path):
+                os.remove(self.path)
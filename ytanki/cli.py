@@ -0,0 +1,281 @@
+"""Generates decks from YouTube videos without the Anki GUI.
+
+Run from the repository root with `python -m ytanki.cli <link>...`, or with
+`--video` for a video already on disk. The notes are written to an .apkg
+package, or to a CSV file that Anki can import with a folder of the media next
+to it.
+"""
+import argparse
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import List, Optional, TextIO
+
+from anki.collection import Collection
+
+from .card_generator import CardGenerator
+from .client_youtube import YouTubeClient
+from .deck_writer import DeckWriter
+from .errors import NoSubtitlesException
+from .media_pool import default_parallelism
+from .models import (
+    AudioMode,
+    FieldsConfiguration,
+    GenerateVideoTask,
+    OptimizationStrategy,
+    SubtitleRow,
+)
+from .sources import LocalSource, YouTubeSource
+from .utils import has_ffmpeg
+
+# Value of the audio and picture field options for cards without that media.
+NO_FIELD = "none"
+
+
+class CsvDeckWriter:
+    """Writes the notes of a video as rows of a CSV file.
+
+    The media files are copied to `media_dir`, to be copied to the media
+    folder of the profile before the file is imported.
+    """
+
+    def __init__(self, writer, media_dir: str, title: str, fields: FieldsConfiguration):
+        self.writer = writer
+        self.media_dir = media_dir
+        self.title = title
+        self.fields = fields
+
+    @staticmethod
+    def write_header(f: TextIO, fields: FieldsConfiguration):
+        columns = [
+            field
+            for field in (fields.text_field, fields.audio_field, fields.picture_field)
+            if field is not None
+        ]
+        f.write("#separator:Comma\n")
+        f.write("#html:true\n")
+        f.write(f"#notetype:{fields.note_type}\n")
+        f.write("#deck column:1\n")
+        f.write(f"#columns:Deck,{','.join(columns)}\n")
+
+    def add_media(self, path: Optional[str]) -> str:
+        # Cards whose media could not be extracted are not handed over.
+        assert path is not None
+        name = os.path.basename(path)
+        shutil.copyfile(path, os.path.join(self.media_dir, name))
+        return name
+
+    def add_cards(self, subtitle_ranges: List[SubtitleRow]):
+        for subtitle_range in subtitle_ranges:
+            row = [self.title, subtitle_range.text]
+            if self.fields.audio_field is not None:
+                audio = self.add_media(subtitle_range.audio_path)
+                row.append(f"[sound:{audio}]")
+            if self.fields.picture_field is not None:
+                picture = self.add_media(subtitle_range.picture_path)
+                row.append(f'<img src="{picture}">')
+            self.writer.writerow(row)
+
+
+def optional_field(field: str) -> Optional[str]:
+    return None if field.lower() == NO_FIELD else field
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m ytanki.cli",
+        description="Generate Anki cards from the subtitles of YouTube videos.",
+    )
+    parser.add_argument(
+        "links", nargs="*", help="links of videos, playlists or channels"
+    )
+    parser.add_argument("--video", help="local video file, instead of links")
+    parser.add_argument(
+        "--subtitles",
+        help="WebVTT or SubRip file of the local video, found next to it by default",
+    )
+    parser.add_argument(
+        "-o", "--output", default=".", help="directory of the generated files"
+    )
+    parser.add_argument(
+        "--name", default="yt-to-anki", help="name of the generated files"
+    )
+    parser.add_argument("--format", choices=["apkg", "csv"], default="apkg")
+    parser.add_argument("-l", "--language", default="en")
+    parser.add_argument(
+        "--fallback",
+        action="store_true",
+        help="use automatic captions when there are no manual subtitles",
+    )
+    parser.add_argument(
+        "--optimize", action="store_true", help="merge the subtitles into sentences"
+    )
+    parser.add_argument(
+        "--strategy",
+        choices=[strategy.value for strategy in OptimizationStrategy],
+        default=OptimizationStrategy.PUNCTUATION.value,
+    )
+    parser.add_argument(
+        "--note-type",
+        default="Basic",
+        help="one of the note types of a new collection",
+    )
+    parser.add_argument("--text-field", default="Front")
+    parser.add_argument(
+        "--audio-field", type=optional_field, default="Back", help="or 'none'"
+    )
+    parser.add_argument(
+        "--picture-field", type=optional_field, default=None, help="or 'none'"
+    )
+    parser.add_argument("--dimensions", default="240x160")
+    parser.add_argument(
+        "--limit", type=int, default=0, help="cards per video, 0 for all"
+    )
+    parser.add_argument("-j", "--parallelism", type=int, default=default_parallelism())
+    parser.add_argument(
+        "--audio-mode",
+        choices=[mode.value for mode in AudioMode],
+        default=AudioMode.MP3.value,
+    )
+    parser.add_argument("--single-pass-audio", action="store_true")
+    parser.add_argument("--batch-pictures", action="store_true")
+    parser.add_argument("--refine-boundaries", action="store_true")
+    parser.add_argument(
+        "--cache-dir", help="keep the downloads in this directory between runs"
+    )
+    return parser
+
+
+def make_task(
+    args: argparse.Namespace,
+    link: str,
+    collection: Collection,
+    fields: FieldsConfiguration,
+    work_dir: str,
+) -> GenerateVideoTask:
+    return GenerateVideoTask(
+        link,
+        args.language,
+        args.fallback,
+        args.optimize,
+        args.dimensions,
+        args.limit,
+        collection,
+        fields,
+        video_path=os.path.join(work_dir, "vid"),
+        subtitle_path=os.path.join(work_dir, "subs"),
+        # Downloads are only kept when asked, never in the add-on folder.
+        cache_path=args.cache_dir or os.path.join(work_dir, "cache"),
+        cache_size=GenerateVideoTask.cache_size if args.cache_dir else 0,
+        parallelism=args.parallelism,
+        single_pass_audio=args.single_pass_audio,
+        batch_pictures=args.batch_pictures,
+        optimization_strategy=OptimizationStrategy(args.strategy),
+        refine_boundaries=args.refine_boundaries,
+        audio_mode=AudioMode(args.audio_mode),
+        resumable=False,
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    fields = FieldsConfiguration(
+        args.note_type, args.text_field, args.audio_field, args.picture_field
+    )
+    used_fields = [
+        field
+        for field in (fields.text_field, fields.audio_field, fields.picture_field)
+        if field is not None
+    ]
+    if len(set(used_fields)) != len(used_fields):
+        parser.error("all fields must be different")
+    if bool(args.links) == bool(args.video):
+        parser.error("either links or --video must be given")
+    if not all(
+        YouTubeClient.is_valid_link(link) or YouTubeClient.is_collection_link(link)
+        for link in args.links
+    ):
+        parser.error("invalid youtube link")
+    if (fields.audio_field or fields.picture_field) and not has_ffmpeg():
+        parser.error("ffmpeg must be installed to PATH")
+
+    os.makedirs(args.output, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix="yt-to-anki_")
+    collection = Collection(os.path.join(work_dir, "collection.anki2"))
+    csv_file = None
+    try:
+        notetype = collection.models.by_name(args.note_type)
+        if notetype is None:
+            parser.error(f"unknown note type: {args.note_type}")
+        missing = set(used_fields) - set(collection.models.field_names(notetype))
+        if missing:
+            parser.error(f"{args.note_type} has no field {', '.join(sorted(missing))}")
+
+        csv_writer = None
+        media_dir = ""
+        if args.format == "csv":
+            media_dir = os.path.join(args.output, f"{args.name}.media")
+            os.makedirs(media_dir, exist_ok=True)
+            csv_path = os.path.join(args.output, f"{args.name}.csv")
+            csv_file = open(csv_path, "w", encoding="utf-8", newline="")
+            CsvDeckWriter.write_header(csv_file, fields)
+            csv_writer = csv.writer(csv_file)
+
+        if args.video:
+            sources = [(args.video, LocalSource(args.video, args.subtitles))]
+        else:
+            links = YouTubeClient.expand_links(args.links)
+            sources = [(link, YouTubeSource()) for link in links]
+
+        failures = 0
+        for link, source in sources:
+            task = make_task(args, link, collection, fields, work_dir)
+            try:
+                result = source.fetch(task, None)
+                if args.format == "csv":
+                    writer = CsvDeckWriter(
+                        csv_writer, media_dir, result.video_title, fields
+                    )
+                else:
+                    writer = DeckWriter(collection, result.video_title, fields)
+                timer_start = time.perf_counter()
+                count = CardGenerator(task, result).run(
+                    lambda percent: None, writer.add_cards
+                )
+                print(
+                    f"{result.video_title}: generated {count} cards in "
+                    f"{time.perf_counter() - timer_start:.1f} seconds"
+                )
+            except NoSubtitlesException:
+                print(f"{link}: no subtitles in {args.language}", file=sys.stderr)
+                failures += 1
+            except Exception as e:
+                # A private or removed video of a playlist fails on its own,
+                # like in BatchRunner.
+                print(f"{link}: {str(e) or type(e).__name__}", file=sys.stderr)
+                failures += 1
+
+        if args.format == "apkg":
+            collection.export_anki_package(
+                out_path=os.path.abspath(
+                    os.path.join(args.output, f"{args.name}.apkg")
+                ),
+                limit=None,
+                with_scheduling=False,
+                with_media=True,
+                legacy_support=True,
+            )
+        return 1 if failures else 0
+    finally:
+        if csv_file is not None:
+            csv_file.close()
+        collection.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,25 +2,169 @@ import os
 import re
 import sys
 import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
-from typing import List
+from typing import Dict, Iterable, List, Optional, Tuple
 
 import yt_dlp as youtube_dl
+from yt_dlp.utils import DownloadCancelled
 
-from .models import GenerateVideoTask, YouTubeDownloadResult
+from .models import FormatPolicy, GenerateVideoTask, YouTubeDownloadResult
 from .subtitles_extractor import SubtitleRange, YouTubeSubtitlesExtractor
 from .errors import NoSubtitlesException
+from .download_cache import DownloadCache
+from .pipeline import DownloadWatermark
+from .utils import get_ffmpeg, parse_dimensions
 
 sys.stderr.isatty = lambda: False
 
 
+LINK_EXPRESSION = re.compile(
+    r"http(?:s?):\/\/(?:www\.)?youtu(?:be\.com\/watch\?v=|\.be\/)([\w\-\_]*)(&(amp;)?‌​[\w\?‌​=]*)?"
+)
+
+# Playlists, and the channels and their tabs, expanded to their videos in
+# batch mode.
+COLLECTION_EXPRESSION = re.compile(
+    r"https?://(?:www\.|m\.)?youtube\.com/"
+    r"(?:playlist\?(?:.*&)?list=|channel/|c/|user/|@)[\w\-.%]+"
+)
+# Links of a batch are separated by whitespace or commas.
+LINK_SEPARATOR_EXPRESSION = re.compile(r"[\s,]+")
+
+# Video information is fetched once per video and reused by every stage for
+# this many seconds. The stream URLs it holds expire after a few hours.
+VIDEO_INFO_TTL = 30 * 60
+# Only the videos used last are kept, a batch goes through many of them.
+VIDEO_INFO_CACHE_SIZE = 16
+
+_video_info_cache: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+_video_info_lock = threading.Lock()
+# One lock per video being fetched, so that concurrent stages wait for a
+# single fetch.
+_video_info_fetch_locks: Dict[str, threading.Lock] = {}
+
+
+class DownloadProgress:
+    """Combines the yt-dlp progress of concurrent downloads into one.
+
+    Every file being downloaded is tracked separately, and the callback gets
+    yt-dlp-like dictionaries with the progress over all of them. Once
+    `cancel` is called, the next progress update of any download aborts it.
+    """
+
+    def __init__(self, on_progress):
+        self.on_progress = on_progress
+        self.files: Dict[str, Tuple[float, float]] = {}
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def hook(self, d: dict):
+        if self.cancelled.is_set():
+            raise DownloadCancelled()
+
+        filename = d.get("filename", "")
+        total = d.get("total_bytes") or d.get("total_bytes_estimate") or 0
+        if d["status"] == "finished":
+            downloaded = total = d.get("total_bytes") or d.get("downloaded_bytes") or 1
+        else:
+            downloaded = d.get("downloaded_bytes") or 0
+
+        with self.lock:
+            self.files[filename] = (downloaded, total)
+            downloaded = sum(downloaded for downloaded, _ in self.files.values())
+            total = sum(total for _, total in self.files.values())
+
+        if self.on_progress and total:
+            self.on_progress(
+                {
+                    "status": "downloading",
+                    "downloaded_bytes": downloaded,
+                    "total_bytes": total,
+                    "_percent_str": f"{min(downloaded / total, 1) * 100:.1f}%",
+                }
+            )
+
+    def finish(self):
+        if self.on_progress:
+            self.on_progress({"status": "finished"})
+
+
 class YouTubeClient:
     @staticmethod
     def is_valid_link(link: str) -> bool:
-        exp = re.compile(
-            r"http(?:s?):\/\/(?:www\.)?youtu(?:be\.com\/watch\?v=|\.be\/)([\w\-\_]*)(&(amp;)?‌​[\w\?‌​=]*)?"
-        )
-        return bool(exp.match(link))
+        return bool(LINK_EXPRESSION.match(link))
+
+    @staticmethod
+    def get_video_id(link: str) -> Optional[str]:
+        match = LINK_EXPRESSION.match(link)
+        return match.group(1) if match else None
+
+    @staticmethod
+    def is_collection_link(link: str) -> bool:
+        return bool(COLLECTION_EXPRESSION.match(link))
+
+    @staticmethod
+    def split_links(text: str) -> List[str]:
+        return [link for link in LINK_SEPARATOR_EXPRESSION.split(text) if link]
+
+    @staticmethod
+    def expand_links(links: Iterable[str]) -> List[str]:
+        """Watch links of the videos, with playlists and channels expanded.
+
+        Videos found more than once are only kept the first time.
+        """
+        expanded: Dict[str, str] = {}
+        for link in links:
+            if YouTubeClient.is_collection_link(link):
+                videos = YouTubeClient.get_playlist_videos(link)
+            else:
+                videos = [link]
+            for video in videos:
+                expanded.setdefault(YouTubeClient.get_video_id(video) or video, video)
+        return list(expanded.values())
+
+    @staticmethod
+    def get_playlist_videos(link: str) -> List[str]:
+        """Watch links of the videos of a playlist or a channel.
+
+        The playlist is extracted flat: its entries are listed without
+        fetching the page of every video.
+        """
+        print(f"yt-to-anki: YouTubeClient: listing the videos of: {link}")
+        opts = {
+            "extract_flat": "in_playlist",
+            "skip_download": True,
+            "no_color": True,
+            "no_warnings": True,
+            "quiet": True,
+        }
+        ydl = youtube_dl.YoutubeDL(opts)
+        info = ydl.extract_info(link, download=False) or {}
+        return YouTubeClient._playlist_entries(ydl, info)
+
+    @staticmethod
+    def _playlist_entries(ydl: youtube_dl.YoutubeDL, info: dict) -> List[str]:
+        videos = []
+        for entry in info.get("entries") or []:
+            if not entry:
+                continue
+            if entry.get("_type") == "playlist":
+                videos.extend(YouTubeClient._playlist_entries(ydl, entry))
+            elif entry.get("ie_key") == "YoutubeTab" and entry.get("url"):
+                # The tabs of a channel (videos, shorts, live) are only
+                # listed when the channel page itself is extracted.
+                tab = ydl.extract_info(entry["url"], download=False) or {}
+                videos.extend(YouTubeClient._playlist_entries(ydl, tab))
+            elif entry.get("id"):
+                videos.append(f"https://www.youtube.com/watch?v={entry['id']}")
+        return videos
 
     @staticmethod
     def get_subtitle_langs(link: str, fallback: bool):
@@ -32,15 +176,7 @@ class YouTubeClient:
             }
             return {v: k for k, v in info.items()}
 
-        vid_opts = {
-            "skip_download": True,
-            "listsubtitles": True,
-            "no_color": True,
-            "no_warnings": True,
-            "quiet": True,
-        }
-        ydl = youtube_dl.YoutubeDL(vid_opts)
-        video_info = ydl.extract_info(link, download=False)
+        video_info = YouTubeClient.get_video_info(link)
         keys = list(video_info.keys())
 
         if not video_info or (
@@ -56,49 +192,211 @@ class YouTubeClient:
         else:
             return manual
 
+    @staticmethod
+    def get_video_info(link: str) -> dict:
+        """Metadata of the video, memoized per video ID for VIDEO_INFO_TTL."""
+        key = YouTubeClient.get_video_id(link) or link
+        with _video_info_lock:
+            fetch_lock = _video_info_fetch_locks.setdefault(key, threading.Lock())
+
+        try:
+            with fetch_lock:
+                with _video_info_lock:
+                    cached = _video_info_cache.get(key)
+                    if cached and time.monotonic() - cached[0] < VIDEO_INFO_TTL:
+                        _video_info_cache.move_to_end(key)
+                        return cached[1]
+
+                print(
+                    f"yt-to-anki: YouTubeClient: downloading video information: {link}"
+                )
+                vid_opts = {
+                    "skip_download": True,
+                    "no_color": True,
+                    "no_warnings": True,
+                    "quiet": True,
+                }
+                ydl = youtube_dl.YoutubeDL(vid_opts)
+                video_info = ydl.extract_info(link, download=False) or {}
+
+                with _video_info_lock:
+                    YouTubeClient._remember_video_info(key, video_info)
+                return video_info
+        finally:
+            with _video_info_lock:
+                if _video_info_fetch_locks.get(key) is fetch_lock:
+                    del _video_info_fetch_locks[key]
+
+    @staticmethod
+    def _remember_video_info(key: str, video_info: dict):
+        # Called with _video_info_lock held.
+        now = time.monotonic()
+        for expired in [
+            cached_key
+            for cached_key, (fetched, _) in _video_info_cache.items()
+            if now - fetched >= VIDEO_INFO_TTL
+        ]:
+            del _video_info_cache[expired]
+        _video_info_cache[key] = (now, video_info)
+        _video_info_cache.move_to_end(key)
+        while len(_video_info_cache) > VIDEO_INFO_CACHE_SIZE:
+            _video_info_cache.popitem(last=False)
+
+    @staticmethod
+    def _download_with_info(ydl: youtube_dl.YoutubeDL, video_info: dict):
+        # Same as YoutubeDL.download_with_info_file: the formats and caption
+        # tracks are selected again for the options of this downloader, but
+        # the video page is not fetched again.
+        ydl.process_ie_result(ydl.sanitize_info(video_info), download=True)
+
     @staticmethod
     def download_video_files(
-        video_task: GenerateVideoTask, on_progress
+        video_task: GenerateVideoTask,
+        on_progress,
+        on_subtitles_ready=None,
+        progress: Optional[DownloadProgress] = None,
     ) -> YouTubeDownloadResult:
+        """Downloads and parses the subtitles, and downloads the video.
+
+        In pipelined mode, `on_subtitles_ready` is called with the result and
+        a DownloadWatermark as soon as the subtitles are parsed, while the
+        video is still being downloaded. The result gets its video path once
+        the download is complete.
+
+        A `progress` given by the caller, who may cancel the download with
+        it, replaces `on_progress`.
+        """
         print(
             f"yt-to-anki: YouTubeClient: downloading video: "
             f"{video_task.youtube_video_url}"
         )
 
-        YouTubeClient._download_subtitles(video_task, on_progress)
-        title = YouTubeClient._download_video(video_task, on_progress)
+        cache = YouTubeClient.get_cache(video_task)
+        progress = progress or DownloadProgress(on_progress)
+        watermark = None
+        if video_task.pipelined:
+            video_info = YouTubeClient.get_video_info(video_task.youtube_video_url)
+            watermark = DownloadWatermark(video_info.get("duration"))
+        # The subtitles and the video are downloaded at the same time. When
+        # the subtitles cannot be found, the video download is aborted.
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            subtitles_download = executor.submit(
+                YouTubeClient._download_subtitles, video_task, progress.hook, cache
+            )
+            video_download = executor.submit(
+                YouTubeClient._download_video,
+                video_task,
+                progress.hook,
+                cache,
+                watermark,
+            )
+            try:
+                path_to_subtitles_file, automatic = subtitles_download.result()
+            except BaseException:
+                progress.cancel()
+                raise
 
-        print(f"yt-to-anki: YouTubeClient: downloaded video: {title}")
+            result = None
+            if watermark is not None and on_subtitles_ready is not None:
+                video_info = YouTubeClient.get_video_info(video_task.youtube_video_url)
+                result = YouTubeClient._create_result(
+                    video_task,
+                    video_info.get("title", "YouTube Video"),
+                    path_to_subtitles_file,
+                    "",
+                    automatic,
+                )
+                on_subtitles_ready(result, watermark)
 
-        path_to_video = glob(video_task.video_path + "/*")[0]
-        path_to_subtitles_file = glob(video_task.subtitle_path + "/*")[0]
+            title, path_to_video = video_download.result()
+        progress.finish()
+
+        print(f"yt-to-anki: YouTubeClient: downloaded video: {title}")
 
-        subs: List[SubtitleRange] = YouTubeSubtitlesExtractor.parse_subtitles(
-            path_to_subtitles_file
+        if result is not None:
+            result.video_path = path_to_video
+            return result
+        return YouTubeClient._create_result(
+            video_task, title, path_to_subtitles_file, path_to_video, automatic
         )
-        if video_task.optimize_by_punctuation:
-            subs = YouTubeSubtitlesExtractor.optimize_subtitles(subs)
 
-        result = YouTubeDownloadResult(
+    @staticmethod
+    def _create_result(
+        video_task: GenerateVideoTask,
+        title: str,
+        path_to_subtitles_file: str,
+        path_to_video: str,
+        automatic: bool = False,
+    ) -> YouTubeDownloadResult:
+        return YouTubeDownloadResult(
             f"{title} - {video_task.language}",
-            subs,
+            YouTubeSubtitlesExtractor.parse_for_task(
+                path_to_subtitles_file, video_task, automatic
+            ),
             path_to_video,
             path_to_subtitles_file,
+            YouTubeClient.get_video_id(video_task.youtube_video_url) or "",
+        )
+
+    @staticmethod
+    def get_cache(video_task: GenerateVideoTask) -> Optional[DownloadCache]:
+        if video_task.cache_size <= 0:
+            return None
+        return DownloadCache.shared(video_task.cache_path, video_task.cache_size)
+
+    @staticmethod
+    def get_cache_key(video_task: GenerateVideoTask, *parts: str) -> Optional[str]:
+        video_id = YouTubeClient.get_video_id(video_task.youtube_video_url)
+        return DownloadCache.key(video_id, *parts) if video_id else None
+
+    @staticmethod
+    def get_video_cache_key(video_task: GenerateVideoTask) -> Optional[str]:
+        return YouTubeClient.get_cache_key(
+            video_task, "video", YouTubeClient.get_video_format(video_task)
         )
-        return result
 
     @staticmethod
-    def _download_subtitles(video_task: GenerateVideoTask, on_progress):
+    def _download_subtitles(
+        video_task: GenerateVideoTask,
+        on_progress,
+        cache: Optional[DownloadCache] = None,
+    ) -> Tuple[str, bool]:
+        """Path to the subtitles, and whether they are automatic captions."""
+        cache_key = YouTubeClient.get_cache_key(
+            video_task,
+            "subtitles",
+            video_task.language,
+            str(video_task.fallback),
+        )
+        if cache and cache_key:
+            entry = cache.get(cache_key)
+            if entry:
+                print(f"yt-to-anki: YouTubeClient: using cached subtitles {entry.path}")
+                return entry.path, entry.metadata.get("automatic", False)
+
         if os.path.exists(video_task.subtitle_path):
             shutil.rmtree(video_task.subtitle_path)
 
         subtitle_output_file_template = os.path.join(
             video_task.subtitle_path, "%(title)s-%(id)s.%(ext)s"
         )
+        video_info = YouTubeClient.get_video_info(video_task.youtube_video_url)
+        has_manual_subtitles = video_task.language in (
+            video_info.get("subtitles") or {}
+        )
+        has_automatic_subtitles = video_task.language in (
+            video_info.get("automatic_captions") or {}
+        )
+        if not has_manual_subtitles and not (
+            video_task.fallback and has_automatic_subtitles
+        ):
+            raise NoSubtitlesException
+
         ydl_opts = {
             "subtitleslangs": [video_task.language],
             "skip_download": True,
             "writesubtitles": True,
+            "writeautomaticsub": not has_manual_subtitles,
             "outtmpl": subtitle_output_file_template,
             "subtitlesformat": "vtt",
             "quiet": True,
@@ -111,24 +409,81 @@ class YouTubeClient:
             f"{video_task.youtube_video_url} {ydl_opts}"
         )
         ydl = youtube_dl.YoutubeDL(ydl_opts)
-        ydl.download([video_task.youtube_video_url])
+        YouTubeClient._download_with_info(ydl, video_info)
 
         if not glob(video_task.subtitle_path + "/*"):
-            if video_task.fallback:
-                opts_no_lang = {**ydl_opts, "writeautomaticsub": True}
-                print(
-                    f"yt-to-anki: YouTubeClient: "
-                    f"downloading video subtitles in fallback mode with "
-                    f"automatic subtitles: "
-                    f"{video_task.youtube_video_url} {opts_no_lang}"
-                )
-                ydl = youtube_dl.YoutubeDL(opts_no_lang)
-                ydl.download([video_task.youtube_video_url])
-            else:
-                raise NoSubtitlesException
+            raise NoSubtitlesException
+
+        path_to_subtitles_file = glob(video_task.subtitle_path + "/*")[0]
+        automatic = not has_manual_subtitles
+        if cache and cache_key:
+            metadata = {"automatic": automatic}
+            path_to_subtitles_file = cache.put(
+                cache_key, path_to_subtitles_file, metadata
+            ).path
+        return path_to_subtitles_file, automatic
+
+    @staticmethod
+    def get_video_format(video_task: GenerateVideoTask) -> str:
+        """yt-dlp format selector for the media the cards actually need."""
+        if video_task.fields.picture_field is None:
+            return "bestaudio/best"
+
+        audio = "+bestaudio" if video_task.fields.audio_field is not None else ""
+        width, height = parse_dimensions(video_task.dimensions)
+        size = f"[width>={width}][height>={height}]"
+        if video_task.pipelined and audio:
+            # Streams merged after the download cannot be read while the video
+            # is downloading, only formats that contain both are usable.
+            if video_task.format_policy == FormatPolicy.BEST:
+                return "best"
+            return f"worst{size}/best"
+
+        if video_task.format_policy == FormatPolicy.BEST:
+            return f"bestvideo*{audio}/best"
+
+        # The smallest video-only stream at least as large as the pictures,
+        # so that the merged audio is the only audio track. Then the smallest
+        # format with both, or the best video if the source is smaller than
+        # the pictures.
+        return (
+            f"worstvideo[acodec=none]{size}{audio}/worst{size}/bestvideo*{audio}/best"
+        )
+
+    @staticmethod
+    def _download_video(
+        video_task: GenerateVideoTask,
+        on_progress,
+        cache: Optional[DownloadCache] = None,
+        watermark: Optional[DownloadWatermark] = None,
+    ) -> Tuple[str, str]:
+        try:
+            title, path_to_video = YouTubeClient._download_video_file(
+                video_task, on_progress, cache, watermark
+            )
+        except BaseException as e:
+            if watermark is not None:
+                watermark.fail(e)
+            raise
+        if watermark is not None:
+            watermark.finish(path_to_video)
+        return title, path_to_video
 
     @staticmethod
-    def _download_video(video_task: GenerateVideoTask, on_progress):
+    def _download_video_file(
+        video_task: GenerateVideoTask,
+        on_progress,
+        cache: Optional[DownloadCache],
+        watermark: Optional[DownloadWatermark],
+    ) -> Tuple[str, str]:
+        video_format = YouTubeClient.get_video_format(video_task)
+        cache_key = YouTubeClient.get_video_cache_key(video_task)
+        if cache and cache_key:
+            entry = cache.get(cache_key)
+            if entry:
+                print(f"yt-to-anki: YouTubeClient: using cached video {entry.path}")
+                return entry.metadata["title"], entry.path
+
         if os.path.exists(video_task.video_path):
             shutil.rmtree(video_task.video_path)
 
@@ -151,21 +506,31 @@ class YouTubeClient:
             # https://github.com/kamui-fin/yt-to-anki/issues/1
             # https://github.com/ytdl-org/youtube-dl/issues/28914
             "no_warnings": True,
+            "format": video_format,
             "outtmpl": video_output_file_template,
             "quiet": True,
             "progress_hooks": [on_progress],
         }
+        if watermark is not None:
+            # Write straight to the final file, so that it can be read while
+            # it is being downloaded.
+            vid_opts["nopart"] = True
+            vid_opts["progress_hooks"].append(watermark.update)
+        if os.name == "nt":
+            # Separate video and audio streams are merged with the bundled
+            # ffmpeg, which is not on the PATH.
+            vid_opts["ffmpeg_location"] = get_ffmpeg()
         print(
             f"yt-to-anki: YouTubeClient: "
             f"downloading video with options: "
             f"{video_task.youtube_video_url} {vid_opts}"
         )
+        video_info = YouTubeClient.get_video_info(video_task.youtube_video_url)
         ydl = youtube_dl.YoutubeDL(vid_opts)
-        ydl.download([video_task.youtube_video_url])
+        YouTubeClient._download_with_info(ydl, video_info)
+        title = video_info.get("title", "YouTube Video")
 
-        print(
-            f"yt-to-anki: YouTubeClient: "
-            f"downloading video information: {video_task.youtube_video_url}"
-        )
-        video_info = ydl.extract_info(video_task.youtube_video_url, download=False)
-        return video_info["title"] if video_info else "YouTube Video"
+        path_to_video = glob(video_task.video_path + "/*")[0]
+        if cache and cache_key:
+            path_to_video = cache.put(cache_key, path_to_video, {"title": title}).path
+        return title, path_to_video
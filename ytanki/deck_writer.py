@@ -0,0 +1,100 @@
+import os
+from typing import List, Optional, Sequence
+
+from anki.collection import Collection
+from anki.errors import NotFoundError
+from anki.notes import Note, NoteId
+
+from .manifest import GenerationManifest
+from .models import FieldsConfiguration, SubtitleRow
+
+
+class DeckWriter:
+    """Adds the generated cards to a deck, one batch of notes at a time.
+
+    The deck and the note type are looked up once. All the batches of a
+    task are merged into a single undo entry. With a manifest, ranges that
+    already have a note update it instead of adding a new one.
+    """
+
+    undo_name = "Generate cards from YouTube"
+
+    def __init__(
+        self,
+        collection: Collection,
+        title: str,
+        fields: FieldsConfiguration,
+        manifest: Optional[GenerationManifest] = None,
+    ):
+        self.collection = collection
+        self.fields = fields
+        self.manifest = manifest
+        deck_id = collection.decks.id(title)
+        assert deck_id
+        self.deck_id = deck_id
+        notetype = collection.models.by_name(fields.note_type)
+        assert notetype
+        self.notetype = notetype
+        self.undo_entry: Optional[int] = None
+
+    def add_media(self, path: Optional[str]) -> str:
+        # Cards whose media could not be extracted are not handed over.
+        assert path is not None
+        # Media names are derived from the content (see Ffmpeg.media_path), so
+        # a file with the same name is the same clip.
+        name = os.path.basename(path)
+        if self.collection.media.have(name):
+            return name
+        return self.collection.media.add_file(path)
+
+    def create_note(self, subtitle_range: SubtitleRow) -> Note:
+        note = self.collection.new_note(self.notetype)
+        self.fill_note(note, subtitle_range)
+        return note
+
+    def fill_note(self, note: Note, subtitle_range: SubtitleRow):
+        note[self.fields.text_field] = subtitle_range.text
+
+        # Audio
+        if self.fields.audio_field is not None:
+            audiofname = self.add_media(subtitle_range.audio_path)
+            note[self.fields.audio_field] = "[sound:%s]" % audiofname
+
+        # Picture
+        if self.fields.picture_field is not None:
+            picfname = self.add_media(subtitle_range.picture_path)
+            note[self.fields.picture_field] = '<img src="%s">' % picfname
+
+    def existing_note(self, subtitle_range: SubtitleRow) -> Optional[Note]:
+        if self.manifest is None:
+            return None
+        note_id = self.manifest.note_id(subtitle_range)
+        if note_id is None:
+            return None
+        try:
+            return self.collection.get_note(NoteId(note_id))
+        except NotFoundError:
+            # The note was deleted since, generate it again.
+            return None
+
+    def add_cards(self, subtitle_ranges: Sequence[SubtitleRow]) -> List[Note]:
+        if self.undo_entry is None:
+            self.undo_entry = self.collection.add_custom_undo_entry(self.undo_name)
+
+        notes = []
+        for subtitle_range in subtitle_ranges:
+            note = self.existing_note(subtitle_range)
+            if note is None:
+                note = self.create_note(subtitle_range)
+                self.collection.add_note(note, self.deck_id)
+            else:
+                self.fill_note(note, subtitle_range)
+                self.collection.update_note(note)
+            if self.manifest is not None:
+                self.manifest.record(subtitle_range, note.id)
+            notes.append(note)
+
+        self.collection.merge_undo_entries(self.undo_entry)
+        if self.manifest is not None:
+            self.manifest.save()
+        return notes
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+
+# One instance per cache directory, since its lock guards the index file.
+_caches: Dict[str, "DownloadCache"] = {}
+_caches_lock = threading.Lock()
+
+
+@dataclass
+class CacheEntry:
+    path: str
+    metadata: Dict
+
+
+class DownloadCache:
+    """On-disk cache of downloaded videos and subtitles.
+
+    Every entry holds one file, stored under a directory named after the
+    YouTube video ID and a hash of the rest of the key (format, language...).
+    The index keeps the size and modification time of every file, and when
+    it was last used. An entry whose file changed size or modification time
+    since it was stored is dropped instead of reused. The least recently
+    used entries are evicted once the cache grows over `max_size` bytes,
+    except the pinned ones, which a job is about to read.
+
+    The threads using a cache directory must share its instance, see
+    `shared`.
+    """
+
+    index_name = "index.json"
+
+    def __init__(self, path: str, max_size: int):
+        self.path = path
+        self.max_size = max_size
+        self.index_path = os.path.join(path, self.index_name)
+        self.lock = threading.Lock()
+        # How many jobs pinned every key.
+        self.pinned: Dict[str, int] = {}
+
+    @staticmethod
+    def shared(path: str, max_size: int) -> "DownloadCache":
+        """The instance of the cache directory, created on first use."""
+        with _caches_lock:
+            cache = _caches.get(os.path.abspath(path))
+            if cache is None:
+                cache = _caches[os.path.abspath(path)] = DownloadCache(path, max_size)
+            cache.max_size = max_size
+            return cache
+
+    def pin(self, key: str):
+        """Keeps the entry from being evicted until it is unpinned.
+
+        The key does not need to be in the cache yet.
+        """
+        with self.lock:
+            self.pinned[key] = self.pinned.get(key, 0) + 1
+
+    def unpin(self, key: str):
+        with self.lock:
+            count = self.pinned.pop(key, 0) - 1
+            if count > 0:
+                self.pinned[key] = count
+
+    @staticmethod
+    def key(video_id: str, *parts: str) -> str:
+        digest = hashlib.sha1("\0".join(parts).encode()).hexdigest()[:16]
+        return f"{video_id}-{digest}"
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self.lock:
+            index = self._read_index()
+            record = index.get(key)
+            if record is None:
+                return None
+
+            path = os.path.join(self.path, key, record["file"])
+            if not self._is_intact(path, record):
+                print(f"yt-to-anki: DownloadCache: dropping corrupted entry {key}")
+                self._remove(index, key)
+                self._write_index(index)
+                return None
+
+            record["last_used"] = time.time()
+            self._write_index(index)
+            return CacheEntry(path, record["metadata"])
+
+    def put(self, key: str, file_path: str, metadata: Dict) -> CacheEntry:
+        """Moves the file into the cache and returns its new location."""
+        with self.lock:
+            index = self._read_index()
+            self._remove(index, key)
+
+            entry_dir = os.path.join(self.path, key)
+            os.makedirs(entry_dir)
+            file_name = os.path.basename(file_path)
+            path = os.path.join(entry_dir, file_name)
+            shutil.move(file_path, path)
+
+            index[key] = {
+                "file": file_name,
+                "size": os.path.getsize(path),
+                "mtime_ns": os.stat(path).st_mtime_ns,
+                "last_used": time.time(),
+                "metadata": metadata,
+            }
+            self._evict(index, keep=key)
+            self._write_index(index)
+            return CacheEntry(path, metadata)
+
+    def _evict(self, index: Dict, keep: str):
+        total_size = sum(record["size"] for record in index.values())
+        by_last_use = sorted(index, key=lambda key: index[key]["last_used"])
+        for key in by_last_use:
+            if total_size <= self.max_size:
+                break
+            if key == keep or key in self.pinned:
+                continue
+            total_size -= index[key]["size"]
+            self._remove(index, key)
+
+    def _remove(self, index: Dict, key: str):
+        index.pop(key, None)
+        shutil.rmtree(os.path.join(self.path, key), ignore_errors=True)
+
+    def _is_intact(self, path: str, record: Dict) -> bool:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return stat.st_size == record["size"] and stat.st_mtime_ns == record.get(
+            "mtime_ns"
+        )
+
+    def _read_index(self) -> Dict:
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self, index: Dict):
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
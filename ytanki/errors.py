@@ -1,2 +1,10 @@
 class NoSubtitlesException(Exception):
     """Manually created subtitles were not found, and fallback is switched off"""
+
+
+class FfmpegException(Exception):
+    """ffmpeg exited with an error or did not produce the expected media files"""
+
+
+class SourceException(Exception):
+    """The video or the subtitles of a local source cannot be used"""
@@ -1,91 +1,294 @@
 from pathlib import Path
-import subprocess
+import bisect
+import hashlib
+import re
+import shutil
 import tempfile
 import os
+from typing import Callable, List, Optional
 
-from .utils import get_ffmpeg
+from . import ffmpeg_runner
+from .errors import FfmpegException
+from .ffmpeg_runner import FfmpegRun
+from .models import MediaInfo
+from .utils import format_timestamp, get_ffmpeg, get_seconds, get_timestamp
 
 
 class Ffmpeg:
-    def __init__(self, subtitle, video_path, video_title):
-        self.time_diff = (subtitle.time_end - subtitle.time_start).total_seconds()
-        media_path_prefix = Path(tempfile.gettempdir()).joinpath(
-            f"{video_title}_\
-                  {str(subtitle.time_start).replace('.','_').replace(':','_')}_\
-                  {str(self.time_diff).replace('.','_').replace(':','_')}",
+    # Files for the audio codecs that can be copied into a clip as is.
+    AUDIO_EXTENSIONS = {"aac": ".m4a", "opus": ".opus", "mp3": ".mp3"}
+
+    def __init__(
+        self,
+        subtitle,
+        video_path,
+        video_title,
+        video_id="",
+        dimensions="",
+        audio_codec: Optional[str] = None,
+    ):
+        # The codec of the source audio when it is copied instead of being
+        # encoded to MP3.
+        self.audio_codec = audio_codec
+        # An audio-only copy of the video to cut the clips from.
+        self.audio_source: Optional[str] = None
+        self.time_diff = get_seconds(subtitle.time_end - subtitle.time_start)
+        # The media files are named after everything that determines their
+        # content, so a clip that is already in the collection can be reused.
+        source = video_id or video_title
+        start = format_timestamp(subtitle.time_start)
+        end = format_timestamp(subtitle.time_end)
+        audio_suffix = self.AUDIO_EXTENSIONS[audio_codec] if audio_codec else ".mp3"
+        # A copied MP3 stream and an encoded MP3 clip are different files.
+        audio_encoding = f"copy:{audio_codec}" if audio_codec else "encode:mp3"
+        self.audio_path = self.media_path(
+            audio_suffix, source, start, end, audio_encoding
         )
-        self.audio_path = str(media_path_prefix.with_suffix(".mp3"))
-        self.picture_path = str(media_path_prefix.with_suffix(".jpeg"))
+        self.picture_path = self.media_path(".jpeg", source, start, dimensions)
         self.video_path = video_path
         self.subtitle = subtitle
         self.ffmpeg = get_ffmpeg()
 
-    def get_picture(self, dimensions):
-        picture_command = (
-            self.ffmpeg
-            + " -y "
-            + " -ss "
-            + str(self.subtitle.time_start.time())
-            + " -i "
-            + '"'
-            + self.video_path
-            + '" '
-            + "-s "
-            + dimensions
-            + " -vframes 1 -q:v 2 "
-            + "-loglevel quiet "
-            + '"'
-            + self.picture_path
-            + '"'
+    @staticmethod
+    def media_path(suffix: str, *key: str) -> str:
+        digest = hashlib.sha1("\0".join(key + (suffix,)).encode()).hexdigest()
+        return str(Path(tempfile.gettempdir()) / f"yt-to-anki_{digest[:20]}{suffix}")
+
+    def picture_command(self, dimensions: str) -> List[str]:
+        return [
+            self.ffmpeg,
+            "-y",
+            "-loglevel",
+            "error",
+            "-ss",
+            format_timestamp(self.subtitle.time_start),
+            "-i",
+            self.video_path,
+            "-s",
+            dimensions,
+            "-vframes",
+            "1",
+            "-q:v",
+            "2",
+            self.picture_path,
+        ]
+
+    def get_picture(self, dimensions) -> FfmpegRun:
+        return ffmpeg_runner.run(self.picture_command(dimensions), [self.picture_path])
+
+    def audio_command(self) -> List[str]:
+        # -ss before -i seeks in the input. Every audio packet can be decoded
+        # on its own, so the clip starts at the exact sample when it is
+        # encoded, and at the packet containing the start (about 20 ms long
+        # for AAC and Opus) when the stream is copied.
+        command = [
+            self.ffmpeg,
+            "-y",
+            "-loglevel",
+            "error",
+            "-ss",
+            format_timestamp(self.subtitle.time_start),
+            "-i",
+            self.audio_source or self.video_path,
+            "-t",
+            f"{self.time_diff:.3f}",
+            "-map",
+            "0:a:0",
+        ]
+        if self.audio_codec is not None:
+            command += ["-c:a", "copy"]
+        return command + [self.audio_path]
+
+    def get_audio(self) -> FfmpegRun:
+        return ffmpeg_runner.run(self.audio_command(), [self.audio_path])
+
+    @staticmethod
+    def parse_audio_codec(ffmpeg_output: str) -> Optional[str]:
+        """Codec of the first audio stream listed by `ffmpeg -i`."""
+        match = re.search(r"Stream #\d+:\d+.*?: Audio: (\w+)", ffmpeg_output)
+        return match.group(1) if match else None
+
+    @staticmethod
+    def parse_media_info(ffmpeg_output: str) -> MediaInfo:
+        duration = re.search(r"Duration: (\d+:\d{2}:\d{2}\.\d+)", ffmpeg_output)
+        # Cover art is listed as a video stream too.
+        video = re.search(
+            r"Stream #\d+:\d+.*?: Video: (?!.*\(attached pic\))", ffmpeg_output
         )
-        if os.name == "nt":
-            extra_opts = {"creationflags": subprocess.CREATE_NO_WINDOW}
-        else:
-            extra_opts = {}
-
-        subprocess.run(
-            picture_command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            shell=True,
-            **extra_opts,
+        return MediaInfo(
+            get_timestamp(duration.group(1)) if duration else None,
+            Ffmpeg.parse_audio_codec(ffmpeg_output),
+            video is not None,
         )
 
-    def get_audio(self):
-        audio_command = (
-            self.ffmpeg
-            + " -y "
-            + " -ss "
-            + str(self.subtitle.time_start.time())
-            + " -i "
-            + '"'
-            + self.video_path
-            + '"'
-            + " -t 00:"
-            + str(self.time_diff)
-            + " -loglevel quiet"
-            + ' "'
-            + self.audio_path
-            + '"'
+    @staticmethod
+    def probe(video_path: str) -> MediaInfo:
+        # Only ffmpeg is shipped on Windows, not ffprobe. Without an output
+        # file ffmpeg exits with an error after describing the input.
+        result = ffmpeg_runner.run(
+            [get_ffmpeg(), "-hide_banner", "-i", video_path],
+            keep_stderr=True,
+            check=False,
         )
-        if os.name == "nt":
-            extra_opts = {"creationflags": subprocess.CREATE_NO_WINDOW}
-        else:
-            extra_opts = {}
-
-        subprocess.run(
-            audio_command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            shell=True,
-            **extra_opts,
+        return Ffmpeg.parse_media_info(result.stderr)
+
+    @staticmethod
+    def probe_audio_codec(video_path: str) -> Optional[str]:
+        return Ffmpeg.probe(video_path).audio_codec
+
+    @staticmethod
+    def demux_audio(
+        video_path: str, should_stop: Callable[[], bool] = lambda: False
+    ) -> str:
+        """Copies the audio stream of the video to an audio-only file."""
+        # Matroska can hold any audio codec.
+        audio_path = Ffmpeg.media_path(
+            ".mka", video_path, str(os.path.getsize(video_path))
         )
+        command = [
+            get_ffmpeg(),
+            "-y",
+            "-loglevel",
+            "error",
+            "-i",
+            video_path,
+            "-map",
+            "0:a:0",
+            "-c:a",
+            "copy",
+            audio_path,
+        ]
+        ffmpeg_runner.run(command, [audio_path], should_stop=should_stop)
+        return audio_path
 
     # mutates object, bad practice?
     def fill_sub_media(self):
         self.subtitle.add_paths_to_picture_and_audio(self.picture_path, self.audio_path)
 
-    def generate_media(self, dimensions):
-        self.get_picture(dimensions)
-        self.get_audio()
+    def generate_media(self, dimensions, audio=True, picture=True) -> List[FfmpegRun]:
+        runs = []
+        if picture:
+            runs.append(self.get_picture(dimensions))
+        if audio:
+            runs.append(self.get_audio())
         self.fill_sub_media()
+        return runs
+
+
+class FfmpegBatch:
+    """Extracts the media of many subtitle ranges in a single ffmpeg process.
+
+    The source is opened and decoded once for all clips of a kind. The ranges
+    are processed in chunks of `max_outputs` to keep the command line within
+    the limits of the OS, each chunk seeking straight to its first range.
+    The running ffmpeg process is killed once `should_stop` returns True.
+    """
+
+    max_outputs = 100
+
+    def __init__(self, jobs: List[Ffmpeg]):
+        self.jobs = sorted(jobs, key=lambda job: job.subtitle.time_start)
+        self.ffmpeg = get_ffmpeg()
+
+    def chunks(self) -> List[List[Ffmpeg]]:
+        return [
+            self.jobs[i : i + self.max_outputs]
+            for i in range(0, len(self.jobs), self.max_outputs)
+        ]
+
+    def input_options(
+        self, chunk: List[Ffmpeg], loglevel="error", source: Optional[str] = None
+    ) -> List[str]:
+        return [
+            self.ffmpeg,
+            "-y",
+            "-loglevel",
+            loglevel,
+            "-ss",
+            f"{get_seconds(chunk[0].subtitle.time_start):.3f}",
+            "-i",
+            source or chunk[0].video_path,
+        ]
+
+    @staticmethod
+    def relative_starts(chunk: List[Ffmpeg]) -> List[float]:
+        offset = get_seconds(chunk[0].subtitle.time_start)
+        return [get_seconds(job.subtitle.time_start) - offset for job in chunk]
+
+    def audio_command(self, chunk: List[Ffmpeg]) -> List[str]:
+        # Every clip is a separate output of the same invocation.
+        command = self.input_options(chunk, source=chunk[0].audio_source)
+        for job, start in zip(chunk, self.relative_starts(chunk)):
+            command += [
+                "-map",
+                "0:a:0",
+                "-ss",
+                f"{start:.3f}",
+                "-t",
+                f"{job.time_diff:.3f}",
+            ]
+            if job.audio_codec is not None:
+                command += ["-c:a", "copy"]
+            command.append(job.audio_path)
+        return command
+
+    def picture_command(
+        self, chunk: List[Ffmpeg], dimensions: str, output_pattern: str
+    ) -> List[str]:
+        # Select the first frame at or after every requested timestamp. A
+        # frame already selected for an earlier timestamp is not selected
+        # again, so the frame times printed by showinfo are needed to map the
+        # written frames back to the subtitle ranges.
+        conditions = ["isnan(prev_selected_t)"] + [
+            f"gte(t,{start:.3f})*lt(prev_selected_t,{start:.3f})"
+            for start in self.relative_starts(chunk)[1:]
+        ]
+        return self.input_options(chunk, loglevel="info") + [
+            "-map",
+            "0:v:0",
+            "-vf",
+            f"select='{'+'.join(conditions)}',showinfo,scale={dimensions}",
+            "-fps_mode",
+            "passthrough",
+            "-q:v",
+            "2",
+            output_pattern,
+        ]
+
+    def get_audio(
+        self, should_stop: Callable[[], bool] = lambda: False
+    ) -> List[FfmpegRun]:
+        return [
+            ffmpeg_runner.run(
+                self.audio_command(chunk),
+                [job.audio_path for job in chunk],
+                should_stop=should_stop,
+            )
+            for chunk in self.chunks()
+        ]
+
+    def get_pictures(
+        self, dimensions: str, should_stop: Callable[[], bool] = lambda: False
+    ) -> List[FfmpegRun]:
+        runs = []
+        for chunk in self.chunks():
+            with tempfile.TemporaryDirectory() as frames_dir:
+                output_pattern = os.path.join(frames_dir, "%05d.jpeg")
+                result = ffmpeg_runner.run(
+                    self.picture_command(chunk, dimensions, output_pattern),
+                    keep_stderr=True,
+                    should_stop=should_stop,
+                )
+                runs.append(result)
+                frame_times = [
+                    float(time)
+                    for time in re.findall(r"pts_time:\s*([\d.]+)", result.stderr)
+                ]
+                for job, start in zip(chunk, self.relative_starts(chunk)):
+                    frame = bisect.bisect_left(frame_times, start - 0.0005)
+                    if frame == len(frame_times):
+                        raise FfmpegException(
+                            f"ffmpeg did not produce {job.picture_path}"
+                        )
+                    shutil.copyfile(output_pattern % (frame + 1), job.picture_path)
+        return runs
@@ -0,0 +1,83 @@
+import os
+import subprocess
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence
+
+from .errors import FfmpegException
+
+
+@dataclass
+class FfmpegRun:
+    command: List[str]
+    returncode: int
+    # Wall-clock seconds spent in the ffmpeg process.
+    duration: float
+    # Only kept when asked for, or when the run failed, empty otherwise.
+    stderr: str = ""
+
+
+def run(
+    command: List[str],
+    outputs: Sequence[str] = (),
+    keep_stderr: bool = False,
+    check: bool = True,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> FfmpegRun:
+    """Runs an ffmpeg command given as a list of arguments, without a shell.
+
+    With `check`, a nonzero exit code or a missing output file raises an
+    FfmpegException with the exit code and the error output of ffmpeg. With
+    `should_stop`, ffmpeg is killed as soon as it returns True, and the run
+    raises InterruptedError.
+    """
+    if os.name == "nt":
+        extra_opts = {"creationflags": subprocess.CREATE_NO_WINDOW}
+    else:
+        extra_opts = {}
+
+    if should_stop is not None and should_stop():
+        raise InterruptedError("ffmpeg was stopped")
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        **extra_opts,
+    )
+    try:
+        stderr = wait(process, should_stop)
+    except InterruptedError:
+        # Partly written outputs must not pass for complete ones.
+        for path in outputs:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    result = FfmpegRun(command, process.returncode, time.perf_counter() - start)
+    failed = check and process.returncode != 0
+    if keep_stderr or failed:
+        result.stderr = stderr.decode(errors="replace")
+
+    if failed:
+        raise FfmpegException(
+            f"ffmpeg exited with code {process.returncode}: {result.stderr.strip()}"
+        )
+    if check:
+        missing = [path for path in outputs if not os.path.exists(path)]
+        if missing:
+            raise FfmpegException(f"ffmpeg did not produce {missing[0]}")
+    return result
+
+
+def wait(process: subprocess.Popen, should_stop: Optional[Callable[[], bool]]) -> bytes:
+    """The error output of the process, once it exited or was killed."""
+    if should_stop is None:
+        return process.communicate()[1]
+    while True:
+        try:
+            return process.communicate(timeout=0.1)[1]
+        except subprocess.TimeoutExpired:
+            if should_stop():
+                process.kill()
+                process.communicate()
+                raise InterruptedError("ffmpeg was stopped")
@@ -1,16 +1,21 @@
 from pathlib import Path
+from typing import List, Optional
 
 from PyQt6 import QtCore, QtWidgets
 from aqt import mw
-from aqt.utils import showCritical
+from aqt.utils import askUser, showCritical
 
 
 from . import worker
+from .batch import JobQueue
 from .models import FieldsConfiguration, GenerateVideoTask
 from .utils import get_addon_directory, has_ffmpeg, bool_to_string, string_to_bool
 from .client_youtube import YouTubeClient
 from .gui import Ui_MainWindow
 
+# Choice in the audio and picture field boxes for cards without that media.
+NO_FIELD = "(None)"
+
 
 class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
     def __init__(self):
@@ -22,6 +27,8 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             settings_path, QtCore.QSettings.Format.IniFormat
         )
         self.list_langs_thread = None
+        # Shared by the batches, which all save it to the same file.
+        self.batch_queue = JobQueue()
 
     def setup_ui(self):
         notes = self.get_note_types()
@@ -37,13 +44,14 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         self.read_settings()
 
     def update_langs(self, _):
-        link, is_fallback = self.link_input.text(), self.fallback_checkbox.isChecked()
-        if YouTubeClient.is_valid_link(link):
+        links = YouTubeClient.split_links(self.link_input.text())
+        is_fallback = self.fallback_checkbox.isChecked()
+        if self.are_valid_links(links):
             self.generate_button.setEnabled(False)
             if self.list_langs_thread:
                 self.list_langs_thread.quit()
 
-            self.list_langs_thread = worker.ListSubtitleLanguages(link, is_fallback)
+            self.list_langs_thread = worker.ListSubtitleLanguages(links, is_fallback)
             self.list_langs_thread.done.connect(self._update_langs)
             self.list_langs_thread.start()
 
@@ -57,10 +65,10 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         fields = self.get_fields_for_note(note_type)
 
         self.audio_field.clear()
-        self.audio_field.addItems(fields)
+        self.audio_field.addItems(fields + [NO_FIELD])
 
         self.picture_field.clear()
-        self.picture_field.addItems(fields)
+        self.picture_field.addItems(fields + [NO_FIELD])
 
         self.text_field.clear()
         self.text_field.addItems(fields)
@@ -76,8 +84,8 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         return fields
 
     def generate(self):
-        youtube_video_url = self.link_input.text()
-        if not YouTubeClient.is_valid_link(youtube_video_url):
+        links = YouTubeClient.split_links(self.link_input.text())
+        if not self.are_valid_links(links):
             self.error("Invalid youtube link")
             return
         if not self.language_field.currentText():
@@ -87,11 +95,16 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         language = self.langs[self.language_field.currentText()]
         note_type = self.note_type_field.currentText()
         text_field = self.text_field.currentText()
-        audio_field = self.audio_field.currentText()
-        picture_field = self.picture_field.currentText()
-
-        if len(set([text_field, audio_field, picture_field])) != 3:
-            self.error("All 3 fields must be different")
+        audio_field = self.optional_field(self.audio_field.currentText())
+        picture_field = self.optional_field(self.picture_field.currentText())
+
+        used_fields = [
+            field
+            for field in (text_field, audio_field, picture_field)
+            if field is not None
+        ]
+        if len(set(used_fields)) != len(used_fields):
+            self.error("All fields must be different")
             return
 
         fallback = self.fallback_checkbox.isChecked()
@@ -109,17 +122,56 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             picture_field,
         )
         assert mw.col != None
-        task = GenerateVideoTask(
-            youtube_video_url,
-            language,
-            fallback,
-            optimize_by_punctuation,
-            dimensions,
-            limit,
-            mw.col,
-            fields,
+
+        def make_task(youtube_video_url: str) -> GenerateVideoTask:
+            return GenerateVideoTask(
+                youtube_video_url,
+                language,
+                fallback,
+                optimize_by_punctuation,
+                dimensions,
+                limit,
+                mw.col,
+                fields,
+            )
+
+        videos = self.list_langs_thread.links
+        if len(links) == 1 and YouTubeClient.is_valid_link(links[0]):
+            self.worker_ui = worker.create_deck(task=make_task(links[0]))
+        elif not videos:
+            self.error("No videos found in the playlist.")
+        else:
+            self.worker_ui = worker.create_batch(self.batch_queue, videos, make_task)
+
+    def offer_to_resume_batch(self):
+        """Asks whether the videos left by an interrupted batch are generated.
+
+        They are generated with the settings they were queued with, not the
+        ones of the window.
+        """
+        jobs = self.batch_queue.pending()
+        if not jobs:
+            return
+        if askUser(
+            f"{len(jobs)} videos of an earlier batch were not generated. "
+            "Generate them now?",
+            parent=self,
+        ):
+            self.worker_ui = worker.resume_batch(self.batch_queue)
+        else:
+            self.batch_queue.discard_pending()
+
+    @staticmethod
+    def are_valid_links(links: List[str]) -> bool:
+        """A single video, or any number of videos, playlists and channels."""
+        return bool(links) and all(
+            YouTubeClient.is_valid_link(link) or YouTubeClient.is_collection_link(link)
+            for link in links
         )
-        self.worker_ui = worker.create_deck(task=task)
+
+    @staticmethod
+    def optional_field(field: str) -> Optional[str]:
+        return None if field == NO_FIELD else field
 
     def read_settings(self):
         self.settings.beginGroup("MainWindow")
@@ -170,3 +222,4 @@ def launch():
         showCritical("Linux or Mac users must install ffmpeg to PATH.")
     else:
         screen.show()
+        screen.offer_to_resume_batch()
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, Optional, Set
+
+from anki.collection import Collection
+from anki.utils import ids2str
+
+from .models import GenerateVideoTask, SubtitleRow
+from .utils import format_timestamp
+
+
+def existing_note_ids(collection: Collection, note_ids: Iterable[int]) -> Set[int]:
+    """The notes among `note_ids` that are still in the collection."""
+    return set(
+        collection.db.list(f"select id from notes where id in {ids2str(note_ids)}")
+    )
+
+
+class GenerationManifest:
+    """Remembers which subtitle ranges of a video already produced notes.
+
+    There is one manifest per video, language, note type and way of merging
+    the ranges. Ranges are identified by their start time, and a fingerprint
+    of everything that ends up in the note tells whether an existing note has
+    to be updated.
+    """
+
+    def __init__(self, path: str, task: GenerateVideoTask):
+        self.path = path
+        self.task = task
+        self.entries: Dict[str, Dict] = {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def for_task(task: GenerateVideoTask, video_id: str) -> "GenerationManifest":
+        # Merged ranges start at other times, and are different notes.
+        merge = ""
+        if task.optimize_by_punctuation:
+            merge = f"{task.optimization_strategy.value}{task.sentence_bounds}"
+        key = "\0".join([video_id, task.language, task.fields.note_type, merge])
+        digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+        return GenerationManifest(
+            os.path.join(task.manifest_path, f"{video_id}-{digest}.json"), task
+        )
+
+    @staticmethod
+    def range_key(subtitle: SubtitleRow) -> str:
+        return format_timestamp(subtitle.time_start)
+
+    def fingerprint(self, subtitle: SubtitleRow) -> str:
+        fields = self.task.fields
+        parts = [
+            format_timestamp(subtitle.time_end),
+            subtitle.text,
+            fields.text_field,
+            str(fields.audio_field),
+            str(fields.picture_field),
+            self.task.dimensions if fields.picture_field is not None else "",
+            self.task.audio_mode.value if fields.audio_field is not None else "",
+        ]
+        return hashlib.sha1("\0".join(parts).encode()).hexdigest()
+
+    def is_unchanged(self, subtitle: SubtitleRow) -> bool:
+        entry = self.entries.get(self.range_key(subtitle))
+        return entry is not None and entry["fingerprint"] == self.fingerprint(subtitle)
+
+    def note_id(self, subtitle: SubtitleRow) -> Optional[int]:
+        entry = self.entries.get(self.range_key(subtitle))
+        return entry["note_id"] if entry else None
+
+    def forget_deleted_notes(self, collection: Collection):
+        """Forgets the ranges whose note was deleted or undone since.
+
+        Their notes are generated again, instead of being skipped as unchanged.
+        """
+        existing = existing_note_ids(
+            collection, [entry["note_id"] for entry in self.entries.values()]
+        )
+        self.entries = {
+            key: entry
+            for key, entry in self.entries.items()
+            if entry["note_id"] in existing
+        }
+
+    def record(self, subtitle: SubtitleRow, note_id: int):
+        self.entries[self.range_key(subtitle)] = {
+            "note_id": note_id,
+            "fingerprint": self.fingerprint(subtitle),
+        }
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
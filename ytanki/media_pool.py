@@ -0,0 +1,54 @@
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Iterable, Iterator, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+def default_parallelism() -> int:
+    return os.cpu_count() or 1
+
+
+class MediaExtractionPool:
+    """Runs media extraction for many items concurrently.
+
+    The extraction itself is spent in ffmpeg subprocesses, so plain threads
+    are enough to keep all cores busy. Results are yielded in the same order
+    as the input, and at most a bounded number of items are in flight so
+    that cancellation stays responsive.
+    """
+
+    def __init__(self, parallelism: int):
+        self.parallelism = max(1, parallelism)
+        self.max_in_flight = self.parallelism * 2
+
+    def run(
+        self,
+        items: Iterable[T],
+        extract: Callable[[T], None],
+        should_stop: Callable[[], bool] = lambda: False,
+    ) -> Iterator[Tuple[T, Optional[BaseException]]]:
+        executor = ThreadPoolExecutor(
+            max_workers=self.parallelism, thread_name_prefix="yt-to-anki-media"
+        )
+        in_flight: Deque[Tuple[T, Future]] = deque()
+        pending = iter(items)
+        try:
+            while True:
+                while len(in_flight) < self.max_in_flight and not should_stop():
+                    try:
+                        item = next(pending)
+                    except StopIteration:
+                        break
+                    in_flight.append((item, executor.submit(extract, item)))
+
+                if not in_flight or should_stop():
+                    return
+
+                item, future = in_flight.popleft()
+                yield item, future.exception()
+        finally:
+            for _, future in in_flight:
+                future.cancel()
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -1,10 +1,12 @@
 import os
-import datetime
-from typing import Optional, List
-from dataclasses import dataclass
+from enum import Enum
+from typing import Dict, Optional, Protocol
+from dataclasses import dataclass, field
 
 from anki.collection import Collection
 
+from .media_pool import default_parallelism
+from .subtitle_store import SubtitleStore
 from .utils import get_addon_directory
 
 
@@ -12,8 +14,44 @@ from .utils import get_addon_directory
 class FieldsConfiguration:
     note_type: str
     text_field: str
-    audio_field: str
-    picture_field: str
+    # None when the cards should not get the corresponding media.
+    audio_field: Optional[str]
+    picture_field: Optional[str]
+
+
+class FormatPolicy(str, Enum):
+    # Whatever yt-dlp considers the best quality.
+    BEST = "best"
+    # The smallest rendition at least as large as the card pictures.
+    SMALLEST = "smallest"
+
+
+class AudioMode(str, Enum):
+    # Encode every clip to MP3 from the video.
+    MP3 = "mp3"
+    # Copy the clips out of the AAC, Opus or MP3 stream of the video, without
+    # encoding them. Other codecs are still encoded to MP3.
+    COPY = "copy"
+    # Copy the audio stream out of the video once, and encode the MP3 clips
+    # from this smaller file.
+    DEMUXED = "demuxed"
+
+
+class OptimizationStrategy(str, Enum):
+    # Merge the ranges until one ends with "." or "?".
+    PUNCTUATION = "punctuation"
+    # Split at the end of sentences of any script, within SentenceBounds.
+    SENTENCES = "sentences"
+
+
+@dataclass
+class SentenceBounds:
+    # A sentence shorter than this is merged with the next one.
+    min_duration: int = 1500
+    min_characters: int = 10
+    # A range is ended before it grows longer than this, even mid-sentence.
+    max_duration: int = 12000
+    max_characters: int = 160
 
 
 @dataclass
@@ -28,13 +66,44 @@ class GenerateVideoTask:
     fields: FieldsConfiguration
     video_path: str = os.path.join(get_addon_directory(), "vid")
     subtitle_path: str = os.path.join(get_addon_directory(), "subs")
+    # How many subtitle ranges have their media extracted at the same time.
+    parallelism: int = default_parallelism()
+    # Cut every audio clip in one ffmpeg pass over the video instead of
+    # running ffmpeg once per subtitle.
+    single_pass_audio: bool = False
+    # Grab every screenshot in one ffmpeg pass over the video.
+    batch_pictures: bool = False
+    format_policy: FormatPolicy = FormatPolicy.SMALLEST
+    # Start generating the cards from the subtitles while the video is still
+    # being downloaded.
+    pipelined: bool = False
+    # Downloads are kept between runs, up to this many bytes (0 disables it).
+    cache_path: str = os.path.join(get_addon_directory(), "cache")
+    cache_size: int = 2 * 1024**3
+    # Only generate the ranges that are new or changed since the last run
+    # with the same video, language, note type and merging of the ranges.
+    incremental: bool = False
+    manifest_path: str = os.path.join(get_addon_directory(), "manifests")
+    # How the ranges are merged when optimize_by_punctuation is set.
+    optimization_strategy: OptimizationStrategy = OptimizationStrategy.PUNCTUATION
+    sentence_bounds: SentenceBounds = field(default_factory=SentenceBounds)
+    # Extend the clips to the silence around them, looking this many
+    # milliseconds past the subtitle timings.
+    refine_boundaries: bool = False
+    boundary_search: int = 750
+    audio_mode: AudioMode = AudioMode.MP3
+    # Keep the download, the parsed subtitles and the cards already added,
+    # so that a stopped run resumes where it stopped.
+    resumable: bool = True
+    checkpoint_path: str = os.path.join(get_addon_directory(), "checkpoints")
 
 
 @dataclass
 class SubtitleRange:
     text: str
-    time_start: datetime.datetime
-    time_end: datetime.datetime
+    # Milliseconds from the start of the video.
+    time_start: int
+    time_end: int
     # Injected later when the picture and audio are produced.
     picture_path: Optional[str] = None
     audio_path: Optional[str] = None
@@ -44,9 +113,82 @@ class SubtitleRange:
         self.audio_path = path_to_audio
 
 
+class SubtitleRow(Protocol):
+    """A SubtitleRange, or a row of a SubtitleStore."""
+
+    @property
+    def text(self) -> str:
+        ...
+
+    @text.setter
+    def text(self, value: str):
+        ...
+
+    @property
+    def time_start(self) -> int:
+        ...
+
+    @time_start.setter
+    def time_start(self, value: int):
+        ...
+
+    @property
+    def time_end(self) -> int:
+        ...
+
+    @time_end.setter
+    def time_end(self, value: int):
+        ...
+
+    @property
+    def picture_path(self) -> Optional[str]:
+        ...
+
+    @property
+    def audio_path(self) -> Optional[str]:
+        ...
+
+    def add_paths_to_picture_and_audio(self, path_to_picture: str, path_to_audio: str):
+        ...
+
+
+class JobStatus(str, Enum):
+    PENDING = "pending"
+    DOWNLOADING = "downloading"
+    GENERATING = "generating"
+    DONE = "done"
+    FAILED = "failed"
+
+
+@dataclass
+class BatchJob:
+    """One video of a batch, as kept in the job queue."""
+
+    url: str
+    status: JobStatus = JobStatus.PENDING
+    # Why the job failed, shown to the user at the end of the batch.
+    error: str = ""
+    # The settings of the task the video was queued with (see
+    # batch.task_options), so that a resumed job is generated the same way.
+    options: Dict = field(default_factory=dict)
+
+
+@dataclass
+class MediaInfo:
+    """What `ffmpeg -i` tells about a media file."""
+
+    # Milliseconds, None when ffmpeg does not know it.
+    duration: Optional[int]
+    audio_codec: Optional[str]
+    has_video: bool
+
+
 @dataclass
 class YouTubeDownloadResult:
     video_title: str
-    subtitles: List[SubtitleRange]
+    subtitles: SubtitleStore
     video_path: str
     subtitle_path: str
+    video_id: str = ""
+    # Set when the source already probed the video.
+    audio_codec: Optional[str] = None
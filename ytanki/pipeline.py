@@ -0,0 +1,70 @@
+import threading
+from typing import Callable, Optional
+
+
+class DownloadWatermark:
+    """Tracks how much of a video that is still being downloaded is playable.
+
+    The video is downloaded as a single file written in place, so ffmpeg can
+    read it while yt-dlp appends to it. The playable duration is estimated
+    from the share of downloaded bytes, minus a safety margin for the
+    variable bitrate and the container overhead.
+    """
+
+    def __init__(self, duration: Optional[float], margin: float = 10.0):
+        self.duration = duration
+        self.margin = margin
+        self.path: Optional[str] = None
+        self.covered_seconds = 0.0
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self.condition = threading.Condition()
+
+    def update(self, d: dict):
+        """yt-dlp progress hook of the video download."""
+        if d["status"] != "downloading" or not self.duration:
+            return
+        total = d.get("total_bytes") or d.get("total_bytes_estimate")
+        if not total:
+            return
+
+        share = min(d.get("downloaded_bytes", 0) / total, 1)
+        with self.condition:
+            self.path = d.get("filename", self.path)
+            self.covered_seconds = self.duration * share - self.margin
+            self.condition.notify_all()
+
+    def finish(self, path: str):
+        with self.condition:
+            self.path = path
+            self.finished = True
+            self.condition.notify_all()
+
+    def fail(self, error: BaseException):
+        with self.condition:
+            self.error = error
+            self.condition.notify_all()
+
+    def wait_until_covered(
+        self, seconds: float, should_stop: Callable[[], bool] = lambda: False
+    ) -> Optional[str]:
+        """Path to read the first `seconds` of the video from.
+
+        Returns None if `should_stop` becomes true while waiting.
+        """
+        with self.condition:
+            while True:
+                if self.error is not None:
+                    raise self.error
+                if self.finished or (
+                    self.path is not None and self.covered_seconds >= seconds
+                ):
+                    return self.path
+                if should_stop():
+                    return None
+                self.condition.wait(timeout=0.5)
+
+    def wait_until_finished(
+        self, should_stop: Callable[[], bool] = lambda: False
+    ) -> Optional[str]:
+        return self.wait_until_covered(float("inf"), should_stop)
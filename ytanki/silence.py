@@ -0,0 +1,132 @@
+import mmap
+import os
+import tempfile
+from array import array
+from operator import mul
+from typing import Callable, Iterable, List, Tuple
+
+from . import ffmpeg_runner
+from .utils import get_ffmpeg
+
+
+class SilenceDetector:
+    """Finds the silences of a video from the energy of its audio.
+
+    The audio is decoded once by ffmpeg to a low-rate mono PCM file, which
+    is memory-mapped to compute the energy of every `frame_ms` frame. A
+    frame is silent when its energy is within `silence_margin` of the noise
+    floor, the 10th percentile of the energies.
+    """
+
+    sample_rate = 8000
+    frame_ms = 10
+    # Energy ratio (about +6 dB) above the noise floor still counted as silence.
+    silence_margin = 4.0
+    # Frames quieter than about -60 dBFS are always silent.
+    min_threshold = 32**2
+
+    def __init__(self, energies: array):
+        self.energies = energies
+        frame = self.sample_rate * self.frame_ms // 1000
+        if energies:
+            floor = sorted(energies)[len(energies) // 10]
+            self.threshold = max(
+                floor * self.silence_margin, self.min_threshold * frame
+            )
+        else:
+            self.threshold = 0.0
+
+    @staticmethod
+    def from_video(
+        video_path: str, should_stop: Callable[[], bool] = lambda: False
+    ) -> "SilenceDetector":
+        fd, pcm_path = tempfile.mkstemp(prefix="yt-to-anki_", suffix=".pcm")
+        os.close(fd)
+        try:
+            SilenceDetector.decode(video_path, pcm_path, should_stop)
+            return SilenceDetector(SilenceDetector.read_energies(pcm_path))
+        finally:
+            os.remove(pcm_path)
+
+    @staticmethod
+    def decode(
+        video_path: str,
+        pcm_path: str,
+        should_stop: Callable[[], bool] = lambda: False,
+    ):
+        command = [
+            get_ffmpeg(),
+            "-y",
+            "-loglevel",
+            "error",
+            "-i",
+            video_path,
+            "-vn",
+            "-ac",
+            "1",
+            "-ar",
+            str(SilenceDetector.sample_rate),
+            "-f",
+            "s16le",
+            pcm_path,
+        ]
+        ffmpeg_runner.run(command, [pcm_path], should_stop=should_stop)
+
+    @staticmethod
+    def read_energies(pcm_path: str) -> array:
+        """Sum of the squared samples of every frame of a s16le file."""
+        energies = array("d")
+        size = os.path.getsize(pcm_path)
+        if size < 2:
+            return energies
+
+        frame = SilenceDetector.sample_rate * SilenceDetector.frame_ms // 1000
+        with open(pcm_path, "rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as buffer:
+            with memoryview(buffer) as data, data[: size // 2 * 2].cast("h") as samples:
+                for start in range(0, len(samples), frame):
+                    window = samples[start : start + frame]
+                    energies.append(sum(map(mul, window, window)))
+                    window.release()
+        return energies
+
+    def is_silent(self, frame: int) -> bool:
+        return self.energies[frame] <= self.threshold
+
+    def refine(self, start: int, end: int, search: int) -> Tuple[int, int]:
+        """Extends the range (in milliseconds) to the silence around it.
+
+        A boundary that falls within speech is moved outwards to the closest
+        silent frame, looking up to `search` milliseconds away. Boundaries
+        that are already silent, or have no silence nearby, are kept.
+        """
+        if not self.energies:
+            return start, end
+
+        last = len(self.energies) - 1
+        steps = search // self.frame_ms
+        first_frame = min(start // self.frame_ms, last)
+        for frame in range(first_frame, max(first_frame - steps, -1), -1):
+            if self.is_silent(frame):
+                # The speech starts after the silent frame.
+                start = min(start, (frame + 1) * self.frame_ms)
+                break
+
+        last_frame = min(end // self.frame_ms, last)
+        for frame in range(last_frame, min(last_frame + steps, last) + 1):
+            if self.is_silent(frame):
+                end = max(end, frame * self.frame_ms)
+                break
+
+        return start, end
+
+    def refine_all(self, subtitles: Iterable, search: int) -> List:
+        """Refines the boundaries of the subtitle ranges in place."""
+        refined = []
+        for subtitle in subtitles:
+            subtitle.time_start, subtitle.time_end = self.refine(
+                subtitle.time_start, subtitle.time_end, search
+            )
+            refined.append(subtitle)
+        return refined
@@ -0,0 +1,116 @@
+import hashlib
+import os
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from .client_youtube import YouTubeClient
+from .errors import SourceException
+from .ffmpeg import Ffmpeg
+from .models import GenerateVideoTask, YouTubeDownloadResult
+from .subtitle_store import SubtitleStore
+from .subtitles_extractor import YouTubeSubtitlesExtractor
+
+
+class VideoSource(ABC):
+    """Where the video and the subtitles of a task come from."""
+
+    @abstractmethod
+    def fetch(
+        self, task: GenerateVideoTask, on_progress, on_subtitles_ready=None
+    ) -> YouTubeDownloadResult:
+        """The video and the parsed subtitles of the task.
+
+        Sources that download the video may call `on_subtitles_ready` before
+        the download is complete, like YouTubeClient.download_video_files.
+        """
+
+
+class YouTubeSource(VideoSource):
+    def fetch(
+        self, task: GenerateVideoTask, on_progress, on_subtitles_ready=None
+    ) -> YouTubeDownloadResult:
+        return YouTubeClient.download_video_files(
+            task, on_progress, on_subtitles_ready=on_subtitles_ready
+        )
+
+
+class LocalSource(VideoSource):
+    """A video and a WebVTT or SubRip file that are already on disk.
+
+    Nothing is downloaded. The video is probed once with ffmpeg for its
+    duration and streams, and the subtitles are parsed like downloaded ones.
+    Without a subtitle path, the subtitles are looked for next to the video,
+    as `<name>.<language>.vtt` or `<name>.srt` for instance.
+    """
+
+    SUBTITLE_EXTENSIONS = (".vtt", ".srt")
+
+    def __init__(
+        self,
+        video_path: str,
+        subtitle_path: Optional[str] = None,
+        automatic: bool = False,
+    ):
+        self.video_path = video_path
+        self.subtitle_path = subtitle_path
+        # Whether the subtitles are automatic captions downloaded from YouTube.
+        self.automatic = automatic
+
+    @staticmethod
+    def find_subtitles(video_path: str, language: str) -> Optional[str]:
+        stem = os.path.splitext(video_path)[0]
+        for name in (f"{stem}.{language}", stem):
+            for extension in LocalSource.SUBTITLE_EXTENSIONS:
+                if os.path.isfile(name + extension):
+                    return name + extension
+        return None
+
+    @staticmethod
+    def get_video_id(video_path: str) -> str:
+        """Identifies the file, in place of a YouTube video ID."""
+        stat = os.stat(video_path)
+        key = "\0".join(
+            [os.path.abspath(video_path), str(stat.st_size), str(stat.st_mtime_ns)]
+        )
+        return "local-" + hashlib.sha1(key.encode()).hexdigest()[:16]
+
+    def fetch(
+        self, task: GenerateVideoTask, on_progress=None, on_subtitles_ready=None
+    ) -> YouTubeDownloadResult:
+        if not os.path.isfile(self.video_path):
+            raise SourceException(f"{self.video_path} does not exist")
+        subtitle_path = self.subtitle_path or self.find_subtitles(
+            self.video_path, task.language
+        )
+        if subtitle_path is None or not os.path.isfile(subtitle_path):
+            raise SourceException(f"No subtitles found for {self.video_path}")
+
+        info = Ffmpeg.probe(self.video_path)
+        if task.fields.audio_field is not None and info.audio_codec is None:
+            raise SourceException(f"{self.video_path} has no audio")
+        if task.fields.picture_field is not None and not info.has_video:
+            raise SourceException(f"{self.video_path} has no video")
+
+        subtitles = YouTubeSubtitlesExtractor.parse_for_task(
+            subtitle_path, task, self.automatic
+        )
+        if info.duration is not None and subtitles:
+            # Subtitles made for a longer cut of the video have no media.
+            if max(subtitles.starts) >= info.duration:
+                subtitles = SubtitleStore.from_ranges(
+                    subtitle
+                    for subtitle in subtitles
+                    if subtitle.time_start < info.duration
+                )
+
+        if on_progress:
+            on_progress({"status": "finished"})
+        title = os.path.splitext(os.path.basename(self.video_path))[0]
+        return YouTubeDownloadResult(
+            f"{title} - {task.language}",
+            subtitles,
+            self.video_path,
+            subtitle_path,
+            self.get_video_id(self.video_path),
+            info.audio_codec,
+        )
@@ -0,0 +1,140 @@
+import sys
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Union, overload
+
+
+class SubtitleStore(Sequence["SubtitleView"]):
+    """Subtitle ranges of a video, stored column by column.
+
+    The times are kept in arrays of 64-bit integers and the texts are
+    interned, instead of one object per range. Indexing gives a SubtitleView,
+    which reads and writes the row in place, and slicing gives a new store.
+    """
+
+    __slots__ = ("starts", "ends", "texts", "picture_paths", "audio_paths")
+
+    def __init__(self):
+        self.starts = array("q")
+        self.ends = array("q")
+        self.texts: List[str] = []
+        # Injected later when the picture and audio are produced.
+        self.picture_paths: List[Optional[str]] = []
+        self.audio_paths: List[Optional[str]] = []
+
+    @staticmethod
+    def from_ranges(subtitles: Iterable) -> "SubtitleStore":
+        """Builds a store from SubtitleRange (or view) objects."""
+        store = SubtitleStore()
+        for subtitle in subtitles:
+            store.append(subtitle.text, subtitle.time_start, subtitle.time_end)
+        return store
+
+    def to_dict(self) -> Dict[str, list]:
+        """The times and texts, in a form that can be saved as JSON."""
+        return {
+            "starts": self.starts.tolist(),
+            "ends": self.ends.tolist(),
+            "texts": self.texts,
+        }
+
+    @staticmethod
+    def from_dict(columns: Dict[str, list]) -> "SubtitleStore":
+        store = SubtitleStore()
+        for text, time_start, time_end in zip(
+            columns["texts"], columns["starts"], columns["ends"]
+        ):
+            store.append(text, time_start, time_end)
+        return store
+
+    def append(self, text: str, time_start: int, time_end: int) -> "SubtitleView":
+        self.starts.append(time_start)
+        self.ends.append(time_end)
+        self.texts.append(sys.intern(text))
+        self.picture_paths.append(None)
+        self.audio_paths.append(None)
+        return SubtitleView(self, len(self.texts) - 1)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    @overload
+    def __getitem__(self, index: int) -> "SubtitleView":
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "SubtitleStore":
+        ...
+
+    def __getitem__(
+        self, index: Union[int, slice]
+    ) -> Union["SubtitleView", "SubtitleStore"]:
+        if isinstance(index, slice):
+            store = SubtitleStore()
+            store.starts = self.starts[index]
+            store.ends = self.ends[index]
+            store.texts = self.texts[index]
+            store.picture_paths = self.picture_paths[index]
+            store.audio_paths = self.audio_paths[index]
+            return store
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("subtitle index out of range")
+        return SubtitleView(self, index)
+
+    def __iter__(self) -> Iterator["SubtitleView"]:
+        for index in range(len(self)):
+            yield SubtitleView(self, index)
+
+
+class SubtitleView:
+    """A row of a SubtitleStore, with the attributes of a SubtitleRange."""
+
+    __slots__ = ("store", "index")
+
+    def __init__(self, store: SubtitleStore, index: int):
+        self.store = store
+        self.index = index
+
+    @property
+    def text(self) -> str:
+        return self.store.texts[self.index]
+
+    @text.setter
+    def text(self, value: str):
+        self.store.texts[self.index] = sys.intern(value)
+
+    @property
+    def time_start(self) -> int:
+        return self.store.starts[self.index]
+
+    @time_start.setter
+    def time_start(self, value: int):
+        self.store.starts[self.index] = value
+
+    @property
+    def time_end(self) -> int:
+        return self.store.ends[self.index]
+
+    @time_end.setter
+    def time_end(self, value: int):
+        self.store.ends[self.index] = value
+
+    @property
+    def picture_path(self) -> Optional[str]:
+        return self.store.picture_paths[self.index]
+
+    @property
+    def audio_path(self) -> Optional[str]:
+        return self.store.audio_paths[self.index]
+
+    def add_paths_to_picture_and_audio(self, path_to_picture: str, path_to_audio: str):
+        self.store.picture_paths[self.index] = path_to_picture
+        self.store.audio_paths[self.index] = path_to_audio
+
+    def __repr__(self) -> str:
+        return (
+            f"SubtitleView(text={self.text!r}, "
+            f"time_start={self.time_start}, time_end={self.time_end})"
+        )
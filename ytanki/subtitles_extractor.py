@@ -1,48 +1,199 @@
-from typing import List, Optional
-import webvtt
+import re
+import unicodedata
+from collections import deque
+from typing import Deque, Iterable, Iterator, List, Optional, Set, Tuple
+
+from webvtt import MalformedCaptionError, MalformedFileError
 
 from .utils import get_timestamp
 
-from .models import SubtitleRange
+from .models import (
+    GenerateVideoTask,
+    OptimizationStrategy,
+    SentenceBounds,
+    SubtitleRange,
+    SubtitleRow,
+)
+from .subtitle_store import SubtitleStore
+
+# Start and end in milliseconds, and the text lines without the cue tags.
+Cue = Tuple[int, int, List[str]]
 
 
 class YouTubeSubtitlesExtractor:
+    # WebVTT separates the milliseconds with a dot, SubRip with a comma.
+    TIMING_EXPRESSION = re.compile(
+        r"\s*((?:\d+:)?\d{2}:\d{2}[.,]\d{3})\s*-->\s*((?:\d+:)?\d{2}:\d{2}[.,]\d{3})"
+    )
+    CUE_TAG_EXPRESSION = re.compile("<.*?>")
+    # Duplicated captions are looked for among this many previous ranges.
+    duplicate_window = 32
+    # Cues of automatic captions closer than this (in milliseconds) are part
+    # of the same rolling window.
+    rolling_gap = 100
+    # Full stops, question and exclamation marks of the Latin, CJK, Arabic,
+    # Devanagari and Ethiopic scripts, which may be followed by closing
+    # quotes or brackets.
+    SENTENCE_END_EXPRESSION = re.compile(
+        "[.!?\u2026\u3002\uff01\uff1f\uff61\u061f\u06d4\u0964\u0965\u1362]"
+        "[\"'\u201d\u2019\u00bb\u300d\u300f)\uff09\\]]*$"
+    )
+
     @staticmethod
-    def parse_subtitles(filename) -> List[SubtitleRange]:
-        subtitles: List[SubtitleRange] = [
-            SubtitleRange(
-                text=caption.text.replace("\n", " ").strip(),
-                time_start=get_timestamp(caption.start),
-                time_end=get_timestamp(caption.end),
+    def parse_subtitles(filename, automatic: bool = False) -> SubtitleStore:
+        return SubtitleStore.from_ranges(
+            YouTubeSubtitlesExtractor.iter_subtitles(filename, automatic)
+        )
+
+    @staticmethod
+    def parse_for_task(
+        filename, task: GenerateVideoTask, automatic: bool = False
+    ) -> SubtitleStore:
+        """Parses the subtitles, merged into sentences as the task asks for."""
+        subtitles: Iterable[SubtitleRow] = YouTubeSubtitlesExtractor.iter_subtitles(
+            filename, automatic
+        )
+        if (
+            task.optimize_by_punctuation
+            and task.optimization_strategy == OptimizationStrategy.SENTENCES
+        ):
+            subtitles = YouTubeSubtitlesExtractor.iter_sentences(
+                subtitles, task.sentence_bounds
             )
-            for caption in webvtt.read(filename)
-        ]
-        without_duplicates = []
-        seen_subs = set()
-        for sub in subtitles:
-            if sub.text not in seen_subs:
-                without_duplicates.append(sub)
-                seen_subs.add(sub.text)
+        elif task.optimize_by_punctuation:
+            subtitles = YouTubeSubtitlesExtractor.iter_optimized_subtitles(subtitles)
+        return SubtitleStore.from_ranges(subtitles)
+
+    @staticmethod
+    def iter_subtitles(filename, automatic: bool = False) -> Iterator[SubtitleRange]:
+        """Reads the WebVTT or SubRip (.srt) file cue by cue.
+
+        `automatic` tells that the file holds YouTube's automatic captions,
+        which are normalized instead of only skipping duplicated captions.
+        """
+        cues = YouTubeSubtitlesExtractor._iter_cues(filename)
+        if automatic:
+            yield from YouTubeSubtitlesExtractor.iter_automatic_captions(cues)
+            return
+
+        recent_texts: Deque[str] = deque()
+        seen_texts: Set[str] = set()
+        for start, end, lines in cues:
+            text = " ".join(lines).strip()
+            if text in seen_texts:
+                continue
+            yield SubtitleRange(text=text, time_start=start, time_end=end)
 
-        return without_duplicates
+            recent_texts.append(text)
+            seen_texts.add(text)
+            if len(recent_texts) > YouTubeSubtitlesExtractor.duplicate_window:
+                seen_texts.discard(recent_texts.popleft())
 
     @staticmethod
-    def optimize_subtitles(subtitles: List[SubtitleRange]) -> List[SubtitleRange]:
-        assert isinstance(subtitles, list)
+    def iter_automatic_captions(cues: Iterable[Cue]) -> Iterator[SubtitleRange]:
+        """Turns the rolling cues of automatic captions into one range per line.
+
+        Each cue shows the line from the previous cue again above the line
+        being spoken, and a short cue in between shows the completed line on
+        its own. The lines a cue shares with the end of the cue right before
+        it are dropped, so every spoken line gives one range, and a phrase
+        said again later in the video is kept.
+        """
+        previous_lines: List[str] = []
+        previous_end: Optional[int] = None
+        for start, end, lines in cues:
+            lines = [line.strip() for line in lines if line.strip()]
+            carried = 0
+            if (
+                previous_end is not None
+                and start - previous_end <= YouTubeSubtitlesExtractor.rolling_gap
+            ):
+                carried = YouTubeSubtitlesExtractor._overlap(previous_lines, lines)
 
-        # Nothing to optimize.
-        if len(subtitles) < 2:
-            return subtitles
+            new_lines = lines[carried:]
+            if new_lines:
+                yield SubtitleRange(
+                    text=" ".join(new_lines), time_start=start, time_end=end
+                )
+            previous_lines, previous_end = lines, end
 
-        def merge(subtitle1: SubtitleRange, subtitle2: SubtitleRange):
-            if subtitle1 == subtitle2:
+    @staticmethod
+    def _overlap(previous_lines: List[str], lines: List[str]) -> int:
+        """Number of lines at the start of `lines` ending `previous_lines`."""
+        for count in range(min(len(previous_lines), len(lines)), 0, -1):
+            if previous_lines[-count:] == lines[:count]:
+                return count
+        return 0
+
+    @staticmethod
+    def _iter_cues(filename) -> Iterator[Cue]:
+        with open(filename, encoding="utf-8-sig") as f:
+            blocks = YouTubeSubtitlesExtractor._iter_blocks(f)
+            # SubRip files have no header, their cues have the same layout.
+            if not str(filename).lower().endswith(".srt"):
+                header = next(blocks, None)
+                if header is None or not header[0].startswith("WEBVTT"):
+                    raise MalformedFileError("The file does not have a valid format")
+
+            for block in blocks:
+                yield from YouTubeSubtitlesExtractor._parse_block(block)
+
+    @staticmethod
+    def _iter_blocks(lines: Iterable[str]) -> Iterator[List[str]]:
+        block: List[str] = []
+        for line in lines:
+            line = line.rstrip("\n\r")
+            if line:
+                # Blocks do not start with blank lines.
+                if block or line.strip():
+                    block.append(line)
+            elif block:
+                yield block
+                block = []
+        if block:
+            yield block
+
+    @staticmethod
+    def _parse_block(block: List[str]) -> Iterator[Cue]:
+        # The timing line comes first, or after the cue identifier.
+        if not any("-->" in line for line in block[:2]):
+            if block[0].startswith(("NOTE", "STYLE")):
                 return
+            raise MalformedCaptionError(f"Missing timing cue in {block[0]!r}")
+
+        timing: Optional[re.Match] = None
+        lines: List[str] = []
+        for index, line in enumerate(block):
+            if "-->" in line:
+                if timing is not None:
+                    # The next cue was not separated by a blank line.
+                    yield from YouTubeSubtitlesExtractor._parse_block(block[index:])
+                    break
+                timing = YouTubeSubtitlesExtractor.TIMING_EXPRESSION.match(line)
+                if timing is None:
+                    raise MalformedCaptionError(f"Invalid time format in {line!r}")
+            elif index > 0:
+                lines.append(YouTubeSubtitlesExtractor.CUE_TAG_EXPRESSION.sub("", line))
 
+        yield get_timestamp(timing.group(1)), get_timestamp(timing.group(2)), lines
+
+    @staticmethod
+    def optimize_subtitles(subtitles: Iterable[SubtitleRow]) -> SubtitleStore:
+        return SubtitleStore.from_ranges(
+            YouTubeSubtitlesExtractor.iter_optimized_subtitles(subtitles)
+        )
+
+    @staticmethod
+    def iter_optimized_subtitles(
+        subtitles: Iterable[SubtitleRow],
+    ) -> Iterator[SubtitleRow]:
+        """Merges the ranges into sentences, yielding each one once complete."""
+
+        def merge(subtitle1: SubtitleRow, subtitle2: SubtitleRow):
             subtitle1.time_end = subtitle2.time_end
             subtitle1.text += " " + subtitle2.text
 
-        optimized_subtitles: List[SubtitleRange] = []
-        current_subtitle: Optional[SubtitleRange] = None
+        current_subtitle: Optional[SubtitleRow] = None
         for subtitle in subtitles:
             # Trim subtitle just in case. This mutates the objects but
             # is ok like this for now.
@@ -50,16 +201,76 @@ class YouTubeSubtitlesExtractor:
 
             if current_subtitle is None:
                 current_subtitle = subtitle
-                optimized_subtitles.append(current_subtitle)
+            else:
+                merge(current_subtitle, subtitle)
 
             if (
                 subtitle.text.endswith(".")
                 or subtitle.text.endswith("?")
                 or subtitle.text.endswith('?"')
             ):
-                merge(current_subtitle, subtitle)
+                yield current_subtitle
                 current_subtitle = None
+
+        if current_subtitle is not None:
+            yield current_subtitle
+
+    @staticmethod
+    def iter_sentences(
+        subtitles: Iterable[SubtitleRow], bounds: SentenceBounds
+    ) -> Iterator[SubtitleRange]:
+        """Merges the ranges into sentences that fit within `bounds`.
+
+        The input ranges are left untouched, new ranges are yielded.
+        """
+        texts: List[str] = []
+        characters = 0
+        start = end = 0
+
+        def sentence() -> SubtitleRange:
+            text = texts[0]
+            for part in texts[1:]:
+                text += YouTubeSubtitlesExtractor._separator(text, part) + part
+            return SubtitleRange(text=text, time_start=start, time_end=end)
+
+        for subtitle in subtitles:
+            text = subtitle.text.strip()
+            if not text:
+                continue
+
+            if texts and (
+                subtitle.time_end - start > bounds.max_duration
+                or characters + 1 + len(text) > bounds.max_characters
+            ):
+                yield sentence()
+                texts = []
+
+            if not texts:
+                start, characters = subtitle.time_start, 0
             else:
-                merge(current_subtitle, subtitle)
+                characters += 1
+            texts.append(text)
+            characters += len(text)
+            end = subtitle.time_end
 
-        return optimized_subtitles
+            if (
+                YouTubeSubtitlesExtractor.SENTENCE_END_EXPRESSION.search(text)
+                and end - start >= bounds.min_duration
+                and characters >= bounds.min_characters
+            ):
+                yield sentence()
+                texts = []
+
+        if texts:
+            yield sentence()
+
+    @staticmethod
+    def _separator(text: str, next_text: str) -> str:
+        # Scripts written without spaces (Chinese, Japanese) are joined as is.
+        wide = ("W", "F")
+        if (
+            unicodedata.east_asian_width(text[-1]) in wide
+            and unicodedata.east_asian_width(next_text[0]) in wide
+        ):
+            return ""
+        return " "
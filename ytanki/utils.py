@@ -1,10 +1,11 @@
 import os
-import datetime
+import itertools
+from collections.abc import Sequence
 from subprocess import check_output, CalledProcessError
 import platform
 import subprocess
 from pathlib import Path
-from typing import List
+from typing import Iterable, Tuple
 
 
 home = os.path.dirname(os.path.abspath(__file__))
@@ -49,14 +50,38 @@ def string_to_bool(string_value: str):
     return string_value == "true"
 
 
-def get_timestamp(time: str) -> datetime.datetime:
-    return datetime.datetime.strptime(time, "%H:%M:%S.%f")
+def get_timestamp(time: str) -> int:
+    """Milliseconds of a WebVTT (01:02:03.450, 02:03.450) or SRT (01:02:03,450)
+    timestamp."""
+    clock, _, fraction = time.strip().replace(",", ".").partition(".")
+    milliseconds = 0
+    for part in clock.split(":"):
+        milliseconds = milliseconds * 60 + int(part)
+    return milliseconds * 1000 + int(fraction.ljust(3, "0")[:3])
 
 
-def with_limit(array: List, limit: int) -> List:
+def format_timestamp(milliseconds: int) -> str:
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
+
+
+def get_seconds(milliseconds: int) -> float:
+    return milliseconds / 1000
+
+
+def parse_dimensions(dimensions: str) -> Tuple[int, int]:
+    width, height = dimensions.lower().split("x")
+    return int(width), int(height)
+
+
+def with_limit(array: Iterable, limit: int) -> Iterable:
     if limit == 0:
         return array
-    return array[:limit]
+    if isinstance(array, Sequence):
+        return array[:limit]
+    return itertools.islice(array, limit)
 
 
 def get_addon_directory() -> str:
@@ -1,32 +1,41 @@
 import re
 import time
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional
 
 from PyQt6.QtCore import Qt
 from aqt import QObject, mw
-from anki.notes import Note
 from aqt.utils import showCritical, showInfo
 from PyQt6 import QtCore, QtWidgets
 
 
-from .errors import NoSubtitlesException
-from .client_youtube import SubtitleRange, YouTubeClient, YouTubeDownloadResult
-from .models import FieldsConfiguration, GenerateVideoTask
-from .utils import with_limit
-from .ffmpeg import Ffmpeg
+from .errors import NoSubtitlesException, SourceException
+from .client_youtube import YouTubeClient, YouTubeDownloadResult
+from .models import BatchJob, GenerateVideoTask, JobStatus, SubtitleRow
+from .batch import BatchRunner, JobQueue
+from .card_generator import CardGenerator
+from .checkpoint import GenerationCheckpoint
+from .deck_writer import DeckWriter
+from .manifest import GenerationManifest
+from .pipeline import DownloadWatermark
+from .sources import VideoSource, YouTubeSource
+from .subtitle_store import SubtitleView
 
 
 class ListSubtitleLanguages(QtCore.QThread):
     done = QtCore.pyqtSignal(bool)
 
-    def __init__(self, link: str, fallback: bool):
+    def __init__(self, links: List[str], fallback: bool):
         super().__init__()
-        self.link = link
+        self.links = links
         self.fallback = fallback
         self.langs = {}
 
     def run(self):
-        self.langs = YouTubeClient.get_subtitle_langs(self.link, self.fallback)
+        # Playlists and channels are expanded to their videos, and the
+        # languages are the ones of the first video.
+        self.links = YouTubeClient.expand_links(self.links)
+        if self.links:
+            self.langs = YouTubeClient.get_subtitle_langs(self.links[0], self.fallback)
         self.done.emit(True)
 
 
@@ -58,9 +67,12 @@ class DownloadYouTubeVideoBar(ProgressBarDialog):
     def __init__(self):
         super().__init__("Downloading...", "Downloading video and subtitles...")
 
-    def setup_ui(self, task: GenerateVideoTask):
-        self.download_thread = DownloadYouTubeVideoThread(task=task)
+    def setup_ui(self, task: GenerateVideoTask, source: VideoSource):
+        self.download_thread = DownloadYouTubeVideoThread(task=task, source=source)
         self.download_thread.on_progress.connect(self.on_youtube_progress)
+        self.download_thread.subtitles_ready.connect(
+            lambda: self.start_generating(task)
+        )
         self.download_thread.done.connect(lambda: self.finish_up(task))
         self.download_thread.is_error.connect(self.show_error)
         self.download_thread.start()
@@ -79,32 +91,63 @@ class DownloadYouTubeVideoBar(ProgressBarDialog):
         msg = self.download_thread.error_message
         showCritical(msg)
 
+    def start_generating(self, task):
+        youtube_download_result = self.download_thread.sources
+        if youtube_download_result is not None and not hasattr(self, "gen_bar"):
+            self.gen_bar = GenerateCardsBar()
+            self.gen_bar.setup_ui(
+                task,
+                youtube_download_result,
+                self.download_thread.watermark,
+                self.download_thread.checkpoint,
+            )
+
     def finish_up(self, task):
         self.download_thread.quit()
         self.download_thread.wait()
         self.close()
-        youtube_download_result = self.download_thread.sources
-        if youtube_download_result is not None:
-            self.gen_bar = GenerateCardsBar()
-            self.gen_bar.setup_ui(task, youtube_download_result)
+        self.start_generating(task)
 
 
 class DownloadYouTubeVideoThread(QtCore.QThread):
     done = QtCore.pyqtSignal(bool)
     is_error = QtCore.pyqtSignal(bool)
     on_progress = QtCore.pyqtSignal(dict)
+    subtitles_ready = QtCore.pyqtSignal(bool)
 
-    def __init__(self, task: GenerateVideoTask):
+    def __init__(self, task: GenerateVideoTask, source: VideoSource):
         super().__init__()
         self.task: GenerateVideoTask = task
+        self.source = source
         self.error_message: str = ""
         self.sources: Optional[YouTubeDownloadResult] = None
+        self.watermark: Optional[DownloadWatermark] = None
+        self.checkpoint = get_checkpoint(task)
+
+    def on_subtitles_ready(
+        self, result: YouTubeDownloadResult, watermark: DownloadWatermark
+    ):
+        self.sources = result
+        self.watermark = watermark
+        self.subtitles_ready.emit(True)
 
     def run(self):
         try:
-            result: YouTubeDownloadResult = YouTubeClient.download_video_files(
-                self.task, lambda p: self.on_progress.emit(p)
-            )
+            checkpoint = self.checkpoint
+            result = checkpoint.load_result() if checkpoint else None
+            if result is not None:
+                print(
+                    f"yt-to-anki: DownloadYouTubeVideoThread: resuming "
+                    f"{result.video_title} from {checkpoint.path}"
+                )
+            else:
+                result = self.source.fetch(
+                    self.task,
+                    lambda p: self.on_progress.emit(p),
+                    on_subtitles_ready=self.on_subtitles_ready,
+                )
+                if checkpoint is not None:
+                    checkpoint.save_result(result)
             self.sources = result
             self.done.emit(True)
         except NoSubtitlesException:
@@ -112,6 +155,9 @@ class DownloadYouTubeVideoThread(QtCore.QThread):
             self.error_message = (
                 "Man-made subtitles could not be found. Consider enabling fallback."
             )
+        except SourceException as e:
+            self.is_error.emit(True)
+            self.error_message = str(e)
         except Exception as e:
             self.is_error.emit(True)
             self.error_message = f"An unexpected error has occured. {e}"
@@ -122,22 +168,46 @@ class GenerateCardsBar(ProgressBarDialog):
         super().__init__("Adding cards...", "Generating cards..")
 
     def setup_ui(
-        self, task: GenerateVideoTask, youtube_download_result: YouTubeDownloadResult
+        self,
+        task: GenerateVideoTask,
+        youtube_download_result: YouTubeDownloadResult,
+        watermark: Optional[DownloadWatermark] = None,
+        checkpoint: Optional[GenerationCheckpoint] = None,
     ):
+        manifest = None
+        if task.incremental:
+            manifest = GenerationManifest.for_task(
+                task, youtube_download_result.video_id
+            )
+            # Checked here, since the collection belongs to the GUI thread.
+            manifest.forget_deleted_notes(mw.col)
+        self.checkpoint = checkpoint
+        if checkpoint is not None:
+            checkpoint.forget_deleted_notes(mw.col)
         self.gen_thread = GenerateCardsThread(
             task=task,
             youtube_download_result=youtube_download_result,
+            watermark=watermark,
+            manifest=manifest,
+            checkpoint=self.checkpoint,
+        )
+        self.deck_writer = DeckWriter(
+            mw.col, youtube_download_result.video_title, task.fields, manifest
         )
         self.gen_thread.update_num.connect(self.update_progress)
-        self.gen_thread.add_to_deck_signal.connect(self.add_card)  # type: ignore
+        self.gen_thread.add_to_deck_signal.connect(self.add_cards)
         self.gen_thread.finished.connect(self.finish_up)
         self.gen_thread.finish_time.connect(self.show_time)
         self.gen_thread.start()
 
     def finish_up(self):
+        completed = not self.gen_thread.generator.stop_flag
         self.gen_thread.stop()
         self.gen_thread.quit()
         self.gen_thread.wait()
+        if completed and self.checkpoint is not None:
+            # The next run of this video starts over.
+            self.checkpoint.remove()
         self.close()
 
     def update_progress(self, val):
@@ -146,97 +216,152 @@ class GenerateCardsBar(ProgressBarDialog):
     def show_time(self, duration, total_cards):
         showInfo(f"Generated {total_cards} cards in {str(round(duration, 1))} seconds")
 
-    @QtCore.pyqtSlot(SubtitleRange, str, FieldsConfiguration)
-    def add_card(
-        self,
-        subtitle_range: SubtitleRange,
-        title: str,
-        fields: FieldsConfiguration,
-    ):
-        col = mw.col
-
-        deckId = mw.col.decks.id(title)
-        assert deckId
-
-        note_id = mw.col.models.id_for_name(fields.note_type)
-        new_note = mw.col.models.get(note_id)
-        new_note = col.new_note(new_note)
-
-        new_note[fields.text_field] = subtitle_range.text
-
-        # Audio
-        if fields.audio_field is not None:
-            audiofname = mw.col.media.add_file(subtitle_range.audio_path)
-            ankiaudiofname = "[sound:%s]" % audiofname
-            new_note[fields.audio_field] = ankiaudiofname
-
-        # Picture
-        # add file to media
-        if fields.picture_field is not None:
-            picfname = mw.col.media.add_file(subtitle_range.picture_path)
-            ankipicname = '<img src="%s">' % picfname
-            new_note[fields.picture_field] = ankipicname
-
-        col.add_note(new_note, deckId)
+    def add_cards(self, subtitle_ranges: List[SubtitleView]):
+        notes = self.deck_writer.add_cards(subtitle_ranges)
+        # The cards are rows of the store, recorded by their index.
+        if self.checkpoint is not None:
+            self.checkpoint.complete(subtitle_ranges, [note.id for note in notes])
 
 
 class GenerateCardsThread(QtCore.QThread):
     update_num = QtCore.pyqtSignal(int)
     finished = QtCore.pyqtSignal(bool)
     finish_time = QtCore.pyqtSignal(float, int)
-    add_to_deck_signal = QtCore.pyqtSignal(SubtitleRange, str, FieldsConfiguration)
+    # Generated cards are sent to the GUI thread to be added in batches.
+    add_to_deck_signal = QtCore.pyqtSignal(list)
 
     def __init__(
         self,
         task: GenerateVideoTask,
         youtube_download_result: YouTubeDownloadResult,
+        watermark: Optional[DownloadWatermark] = None,
+        manifest: Optional[GenerationManifest] = None,
+        checkpoint: Optional[GenerationCheckpoint] = None,
     ):
         super().__init__()
-        self.task: GenerateVideoTask = task
-        self.youtube_download_result: YouTubeDownloadResult = youtube_download_result
-        self.stop_flag = False
-        self.generated_cards_count = 0
+        self.generator = CardGenerator(
+            task, youtube_download_result, watermark, manifest, checkpoint
+        )
 
     def stop(self):
-        self.stop_flag = True
+        self.generator.stop()
 
     def run(self):
         timer_start = time.perf_counter()
-        subtitles: List[SubtitleRange] = with_limit(
-            self.youtube_download_result.subtitles, self.task.limit
+        generated_cards_count = self.generator.run(
+            self.update_num.emit, self.add_to_deck_signal.emit
+        )
+        timer_end = time.perf_counter()
+        finished_time = timer_end - timer_start
+
+        self.finished.emit(True)
+        self.finish_time.emit(finished_time, generated_cards_count)
+
+
+class GenerateBatchBar(ProgressBarDialog):
+    # Failed videos listed in the summary at the end of the batch.
+    max_failures_shown = 10
+
+    def __init__(self):
+        super().__init__("Adding cards...", "Generating cards of the batch..")
+
+    def setup_ui(self, queue: JobQueue, jobs: List[BatchJob]):
+        self.total_jobs = len(jobs)
+        self.finished_jobs: List[BatchJob] = []
+        self.deck_writers: Dict[str, DeckWriter] = {}
+        self.gen_thread = GenerateBatchThread(queue, jobs)
+        # Checked here, since the collection belongs to the GUI thread.
+        self.gen_thread.runner.forget_deleted_notes(jobs)
+        self.gen_thread.job_updated.connect(self.update_progress)
+        self.gen_thread.add_to_deck_signal.connect(self.add_cards)
+        self.gen_thread.finished.connect(self.finish_up)
+        self.gen_thread.start()
+
+    def update_progress(self, job: BatchJob):
+        if job.status in (JobStatus.DONE, JobStatus.FAILED):
+            self.finished_jobs.append(job)
+        self.label.setText(
+            f"Generating cards of the batch ({len(self.finished_jobs)}/"
+            f"{self.total_jobs})..."
         )
-        for subtitle in subtitles:
-            if self.stop_flag:
-                break
-
-            ffmpeg = Ffmpeg(
-                subtitle,
-                self.youtube_download_result.video_path,
-                self.youtube_download_result.video_title,
+        if self.total_jobs:
+            self.progress_bar.setValue(
+                int(len(self.finished_jobs) / self.total_jobs * 100)
             )
-            try:
-                ffmpeg.generate_media(self.task.dimensions)
-            except Exception as e:
-                continue
-
-            self.generated_cards_count += 1
-            percent = int((self.generated_cards_count / len(subtitles)) * 100)
-            self.update_num.emit(percent)
-
-            self.add_to_deck_signal.emit(
-                subtitle,
-                self.youtube_download_result.video_title,
-                self.task.fields,
+
+    def add_cards(
+        self,
+        task: GenerateVideoTask,
+        youtube_download_result: YouTubeDownloadResult,
+        manifest: Optional[GenerationManifest],
+        subtitle_ranges: List[SubtitleRow],
+    ):
+        title = youtube_download_result.video_title
+        if title not in self.deck_writers:
+            self.deck_writers[title] = DeckWriter(mw.col, title, task.fields, manifest)
+        self.deck_writers[title].add_cards(subtitle_ranges)
+
+    def finish_up(self):
+        self.gen_thread.stop()
+        self.gen_thread.quit()
+        self.gen_thread.wait()
+        self.close()
+
+        failed = [job for job in self.finished_jobs if job.status == JobStatus.FAILED]
+        summary = (
+            f"Generated the cards of {len(self.finished_jobs) - len(failed)} videos"
+        )
+        if failed:
+            summary += f", {len(failed)} failed:\n" + "\n".join(
+                f"{job.url}: {job.error}" for job in failed[: self.max_failures_shown]
             )
+        showInfo(summary)
 
-        timer_end = time.perf_counter()
-        finished_time = timer_end - timer_start
 
+class GenerateBatchThread(QtCore.QThread):
+    job_updated = QtCore.pyqtSignal(object)
+    finished = QtCore.pyqtSignal(bool)
+    # Generated cards are sent to the GUI thread to be added in batches.
+    add_to_deck_signal = QtCore.pyqtSignal(object, object, object, list)
+
+    def __init__(self, queue: JobQueue, jobs: List[BatchJob]):
+        super().__init__()
+        self.jobs = jobs
+        self.runner = BatchRunner(queue, mw.col, self.add_to_deck_signal.emit)
+
+    def stop(self):
+        self.runner.stop()
+
+    def run(self):
+        self.runner.run(self.jobs, self.job_updated.emit)
         self.finished.emit(True)
-        self.finish_time.emit(finished_time, self.generated_cards_count)
 
 
-def create_deck(task: GenerateVideoTask):
+def get_checkpoint(task: GenerateVideoTask) -> Optional[GenerationCheckpoint]:
+    video_id = YouTubeClient.get_video_id(task.youtube_video_url)
+    if not task.resumable or not video_id:
+        return None
+    return GenerationCheckpoint.for_task(task, video_id)
+
+
+def create_deck(task: GenerateVideoTask, source: Optional[VideoSource] = None):
     dl_bar = DownloadYouTubeVideoBar()
-    dl_bar.setup_ui(task=task)
+    dl_bar.setup_ui(task=task, source=source or YouTubeSource())
     return dl_bar
+
+
+def create_batch(
+    queue: JobQueue,
+    links: List[str],
+    make_task: Callable[[str], GenerateVideoTask],
+):
+    batch_bar = GenerateBatchBar()
+    batch_bar.setup_ui(queue, queue.add(links, make_task))
+    return batch_bar
+
+
+def resume_batch(queue: JobQueue):
+    """Generates the jobs left by earlier batches, with their own settings."""
+    batch_bar = GenerateBatchBar()
+    batch_bar.setup_ui(queue, queue.pending())
+    return batch_bar